@@ -0,0 +1,119 @@
+"""
+Per-request cost of converting Scrapy requests into the loopback requests sent to the server.
+
+Compares AiohttpMiddleware.process_request with the previous implementation, which built an
+AiohttpRequest, copied it again with a new URL and rewrote its meta and URL afterwards, for
+scrapy.Request with the "aiohttp" meta key and for AiohttpRequest. Reports the time, the
+request objects built and the peak memory allocated per converted request.
+
+    python benchmarks/bench_convert.py [--number 20000]
+"""
+import argparse
+import socket
+import timeit
+import tracemalloc
+from unittest.mock import patch
+
+from scrapy import Request
+
+from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+URL = "https://www.example.com/catalog/page/2?sort=price"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def legacy_process_request(middleware: AiohttpMiddleware, request: Request) -> AiohttpRequest | None:
+    """The implementation before single-copy conversion, kept as the baseline."""
+    if request.meta.get("_original_url"):
+        return
+    elif request.meta.get("aiohttp") is True:
+        if not isinstance(request, AiohttpRequest):
+            request = AiohttpRequest(
+                url=request.url,
+                callback=request.callback,
+                method=request.method,
+                headers=request.headers,
+                body=request.body,
+                cookies=request.cookies,
+                meta=request.meta,
+            )
+    if not isinstance(request, AiohttpRequest):
+        return
+    new_request = request.replace(url=middleware._convert_url("/request", request.url))
+    new_request.original_url = request.url
+    new_request.target_url = new_request.url.replace(request.url, '').rstrip('/')
+    new_request.headers.update(middleware._get_control_headers(new_request))
+    if middleware._get_download_slot is not None and "download_slot" not in new_request.meta:
+        new_request.meta["download_slot"] = middleware._get_download_slot(request)
+    return new_request
+
+
+def count_requests(convert, request) -> int:
+    """Count the request objects built by one conversion."""
+    built = []
+    init = Request.__init__
+
+    def counting_init(self, *args, **kwargs):
+        built.append(None)
+        init(self, *args, **kwargs)
+
+    with patch.object(Request, "__init__", counting_init):
+        convert(request)
+    return len(built)
+
+
+def get_peak_memory(convert, request, number: int) -> float:
+    """Get the mean peak memory allocated while converting a request, in bytes."""
+    tracemalloc.start()
+    total = 0
+    for _ in range(number):
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        convert(request)
+        _, peak = tracemalloc.get_traced_memory()
+        total += peak - start
+    tracemalloc.stop()
+    return total / number
+
+
+def bench(name: str, middleware: AiohttpMiddleware, request: Request, number: int):
+    converts = {
+        "legacy": lambda r: legacy_process_request(middleware, r),
+        "single copy": lambda r: middleware.process_request(r, None),
+    }
+    print(name)
+    for label, convert in converts.items():
+        convert(request)
+        per_request = timeit.timeit(lambda: convert(request), number=number) / number
+        print(f"  {label:<12} {per_request * 1e6:8.2f} us/request  "
+              f"{count_requests(convert, request)} requests built  "
+              f"{get_peak_memory(convert, request, number // 10 or 1):8.0f} bytes peak")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--number", type=int, default=20000, help="requests converted per measurement")
+    args = parser.parse_args()
+
+    middleware = AiohttpMiddleware(f"http://127.0.0.1:{free_port()}/", DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
+    try:
+        def callback(response, page):
+            pass
+
+        meta = {"aiohttp": True, "depth": 1, "download_timeout": 30}
+        bench("scrapy.Request with meta", middleware,
+              Request(URL, callback=callback, meta=meta, cb_kwargs={"page": 2}), args.number)
+        bench("AiohttpRequest", middleware,
+              AiohttpRequest(URL, callback=callback, meta=meta, cb_kwargs={"page": 2}), args.number)
+    finally:
+        middleware._force_stop_server()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Per-request cost of building the target request headers from AIOHTTP_REQUEST_HEADERS_CONFIG.
+
+Compares the compiled HeaderPlan with the previous implementation, which walked the whole
+configuration on every request, for the default configuration and for large ones.
+
+    python benchmarks/bench_headers.py [--number 20000]
+"""
+import argparse
+import timeit
+from typing import Callable
+from urllib.parse import urlparse
+
+from aiohttp.test_utils import make_mocked_request
+from multidict import CIMultiDict, CIMultiDictProxy
+
+from scrapy_aiohttp.utils import HeaderPlan
+
+URL = "https://www.example.com/catalog/page/2?sort=price"
+
+LEGACY_DEFAULT_CONFIG = {
+    "Host": lambda request: urlparse(request.match_info.get("url")).hostname,
+    "Content-Type": "text/html",
+    "User-Agent": None,
+}
+DEFAULT_CONFIG = {
+    "Host": lambda request, context: context.url.raw_host,
+    "Content-Type": "text/html",
+    "User-Agent": None,
+}
+
+
+def legacy_get_request_headers(request_headers_config, request) -> CIMultiDictProxy:
+    """The implementation before the header plan, kept as the baseline."""
+    request_headers = request.headers
+    saved_headers = []
+    for head, value in request_headers_config.items():
+        if head in request_headers:
+            if value is None:
+                values = request_headers.getall(head)
+                saved_headers.extend((head, val) for val in values)
+                continue
+
+        if value is None:
+            continue
+        elif isinstance(value, Callable):
+            saved_headers.append((head, value(request)))
+        elif isinstance(value, str):
+            saved_headers.append((head, value))
+        else:
+            raise TypeError(f'Value {type(value)} error for head: {head}')
+
+    return CIMultiDictProxy(CIMultiDict(saved_headers))
+
+
+def make_configs(static: int, inherited: int, callables: int) -> tuple[dict, dict]:
+    """Build the same configuration with URL parsing callables in the legacy and the plan style."""
+    legacy_config, config = {}, {}
+    for index in range(static):
+        legacy_config[f"X-Static-{index}"] = config[f"X-Static-{index}"] = f"value-{index}"
+    for index in range(inherited):
+        legacy_config[f"X-Inherited-{index}"] = config[f"X-Inherited-{index}"] = None
+    for index in range(callables):
+        legacy_config[f"X-Callable-{index}"] = LEGACY_DEFAULT_CONFIG["Host"]
+        config[f"X-Callable-{index}"] = DEFAULT_CONFIG["Host"]
+    return legacy_config, config
+
+
+def make_request(inherited: int):
+    headers = CIMultiDict({"User-Agent": "bench", "Accept": "*/*"})
+    for index in range(0, inherited, 2):
+        headers[f"X-Inherited-{index}"] = "inherited"
+    return make_mocked_request("GET", f"/request/{URL}", headers=headers, match_info={"url": URL})
+
+
+def bench(name: str, legacy_config: dict, config: dict, request, number: int):
+    plan = HeaderPlan(config)
+    results = {
+        "legacy": timeit.timeit(lambda: legacy_get_request_headers(legacy_config, request), number=number),
+        "plan": timeit.timeit(lambda: plan.build(request), number=number),
+    }
+    print(f"{name} ({len(config)} headers)")
+    for label, seconds in results.items():
+        per_request = seconds / number
+        print(f"  {label:<12} {per_request * 1e6:8.2f} us/request  {1 / per_request:>12,.0f} requests/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--number", type=int, default=20000, help="requests built per measurement")
+    args = parser.parse_args()
+
+    bench("default", LEGACY_DEFAULT_CONFIG, DEFAULT_CONFIG, make_request(0), args.number)
+    for static, inherited, callables in ((20, 10, 4), (100, 50, 10)):
+        bench("large", *make_configs(static, inherited, callables), make_request(inherited), args.number)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Load test of the server and of a full Scrapy crawl through AiohttpMiddleware, against a stand-in origin.
+
+The proxy scenario sends requests straight to an AiohttpServer, the crawl scenario runs a spider
+using AiohttpMiddleware in its own process. Each reports requests per second, p50/p95/p99 latency,
+and the CPU time and peak RSS of the server workers and of the crawler. Results are written as JSON
+and can be compared with the results of an earlier run, failing when a metric regressed.
+
+    python benchmarks/bench_load.py [--scenario proxy crawl] [--requests 5000] [--concurrency 64]
+                                    [--workers 1] [--latency 0.01] [--size 16384] [--compress]
+                                    [--error-rate 0.0] [--output results.json]
+                                    [--baseline previous.json] [--tolerance 0.1]
+
+Metrics are read from /proc, so CPU time and peak RSS of the server workers are only reported on Linux.
+"""
+import argparse
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import sys
+import time
+from importlib.metadata import version, PackageNotFoundError
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from origin import OriginConfig, start_origin, add_origin_arguments, get_origin_config
+
+SCENARIOS = ("proxy", "crawl")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_percentiles(latencies: list[float]) -> dict[str, float | None]:
+    latencies = sorted(latencies)
+    return {
+        f"p{percentile}": latencies[max(0, math.ceil(len(latencies) * percentile / 100) - 1)] if latencies else None
+        for percentile in (50, 95, 99)
+    }
+
+
+def get_process_usage(pids: list[int]) -> dict[str, float | int | None]:
+    """Get the CPU seconds and the sum of the peak RSS of running processes, from /proc."""
+    cpu_seconds = peak_rss = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as file:
+                # Fields after the command name, which may contain spaces; utime and stime are the 14th and 15th.
+                fields = file.read().rsplit(")", 1)[1].split()
+            cpu_seconds += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+            with open(f"/proc/{pid}/status") as file:
+                peak_rss += next(int(line.split()[1]) * 1024 for line in file if line.startswith("VmHWM:"))
+    except (OSError, StopIteration):
+        return {"cpu_seconds": None, "peak_rss_bytes": None}
+    return {"cpu_seconds": cpu_seconds, "peak_rss_bytes": peak_rss}
+
+
+def get_own_usage() -> dict[str, float | int]:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return {"cpu_seconds": usage.ru_utime + usage.ru_stime, "peak_rss_bytes": peak_rss}
+
+
+def make_result(scenario: str, statuses: list[int], latencies: list[float], seconds: float, **usage) -> dict:
+    return {
+        "scenario": scenario,
+        "requests": len(statuses),
+        "errors": sum(status != 200 for status in statuses),
+        "seconds": seconds,
+        "requests_per_second": len(statuses) / seconds,
+        "latency": get_percentiles(latencies),
+        **usage,
+    }
+
+
+async def send_requests(server_url: str, origin_url: str, requests: int, concurrency: int, compress: bool):
+    statuses, latencies = [], []
+    remaining = iter(range(requests))
+    headers = {"Accept-Encoding": "gzip"} if compress else {}
+
+    async def worker(session: ClientSession):
+        for index in remaining:
+            start = time.perf_counter()
+            async with session.get(f"{server_url}request/{origin_url}/page/{index}", headers=headers) as response:
+                await response.read()
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status)
+
+    async with ClientSession(connector=TCPConnector(limit=0), timeout=ClientTimeout(total=60)) as session:
+        # Warm up the server and its upstream connection pool.
+        async with session.get(f"{server_url}request/{origin_url}/warmup") as response:
+            await response.read()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        return statuses, latencies, time.perf_counter() - start
+
+
+def run_proxy(args: argparse.Namespace, origin_url: str) -> dict:
+    """Send the requests straight to the server, as the loopback requests of Scrapy would be."""
+    from scrapy_aiohttp import AiohttpServer
+    from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+    server_url = f"http://127.0.0.1:{free_port()}/"
+    server = AiohttpServer(server_url=server_url, workers=args.workers, decompress=not args.compress)
+    server.extract_request_header_config(DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
+    server.run()
+    try:
+        statuses, latencies, seconds = asyncio.run(send_requests(
+            server_url, origin_url, args.requests, args.concurrency, args.compress
+        ))
+        usage = get_process_usage([process.pid for process in server._processes])
+    finally:
+        server.stop()
+    return make_result("proxy", statuses, latencies, seconds, proxy=usage)
+
+
+def crawl(args: argparse.Namespace, origin_url: str, connection):
+    """Run the crawl scenario in a new process, sending its result on the connection."""
+    from scrapy import Spider, signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest
+    from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+    statuses, latencies, proxy_usage, times = [], [], {}, {}
+
+    class LoadSpider(Spider):
+        name = "load"
+
+        @classmethod
+        def from_crawler(cls, crawler, *args, **kwargs):
+            spider = super().from_crawler(crawler, *args, **kwargs)
+            crawler.signals.connect(spider.on_closed, signal=signals.spider_closed)
+            return spider
+
+        async def start(self):
+            for request in self.start_requests():
+                yield request
+
+        def start_requests(self):
+            times["start"] = time.perf_counter()
+            for index in range(args.requests):
+                yield AiohttpRequest(f"{origin_url}/page/{index}", callback=self.parse, errback=self.on_error)
+
+        def parse(self, response, **kwargs):
+            statuses.append(response.status)
+            latencies.append(response.meta["download_latency"])
+
+        def on_error(self, failure):
+            statuses.append(0)
+
+        def on_closed(self, spider):
+            times["end"] = time.perf_counter()
+            server = AiohttpMiddleware._server
+            proxy_usage.update(get_process_usage([process.pid for process in server._processes]))
+            AiohttpMiddleware._force_stop_server()
+
+    process = CrawlerProcess({
+        "AIOHTTP_SERVER_URL": f"http://127.0.0.1:{free_port()}/",
+        "AIOHTTP_REQUEST_HEADERS_CONFIG": DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+        "AIOHTTP_SERVER_WORKERS": args.workers,
+        "DOWNLOADER_MIDDLEWARES": {"scrapy_aiohttp.AiohttpMiddleware": 651},
+        "CONCURRENT_REQUESTS": args.concurrency,
+        "CONCURRENT_REQUESTS_PER_DOMAIN": args.concurrency,
+        "RETRY_ENABLED": False,
+        "HTTPERROR_ALLOW_ALL": True,
+        "ROBOTSTXT_OBEY": False,
+        "TELNETCONSOLE_ENABLED": False,
+        "LOG_LEVEL": "ERROR",
+    })
+    process.crawl(LoadSpider)
+    process.start()
+    result = make_result(
+        "crawl", statuses, latencies, times["end"] - times["start"], proxy=proxy_usage, crawler=get_own_usage()
+    )
+    connection.send(result)
+    connection.close()
+
+
+def run_crawl(args: argparse.Namespace, origin_url: str) -> dict:
+    """Run a Scrapy crawl through AiohttpMiddleware in a new interpreter, so its usage is its own."""
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe(duplex=False)
+    process = context.Process(target=crawl, args=(args, origin_url, child_connection))
+    process.start()
+    child_connection.close()
+    try:
+        return connection.recv()
+    except EOFError:
+        process.join()
+        raise RuntimeError(f"The crawl failed with exit code {process.exitcode}.") from None
+    finally:
+        process.join()
+
+
+def compare(results: list[dict], baseline: dict, tolerance: float) -> list[str]:
+    """Get the regressions of the results against the results of an earlier run."""
+    regressions = []
+    previous = {result["scenario"]: result for result in baseline["results"]}
+    for result in results:
+        before = previous.get(result["scenario"])
+        if before is None:
+            continue
+        checks = [("requests_per_second", result["requests_per_second"], before["requests_per_second"], False)]
+        if result["latency"]["p95"] is not None and before["latency"]["p95"] is not None:
+            checks.append(("p95 latency", result["latency"]["p95"], before["latency"]["p95"], True))
+        for side in ("proxy", "crawler"):
+            now, then = result.get(side, {}).get("cpu_seconds"), before.get(side, {}).get("cpu_seconds")
+            if now is not None and then is not None:
+                checks.append((f"{side} CPU per request", now / result["requests"], then / before["requests"], True))
+        for name, now, then, lower_is_better in checks:
+            change = (now - then) / then if then else 0.0
+            if (change if lower_is_better else -change) > tolerance:
+                regressions.append(f"{result['scenario']}: {name} {then:.6g} -> {now:.6g} ({change:+.1%})")
+    return regressions
+
+
+def print_result(result: dict):
+    latency = result["latency"]
+    print(f"{result['scenario']:<6} {result['requests_per_second']:>10,.0f} requests/s  "
+          f"p50 {latency['p50'] * 1e3:7.2f} ms  p95 {latency['p95'] * 1e3:7.2f} ms  "
+          f"p99 {latency['p99'] * 1e3:7.2f} ms  errors {result['errors']}")
+    for side in ("proxy", "crawler"):
+        usage = result.get(side)
+        if usage and usage["cpu_seconds"] is not None:
+            print(f"       {side:<8} CPU {usage['cpu_seconds']:7.2f} s  "
+                  f"peak RSS {usage['peak_rss_bytes'] / 2 ** 20:7.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=list(SCENARIOS), help="scenarios to run")
+    parser.add_argument("--requests", type=int, default=5000, help="requests sent per scenario")
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent requests")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    add_origin_arguments(parser)
+    parser.add_argument("--output", help="file to write the JSON results to, printed when omitted")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change reported as a regression")
+    args = parser.parse_args()
+
+    origin_config: OriginConfig = get_origin_config(args)
+    origin, origin_url = start_origin(origin_config)
+    try:
+        results = []
+        for scenario in args.scenario:
+            results.append(run_proxy(args, origin_url) if scenario == "proxy" else run_crawl(args, origin_url))
+            print_result(results[-1])
+    finally:
+        origin.terminate()
+        origin.join()
+
+    try:
+        package_version = version("scrapy-aiohttp")
+    except PackageNotFoundError:
+        package_version = None
+    report = {
+        "version": package_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "origin": vars(origin_config),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
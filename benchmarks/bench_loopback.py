@@ -0,0 +1,93 @@
+"""
+Throughput of the loopback hop between Scrapy and the server, over TCP and over a unix domain socket.
+
+Starts a stand-in origin and an AiohttpServer for each transport, then sends the same requests
+through both, with a pooled keep-alive client and with a new connection per request, which is
+where TCP pays for its handshakes, ephemeral ports and TIME_WAIT.
+
+    python benchmarks/bench_loopback.py [--requests 5000] [--concurrency 50] [--size 1024] [--workers 1]
+"""
+import argparse
+import asyncio
+import socket
+import tempfile
+import time
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, UnixConnector
+
+from scrapy_aiohttp import AiohttpServer
+from scrapy_aiohttp.utils.loopback import get_unix_path, get_server_route_url
+
+from origin import OriginConfig, start_origin
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def run_requests(server_url: str, origin_url: str, requests: int, concurrency: int, keep_alive: bool) -> float:
+    """Send the requests through the server and return the elapsed seconds."""
+    path = get_unix_path(server_url)
+    if path is not None:
+        connector = UnixConnector(path=path, force_close=not keep_alive, limit=0)
+    else:
+        connector = TCPConnector(force_close=not keep_alive, limit=0)
+    url = get_server_route_url(server_url, f"/request/{origin_url}/page")
+    remaining = iter(range(requests))
+
+    async def worker(session: ClientSession):
+        for _ in remaining:
+            async with session.get(url) as response:
+                await response.read()
+                if response.status != 200:
+                    raise RuntimeError(f"Unexpected status {response.status} from {server_url}.")
+
+    async with ClientSession(connector=connector, timeout=ClientTimeout(total=60)) as session:
+        # Warm up the server and its upstream connection pool.
+        async with session.get(url) as response:
+            await response.read()
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--requests", type=int, default=5000, help="requests sent per measurement")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent client requests")
+    parser.add_argument("--size", type=int, default=1024, help="origin response body size in bytes")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    args = parser.parse_args()
+
+    origin, origin_url = start_origin(OriginConfig(size=args.size))
+    with tempfile.TemporaryDirectory() as directory:
+        server_urls = {
+            "tcp": f"http://127.0.0.1:{free_port()}/",
+            "unix": f"unix://{directory}/scrapy-aiohttp.sock",
+        }
+        servers = {}
+        for name, server_url in server_urls.items():
+            servers[name] = AiohttpServer(server_url=server_url, workers=args.workers)
+            servers[name].extract_request_header_config({"User-Agent": None})
+            servers[name].run()
+        try:
+            print(f"{args.requests} requests, concurrency {args.concurrency}, {args.size} byte bodies")
+            for keep_alive in (True, False):
+                print("keep-alive connections" if keep_alive else "new connection per request")
+                for name, server_url in server_urls.items():
+                    seconds = asyncio.run(run_requests(
+                        server_url, origin_url, args.requests, args.concurrency, keep_alive
+                    ))
+                    per_request = seconds / args.requests
+                    print(f"  {name:<12} {per_request * 1e6:8.1f} us/request  {1 / per_request:>10,.0f} requests/s")
+        finally:
+            for server in servers.values():
+                server.stop()
+            origin.terminate()
+            origin.join()
+
+
+if __name__ == "__main__":
+    main()
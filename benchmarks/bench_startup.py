@@ -0,0 +1,75 @@
+"""
+Startup time of the server: time until AiohttpServer.run() returns with every worker serving.
+
+Measured for each multiprocessing start method, followed by the import time of the worker entry
+point compared with importing the Scrapy side of the package, which spawned workers used to pay.
+
+    python benchmarks/bench_startup.py [--runs 5] [--workers 1]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import subprocess
+import sys
+import time
+
+from aiohttp import ClientSession
+
+from scrapy_aiohttp import AiohttpServer
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def get_status(url: str) -> int:
+    async with ClientSession() as session:
+        async with session.get(url) as response:
+            return response.status
+
+
+def bench_start_method(start_method: str, runs: int, workers: int):
+    ready, first_response = [], []
+    for _ in range(runs):
+        server_url = f"http://127.0.0.1:{free_port()}/"
+        server = AiohttpServer(server_url=server_url, workers=workers, start_method=start_method)
+        server.extract_request_header_config(DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
+        start = time.perf_counter()
+        server.run()
+        ready.append(time.perf_counter() - start)
+        asyncio.run(get_status(f"{server_url}metrics"))
+        first_response.append(time.perf_counter() - start)
+        server.stop()
+    print(f"  {start_method:<12} ready {sum(ready) / runs * 1e3:8.1f} ms  "
+          f"first response {sum(first_response) / runs * 1e3:8.1f} ms")
+
+
+def bench_import(label: str, module: str, runs: int):
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", f"import {module}"], check=True)
+        seconds.append(time.perf_counter() - start)
+    print(f"  {label:<12} {sum(seconds) / runs * 1e3:8.1f} ms  (python -c 'import {module}')")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=5, help="measurements averaged per line")
+    parser.add_argument("--workers", type=int, default=1, help="server worker processes")
+    args = parser.parse_args()
+
+    print(f"server startup, {args.workers} worker(s)")
+    for start_method in multiprocessing.get_all_start_methods():
+        bench_start_method(start_method, args.runs, args.workers)
+    print("interpreter start and imports")
+    bench_import("worker", "scrapy_aiohttp._worker, scrapy_aiohttp.server", args.runs)
+    bench_import("scrapy side", "scrapy_aiohttp.middleware", args.runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Stand-in origin for the benchmarks, with configurable latency, body size, compression and error rate.
+
+Used by the benchmark scripts through start_origin(), or on its own as a target for other load tools:
+
+    python benchmarks/origin.py [--port 8000] [--latency 0.01] [--jitter 0.005] [--size 16384] [--compress]
+                                [--error-rate 0.01]
+"""
+import argparse
+import asyncio
+import gzip
+import random
+import socket
+from dataclasses import dataclass, asdict
+from multiprocessing import Process
+
+from aiohttp import web, hdrs
+
+PAGE_ROW = b'<li><a href="/item/0123456789">Item title with some words</a> <span>42.00</span></li>\n'
+
+
+@dataclass
+class OriginConfig:
+    # Mean seconds before answering, and the maximum deviation from it.
+    latency: float = 0.0
+    jitter: float = 0.0
+    # Size of the uncompressed HTML body in bytes.
+    size: int = 16384
+    # gzip the body for clients accepting it.
+    compress: bool = False
+    # Fraction of the requests answered with a 500 error.
+    error_rate: float = 0.0
+
+
+def create_app(config: OriginConfig) -> web.Application:
+    body = (PAGE_ROW * (config.size // len(PAGE_ROW) + 1))[:config.size]
+    compressed_body = gzip.compress(body, compresslevel=6)
+
+    async def handle(request: web.Request) -> web.Response:
+        if config.latency or config.jitter:
+            delay = random.uniform(config.latency - config.jitter, config.latency + config.jitter)
+            await asyncio.sleep(max(0.0, delay))
+        if config.error_rate and random.random() < config.error_rate:
+            return web.Response(status=500, text="stand-in origin error")
+        if config.compress and "gzip" in request.headers.get(hdrs.ACCEPT_ENCODING, ""):
+            return web.Response(
+                body=compressed_body, content_type="text/html", headers={hdrs.CONTENT_ENCODING: "gzip"}
+            )
+        return web.Response(body=body, content_type="text/html")
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    return app
+
+
+def serve_origin(sock: socket.socket, config: OriginConfig):
+    web.run_app(create_app(config), sock=sock, print=None, access_log=None)
+
+
+def start_origin(config: OriginConfig | None = None) -> tuple[Process, str]:
+    """Run the origin in its own process, returning the process and the origin URL."""
+    with socket.socket() as sock:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("127.0.0.1", 0))
+        sock.listen(socket.SOMAXCONN)
+        process = Process(target=serve_origin, args=(sock, config or OriginConfig()), daemon=True)
+        process.start()
+        return process, f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+def add_origin_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="mean origin latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum deviation from the mean latency")
+    parser.add_argument("--size", type=int, default=16384, help="origin body size in bytes")
+    parser.add_argument("--compress", action="store_true", help="gzip the origin bodies")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500 responses")
+
+
+def get_origin_config(args: argparse.Namespace) -> OriginConfig:
+    return OriginConfig(**{name: getattr(args, name) for name in asdict(OriginConfig())})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--port", type=int, default=8000, help="port to listen on")
+    add_origin_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(get_origin_config(args)), host="127.0.0.1", port=args.port, access_log=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,22 @@
-from .middleware import AiohttpMiddleware
-from .request import AiohttpRequest
-from .server import AiohttpServer
+from importlib import import_module
+
+__all__ = ("AiohttpMiddleware", "AiohttpRequest", "AiohttpServer")
+
+# The public classes are imported on first use, so the server worker processes,
+# which only need the server, do not import Scrapy and Twisted.
+_EXPORTS = {
+    "AiohttpMiddleware": ".middleware",
+    "AiohttpRequest": ".request",
+    "AiohttpServer": ".server",
+}
+
+
+def __getattr__(name: str):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(module, __name__), name)
+
+
+def __dir__():
+    return sorted((*globals(), *__all__))
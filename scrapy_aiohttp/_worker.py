@@ -0,0 +1,74 @@
+"""
+Entry point of the server worker processes.
+
+It only imports asyncio and aiohttp, so workers started with spawn or forkserver do not import
+Scrapy or Twisted; the server itself is unpickled from its own module.
+"""
+import asyncio
+import socket
+
+from multiprocessing.connection import Connection
+
+from aiohttp import web
+
+
+def serve(server, sockets: list[socket.socket], connection: Connection, worker_index: int = 0):
+    """
+    Serve the application of an AiohttpServer on the listening sockets bound by the parent,
+    as the worker of the given index.
+
+    None is sent on the connection once the sites are started, or the startup error otherwise.
+    The worker runs until it receives SIGTERM or SIGINT, or until it is asked to drain on the
+    connection, which it answers with the drain report before exiting.
+    """
+    server._worker_index = worker_index
+    try:
+        asyncio.run(_serve(server, sockets, connection))
+    except (web.GracefulExit, KeyboardInterrupt):
+        pass
+
+
+async def _serve(server, sockets: list[socket.socket], connection: Connection):
+    runner = web.AppRunner(server.app, handle_signals=True)
+    try:
+        await runner.setup()
+        for sock in sockets:
+            await web.SockSite(runner, sock).start()
+    except Exception as e:
+        connection.send(repr(e))
+        connection.close()
+        await runner.cleanup()
+        raise
+    connection.send(None)
+    try:
+        drain_timeout = await _wait_drain(connection)
+        connection.send(await server._drain(drain_timeout))
+    finally:
+        connection.close()
+        await runner.cleanup()
+
+
+async def _wait_drain(connection: Connection) -> float | None:
+    """
+    Wait for the parent to ask for a drain, returning the drain timeout.
+
+    The worker keeps serving when the parent goes away without asking, until it is terminated.
+    """
+    loop = asyncio.get_running_loop()
+    requested = loop.create_future()
+
+    def on_readable():
+        try:
+            command, drain_timeout = connection.recv()
+        except (EOFError, OSError):
+            loop.remove_reader(connection.fileno())
+            return
+        if command == "drain" and not requested.done():
+            requested.set_result(drain_timeout)
+
+    loop.add_reader(connection.fileno(), on_readable)
+    try:
+        return await requested
+    finally:
+        if not connection.closed:
+            loop.remove_reader(connection.fileno())
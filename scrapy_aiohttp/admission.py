@@ -0,0 +1,147 @@
+import asyncio
+
+from collections import deque
+from contextvars import ContextVar
+
+from scrapy_aiohttp.utils import AdmissionConfig, DEFAULT_AIOHTTP_ADMISSION_CONFIG
+from .metrics import ProxyMetrics
+
+
+class AdmissionTicket:
+    """
+    An admitted proxy request, with the body bytes it buffers.
+    """
+
+    __slots__ = ("bytes",)
+
+    def __init__(self):
+        self.bytes = 0
+
+
+# Ticket of the proxy request being handled, so the bodies it buffers are charged to it.
+current_ticket: ContextVar[AdmissionTicket | None] = ContextVar("current_ticket", default=None)
+
+
+class AdmissionControl:
+    """
+    Admission of proxy requests into a server worker, bounded by requests in flight and buffered bytes.
+
+    A request arriving while max_in_flight requests are in flight waits in a queue of at most
+    max_queue requests, for at most queue_timeout seconds. Requests that can not wait, and requests
+    arriving while the bodies being buffered exceed max_buffered_bytes, are rejected at once, so
+    the server answers them with a 503 instead of stalling. Limits of 0 disable the check.
+    """
+
+    def __init__(self, admission_config: AdmissionConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_ADMISSION_CONFIG, **(admission_config or {})}
+        self.max_in_flight = config["max_in_flight"]
+        self.max_queue = config["max_queue"]
+        self.queue_timeout = config["queue_timeout"]
+        self.max_buffered_bytes = config["max_buffered_bytes"]
+        self.retry_after = config["retry_after"]
+        self.in_flight = 0
+        self.buffered_bytes = 0
+        self.draining = False
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        # Created in the event loop of the server worker, since the admission control is sent to spawned workers.
+        self._idle: asyncio.Event | None = None
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("admission_rejected_total", "counter", "Requests rejected by admission, by reason.")
+            metrics.describe("admission_queue", "gauge", "Requests waiting to be admitted.")
+            metrics.describe("buffered_bytes", "gauge", "Body bytes buffered by the requests in flight.")
+
+    async def admit(self) -> AdmissionTicket | None:
+        """
+        Admit a request, waiting in the queue if needed, or get None when it is rejected.
+        """
+        if self.draining:
+            return self._reject("draining")
+        if self.max_buffered_bytes and self.buffered_bytes >= self.max_buffered_bytes:
+            return self._reject("bytes")
+        if not self.max_in_flight or self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return AdmissionTicket()
+        if len(self._waiters) >= self.max_queue:
+            return self._reject("in_flight")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._update_queue()
+        try:
+            # A released request hands its slot over to the first waiter, keeping in_flight as it is.
+            admitted = await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # The slot may have been handed over just as the wait timed out, it is taken then.
+            if not (waiter.done() and not waiter.cancelled() and waiter.result()):
+                return self._reject("queue")
+            admitted = True
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.result():
+                self.release(AdmissionTicket())
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+            self._update_queue()
+        return AdmissionTicket() if admitted else self._reject("draining")
+
+    def release(self, ticket: AdmissionTicket):
+        """
+        End an admitted request, handing its slot over to the next request in the queue.
+        """
+        self.charge(ticket, -ticket.bytes)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+        if not self.in_flight and self._idle is not None:
+            self._idle.set()
+
+    def charge(self, ticket: AdmissionTicket, size: int):
+        """
+        Add body bytes buffered by a request, or remove them with a negative size.
+        """
+        ticket.bytes += size
+        self.buffered_bytes += size
+        if self.metrics is not None and size:
+            self.metrics.set("buffered_bytes", self.buffered_bytes)
+
+    async def drain(self, timeout: float | None) -> dict[str, int]:
+        """
+        Reject every new and queued request, and wait at most timeout seconds for the requests in flight.
+
+        Returns the number of requests in flight when draining started, of those that completed,
+        of those still in flight at the timeout, which are dropped, and of the rejected requests.
+        """
+        self.draining = True
+        rejected = self.rejected
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(False)
+        in_flight = self.in_flight
+        if self.in_flight:
+            self._idle = asyncio.Event()
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return {
+            "in_flight": in_flight,
+            "completed": in_flight - self.in_flight,
+            "dropped": self.in_flight,
+            "rejected": self.rejected - rejected,
+        }
+
+    def _reject(self, reason: str) -> None:
+        self.rejected += 1
+        if self.metrics is not None:
+            self.metrics.inc("admission_rejected_total", reason=reason)
+        return None
+
+    def _update_queue(self):
+        if self.metrics is not None:
+            self.metrics.set("admission_queue", len(self._waiters))
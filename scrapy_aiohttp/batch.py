@@ -0,0 +1,271 @@
+import asyncio
+import itertools
+import logging
+import random
+from time import time, monotonic
+from urllib.parse import urlparse
+
+from aiohttp import ClientSession, ClientTimeout, ClientError, hdrs
+from scrapy import Request, signals
+from scrapy.crawler import Crawler
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.reactor import is_asyncio_reactor_installed
+from twisted.internet.error import ConnectError, TimeoutError
+
+from scrapy_aiohttp.utils import AsyncioReactorNotInstalledError, SettingVariableNotFoundError
+from .loopback import create_loopback_session
+from .request import AiohttpRequest
+from .utils.batch import BATCH_CONTENT_TYPE, encode_item, read_results
+from .utils.loopback import get_server_route_url, get_request_route_url
+
+
+class BatchSlot:
+    """
+    Download slot of batched requests, which bypass the slots of the Scrapy downloader.
+
+    At most concurrency requests of the slot are in flight, and they start at least delay seconds
+    apart, randomized between 0.5 and 1.5 times the delay like the Scrapy download delay.
+    """
+
+    def __init__(self, concurrency: int, delay: float, randomize_delay: bool):
+        self.concurrency = max(1, concurrency)
+        self.delay = delay
+        self.randomize_delay = randomize_delay
+        self.active = 0
+        self.next_start = 0.0
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    @property
+    def idle(self) -> bool:
+        return not self.active and self.next_start <= monotonic()
+
+    async def acquire(self):
+        self.active += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self.active -= 1
+            raise
+        if self.delay:
+            now = monotonic()
+            start = max(now, self.next_start)
+            delay = random.uniform(0.5 * self.delay, 1.5 * self.delay) if self.randomize_delay else self.delay
+            self.next_start = start + delay
+            if start > now:
+                await asyncio.sleep(start - now)
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+
+class AiohttpBatchMiddleware:
+    """
+    Downloader middleware sending aiohttp requests to the server in batches.
+
+    Requests converted by AiohttpMiddleware are collected for a short window and sent together
+    in one request to the /batch route of the server. Each response is returned to Scrapy as
+    soon as it arrives, so the loopback round trip is paid once per batch instead of once per
+    request. With a server farm, each server gets its own batches. Requires the asyncio reactor.
+
+    Since the response is returned by the middleware, batched requests never reach the download
+    slots of the Scrapy downloader. Their per-slot concurrency and delay, and the download timeout
+    of each request, are enforced here instead.
+    """
+
+    def __init__(
+            self,
+            server_url: str | None,
+            window: float = 0.005,
+            max_size: int = 100,
+            timeout: float = 180.0,
+            server_urls: list[str] | tuple[str, ...] = (),
+            concurrency: int = 8,
+            delay: float = 0.0,
+            randomize_delay: bool = True,
+            slots: dict | None = None,
+    ):
+        if not is_asyncio_reactor_installed():
+            raise AsyncioReactorNotInstalledError()
+        self.server_url = server_url
+        self.batch_url = get_server_route_url(server_url, "/batch") if server_url is not None else None
+        server_urls = [server_url, *server_urls] if server_url is not None else list(server_urls)
+        # Servers by the URL of their request route, which converted requests keep as their target URL.
+        self._servers = {get_request_route_url(url): url for url in server_urls}
+        self.window = window
+        self.max_size = max_size
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.delay = delay
+        self.randomize_delay = randomize_delay
+        # Concurrency and delay of particular slots, as in DOWNLOAD_SLOTS.
+        self.slot_settings = slots or {}
+        self._slots: dict[str, BatchSlot] = {}
+        self._pending: dict[str, list[tuple[str, AiohttpRequest, asyncio.Future]]] = {}
+        self._timers: dict[str, asyncio.TimerHandle] = {}
+        self._ids = itertools.count()
+        self._tasks: set[asyncio.Task] = set()
+        self._sessions: dict[str, ClientSession] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        settings = crawler.settings
+        server_url = settings.get("AIOHTTP_SERVER_URL")
+        server_urls = settings.getlist("AIOHTTP_SERVER_URLS")
+
+        if server_url is None and not server_urls:
+            raise SettingVariableNotFoundError("AIOHTTP_SERVER_URL")
+
+        middleware = cls(
+            server_url,
+            window=settings.getfloat("AIOHTTP_BATCH_WINDOW", 0.005),
+            max_size=settings.getint("AIOHTTP_BATCH_MAX_SIZE", 100),
+            timeout=settings.getfloat("DOWNLOAD_TIMEOUT"),
+            server_urls=server_urls,
+            concurrency=settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"),
+            delay=settings.getfloat("DOWNLOAD_DELAY"),
+            randomize_delay=settings.getbool("RANDOMIZE_DOWNLOAD_DELAY"),
+            slots=settings.getdict("DOWNLOAD_SLOTS"),
+        )
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    async def process_request(self, request: Request, spider) -> Response | None:
+        """Add a request converted by AiohttpMiddleware to the next batch and return its response."""
+
+        if not isinstance(request, AiohttpRequest) or request.original_url is None:
+            return None
+        server_url = self._servers.get(request.target_url, self.server_url)
+        if server_url is None:
+            return None
+        timeout = request.meta.get("download_timeout", self.timeout)
+        slot_key = request.meta.get("download_slot") or urlparse(request.original_url).hostname or ""
+        slot = self._get_slot(slot_key, spider)
+        start_time = time()
+        await slot.acquire()
+        try:
+            remaining = max(0.0, timeout - (time() - start_time)) if timeout else None
+            status, headers, body = await asyncio.wait_for(self._batch(server_url, request), remaining)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Getting {request.original_url} took longer than {timeout} seconds.") from None
+        finally:
+            slot.release()
+            if slot.idle:
+                self._slots.pop(slot_key, None)
+        request.meta["download_latency"] = time() - start_time
+        return self._build_response(request, status, headers, body)
+
+    def _get_slot(self, key: str, spider) -> BatchSlot:
+        """
+        Get the slot of a request, with the concurrency and delay the Scrapy downloader would give it.
+        """
+        slot = self._slots.get(key)
+        if slot is None:
+            if len(self._slots) >= 10000:
+                # Slots are dropped once idle, except those still waiting for their delay.
+                self._slots = {key: slot for key, slot in self._slots.items() if not slot.idle}
+            slot_settings = self.slot_settings.get(key, {})
+            delay = getattr(spider, "download_delay", self.delay)
+            concurrency = getattr(spider, "max_concurrent_requests", self.concurrency)
+            slot = self._slots[key] = BatchSlot(
+                slot_settings.get("concurrency", concurrency),
+                slot_settings.get("delay", delay),
+                slot_settings.get("randomize_delay", self.randomize_delay),
+            )
+        return slot
+
+    async def _batch(self, server_url: str, request: AiohttpRequest) -> tuple[int, list, bytes]:
+        """Add a request to the next batch of a server and wait for its result."""
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        pending = self._pending.setdefault(server_url, [])
+        pending.append((str(next(self._ids)), request, future))
+        if len(pending) >= self.max_size:
+            self._flush(server_url)
+        elif server_url not in self._timers:
+            self._timers[server_url] = loop.call_later(self.window, self._flush, server_url)
+        return await future
+
+    def _flush(self, server_url: str):
+        """Send the pending requests to a server as one batch."""
+
+        timer = self._timers.pop(server_url, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(server_url, None)
+        if batch:
+            task = asyncio.ensure_future(self._send(server_url, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _get_session(self, server_url: str) -> ClientSession:
+        session = self._sessions.get(server_url)
+        if session is None:
+            session = self._sessions[server_url] = create_loopback_session(
+                server_url, timeout=ClientTimeout(total=None, sock_read=self.timeout)
+            )
+        return session
+
+    async def _send(self, server_url: str, batch: list[tuple[str, AiohttpRequest, asyncio.Future]]):
+        futures = {item_id: future for item_id, _, future in batch}
+        payload = b"".join(
+            encode_item(item_id, request.method, request.original_url, self._get_headers(request), request.body)
+            for item_id, request, _ in batch
+        )
+        error = "missing from the batch response"
+        try:
+            async with self._get_session(server_url).post(
+                    get_server_route_url(server_url, "/batch"), data=payload,
+                    headers={hdrs.CONTENT_TYPE: BATCH_CONTENT_TYPE}
+            ) as response:
+                if response.status != 200:
+                    error = f"batch request failed with status {response.status}"
+                else:
+                    async for item_id, status, headers, body in read_results(response.content):
+                        future = futures.pop(item_id, None)
+                        if future is not None and not future.done():
+                            future.set_result((status, headers, body))
+        except (ClientError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            logging.warning(f"Batch of {len(batch)} requests failed: {e!r}")
+            error = repr(e)
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(ConnectError(string=error))
+
+    @staticmethod
+    def _get_headers(request: Request) -> list[tuple[str, str]]:
+        return [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, values in request.headers.items()
+            for value in values
+        ]
+
+    @staticmethod
+    def _build_response(request: Request, status: int, headers: list, body: bytes) -> Response:
+        response_headers = Headers()
+        for name, value in headers:
+            response_headers.appendlist(name, value)
+        respcls = responsetypes.from_args(headers=response_headers, url=request.url, body=body)
+        return respcls(
+            url=request.url,
+            status=status,
+            headers=response_headers,
+            body=body,
+            request=request,
+            protocol="HTTP/1.1",
+        )
+
+    def spider_closed(self, spider):
+        return deferred_from_coro(self._close())
+
+    async def _close(self):
+        for server_url in list(self._pending):
+            self._flush(server_url)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
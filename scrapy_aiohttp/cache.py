@@ -0,0 +1,351 @@
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from aiohttp import hdrs
+from multidict import CIMultiDict
+
+from scrapy_aiohttp.utils import (
+    CacheConfig,
+    DEFAULT_AIOHTTP_CACHE_CONFIG,
+    HOST_DELAY_HEADER,
+    TIMINGS_HEADER,
+    CACHE_HEADER,
+)
+from .metrics import ProxyMetrics
+
+# Statuses that may be cached without explicit freshness information, RFC 9110 section 15.1.
+CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501))
+CACHEABLE_METHODS = frozenset((hdrs.METH_GET, hdrs.METH_HEAD))
+# Server headers describing a single exchange, never stored.
+VOLATILE_HEADERS = frozenset(name.lower() for name in (HOST_DELAY_HEADER, TIMINGS_HEADER, CACHE_HEADER))
+# Headers of a 304 response that must not replace the stored ones.
+NOT_UPDATED_HEADERS = frozenset(("content-length", "content-encoding", "content-type", "transfer-encoding"))
+# Headers addressed to the client of a single exchange, never stored or replayed to other requests.
+PRIVATE_HEADERS = frozenset(("set-cookie", "set-cookie2"))
+
+
+def parse_cache_control(headers) -> dict[str, str | None]:
+    """
+    Parse all the Cache-Control header values of a multidict into a directive to argument mapping.
+    """
+    directives = {}
+    for value in headers.getall(hdrs.CACHE_CONTROL, ()):
+        for directive in value.split(","):
+            name, _, argument = directive.partition("=")
+            name = name.strip().lower()
+            if name:
+                directives[name] = argument.strip().strip('"') or None
+    return directives
+
+
+def parse_http_date(value: str | None) -> float | None:
+    """
+    Parse an HTTP date into a timestamp.
+    """
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_seconds(value: str | None) -> float | None:
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class CacheEntry:
+    """
+    A cached response, with its body in memory or in a file of the disk tier.
+    """
+
+    __slots__ = ("key", "status", "headers", "body", "path", "size", "stored_at", "lifetime")
+
+    def __init__(self, key: str, status: int, headers: CIMultiDict, body: bytes | None, path: str | None,
+                 size: int, lifetime: float):
+        self.key = key
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.path = path
+        self.size = size
+        self.stored_at = time.time()
+        self.lifetime = lifetime
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    def is_fresh(self) -> bool:
+        return time.time() - self.stored_at < self.lifetime
+
+    def conditional_headers(self) -> dict[str, str]:
+        """
+        Get the headers revalidating this entry with the origin.
+        """
+        headers = {}
+        if hdrs.ETAG in self.headers:
+            headers[hdrs.IF_NONE_MATCH] = self.headers[hdrs.ETAG]
+        if hdrs.LAST_MODIFIED in self.headers:
+            headers[hdrs.IF_MODIFIED_SINCE] = self.headers[hdrs.LAST_MODIFIED]
+        return headers
+
+
+class ResponseCache:
+    """
+    HTTP response cache of the server, with an in-memory LRU tier bounded in bytes and a disk tier
+    for large bodies.
+
+    Responses are stored following Cache-Control and Expires, falling back to default_ttl when
+    they carry no freshness information. Stale entries with an ETag or a Last-Modified date
+    are revalidated with the origin, and stale entries without one are dropped.
+    Each server worker keeps its own cache, and its disk tier in its own temporary directory.
+    """
+
+    def __init__(self, cache_config: CacheConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_CACHE_CONFIG, **(cache_config or {})}
+        self.memory_size = config["memory_size"]
+        self.spill_size = config["spill_size"]
+        self.disk_size = config["disk_size"]
+        self.directory = config["directory"]
+        self.default_ttl = config["default_ttl"]
+        self.memory: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.disk: OrderedDict[str, CacheEntry] = OrderedDict()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        self._worker_directory: str | None = None
+        self._file_ids = itertools.count()
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("cache_requests_total", "counter", "Cacheable requests by cache result.")
+            metrics.describe("cache_evictions_total", "counter", "Cache entries evicted by tier.")
+            metrics.describe("cache_entries", "gauge", "Cache entries by tier.")
+            metrics.describe("cache_bytes", "gauge", "Body bytes stored in the cache by tier.")
+
+    @staticmethod
+    def is_cacheable_request(method: str, incoming_headers, request_headers) -> bool:
+        """
+        Check whether a request may be answered from the cache.
+
+        Requests asking not to store responses and conditional requests, usually sent by
+        Scrapy's HttpCacheMiddleware, bypass the cache.
+        """
+        if method not in CACHEABLE_METHODS:
+            return False
+        if "no-store" in parse_cache_control(incoming_headers):
+            return False
+        return hdrs.IF_NONE_MATCH not in request_headers and hdrs.IF_MODIFIED_SINCE not in request_headers
+
+    @staticmethod
+    def requires_revalidation(incoming_headers) -> bool:
+        """
+        Check whether a request asks for fresh entries to be revalidated as well.
+        """
+        directives = parse_cache_control(incoming_headers)
+        if "no-cache" in directives or directives.get("max-age") == "0":
+            return True
+        return incoming_headers.get(hdrs.PRAGMA, "").lower() == "no-cache"
+
+    @staticmethod
+    def make_key(method: str, url: str, request_headers, options: dict) -> str:
+        """
+        Build the cache key of a request from its method, URL, resolved headers and the
+        request options changing the response.
+        """
+        key = hashlib.sha256(f"{method} {url}\n".encode())
+        for name, value in sorted((name.lower(), value) for name, value in request_headers.items()):
+            key.update(f"{name}: {value}\n".encode())
+        key.update(json.dumps(
+            [options.get("cookies"), options.get("allow_redirects", True), options.get("proxy")],
+            sort_keys=True,
+        ).encode())
+        return key.hexdigest()
+
+    def count(self, result: str):
+        if self.metrics is not None:
+            self.metrics.inc("cache_requests_total", result=result)
+
+    def get(self, key: str) -> CacheEntry | None:
+        """
+        Get the entry of a key, fresh or stale, if it can still be used.
+        """
+        tier = self.memory if key in self.memory else self.disk
+        entry = tier.get(key)
+        if entry is None:
+            return None
+        if not entry.is_fresh() and not entry.conditional_headers():
+            self._remove(entry)
+            return None
+        tier.move_to_end(key)
+        return entry
+
+    async def load(self, entry: CacheEntry) -> bytes | None:
+        """
+        Get the body of an entry, reading it from the disk tier if needed.
+        """
+        if entry.in_memory:
+            return entry.body
+        try:
+            return await asyncio.get_running_loop().run_in_executor(None, self._read_file, entry.path)
+        except OSError:
+            self._remove(entry)
+            return None
+
+    def get_lifetime(self, status: int, headers: CIMultiDict) -> float | None:
+        """
+        Get the freshness lifetime of a response in seconds, or None when it must not be stored.
+
+        Responses setting cookies are not stored, as if they were `no-store`.
+        """
+        directives = parse_cache_control(headers)
+        if "no-store" in directives or status == 206:
+            return None
+        if any(name.lower() in PRIVATE_HEADERS for name in headers):
+            return None
+        if "no-cache" in directives:
+            lifetime = 0.0
+        elif "max-age" in directives:
+            lifetime = _parse_seconds(directives["max-age"]) or 0.0
+        elif hdrs.EXPIRES in headers:
+            expires = parse_http_date(headers[hdrs.EXPIRES])
+            date = parse_http_date(headers.get(hdrs.DATE)) or time.time()
+            lifetime = max(0.0, expires - date) if expires is not None else 0.0
+        elif status in CACHEABLE_STATUSES:
+            lifetime = self.default_ttl
+        else:
+            return None
+        lifetime -= _parse_seconds(headers.get(hdrs.AGE)) or 0.0
+        if lifetime <= 0 and hdrs.ETAG not in headers and hdrs.LAST_MODIFIED not in headers:
+            return None
+        return max(0.0, lifetime)
+
+    async def store(self, key: str, status: int, headers: CIMultiDict, body: bytes) -> CacheEntry | None:
+        """
+        Store a response if it is cacheable, replacing any entry of the same key.
+        """
+        lifetime = self.get_lifetime(status, headers)
+        if lifetime is None:
+            return None
+        size = len(body)
+        headers = CIMultiDict(
+            (name, value) for name, value in headers.items() if name.lower() not in VOLATILE_HEADERS
+        )
+        if self.spill_size and size >= self.spill_size:
+            if size > self.disk_size:
+                return None
+            path = os.path.join(self._get_worker_directory(), f"{key}-{next(self._file_ids)}")
+            await asyncio.get_running_loop().run_in_executor(None, self._write_file, path, body)
+            entry = CacheEntry(key, status, headers, None, path, size, lifetime)
+        else:
+            if size > self.memory_size:
+                return None
+            entry = CacheEntry(key, status, headers, body, None, size, lifetime)
+        self._add(entry)
+        return entry
+
+    def revalidate(self, entry: CacheEntry, headers: CIMultiDict) -> CacheEntry:
+        """
+        Refresh an entry with the headers of a 304 response from the origin, except the cookies it sets.
+        """
+        names = {}
+        for name in headers:
+            lower_name = name.lower()
+            if lower_name not in VOLATILE_HEADERS | NOT_UPDATED_HEADERS | PRIVATE_HEADERS:
+                names.setdefault(lower_name, name)
+        for name in names.values():
+            entry.headers.popall(name, None)
+            entry.headers.extend((name, value) for value in headers.getall(name))
+        entry.stored_at = time.time()
+        entry.lifetime = self.get_lifetime(entry.status, entry.headers) or 0.0
+        return entry
+
+    def _add(self, entry: CacheEntry):
+        for tier in (self.memory, self.disk):
+            previous = tier.get(entry.key)
+            if previous is not None:
+                self._remove(previous)
+        if entry.in_memory:
+            self.memory[entry.key] = entry
+            self.memory_bytes += entry.size
+            while self.memory_bytes > self.memory_size:
+                self._evict(self.memory, "memory")
+        else:
+            self.disk[entry.key] = entry
+            self.disk_bytes += entry.size
+            while self.disk_bytes > self.disk_size:
+                self._evict(self.disk, "disk")
+        self._update_gauges()
+
+    def _evict(self, tier: OrderedDict, name: str):
+        _, entry = tier.popitem(last=False)
+        self._forget(entry)
+        if self.metrics is not None:
+            self.metrics.inc("cache_evictions_total", tier=name)
+
+    def _remove(self, entry: CacheEntry):
+        tier = self.memory if entry.in_memory else self.disk
+        if tier.get(entry.key) is entry:
+            del tier[entry.key]
+            self._forget(entry)
+            self._update_gauges()
+
+    def _forget(self, entry: CacheEntry):
+        if entry.in_memory:
+            self.memory_bytes -= entry.size
+            return
+        self.disk_bytes -= entry.size
+        try:
+            os.unlink(entry.path)
+        except OSError:
+            pass
+
+    def _update_gauges(self):
+        if self.metrics is None:
+            return
+        self.metrics.set("cache_entries", len(self.memory), tier="memory")
+        self.metrics.set("cache_entries", len(self.disk), tier="disk")
+        self.metrics.set("cache_bytes", self.memory_bytes, tier="memory")
+        self.metrics.set("cache_bytes", self.disk_bytes, tier="disk")
+
+    def _get_worker_directory(self) -> str:
+        if self._worker_directory is None:
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+            self._worker_directory = tempfile.mkdtemp(prefix="scrapy-aiohttp-cache-", dir=self.directory)
+        return self._worker_directory
+
+    @staticmethod
+    def _write_file(path: str, body: bytes):
+        with open(f"{path}.tmp", "wb") as file:
+            file.write(body)
+        os.replace(f"{path}.tmp", path)
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as file:
+            return file.read()
+
+    def clear(self):
+        """
+        Drop every entry and remove the disk tier directory of this worker.
+        """
+        self.memory.clear()
+        self.disk.clear()
+        self.memory_bytes = 0
+        self.disk_bytes = 0
+        if self._worker_directory is not None:
+            shutil.rmtree(self._worker_directory, ignore_errors=True)
+            self._worker_directory = None
+        self._update_gauges()
@@ -0,0 +1,58 @@
+import asyncio
+import re
+
+from functools import partial
+from typing import Awaitable, Callable
+
+from aiohttp import hdrs
+
+from scrapy_aiohttp.utils import CoalesceConfig, DEFAULT_AIOHTTP_COALESCE_CONFIG
+
+IDEMPOTENT_METHODS = frozenset((
+    hdrs.METH_GET, hdrs.METH_HEAD, hdrs.METH_OPTIONS, hdrs.METH_TRACE, hdrs.METH_PUT, hdrs.METH_DELETE,
+))
+
+
+class SingleFlight:
+    """
+    Deduplicate concurrent upstream fetches of identical requests.
+
+    The first request of a key starts the fetch in its own task, and the requests arriving with
+    the same key while it runs wait for the same result. A waiter going away, such as Scrapy
+    closing the loopback connection, does not cancel the fetch of the others.
+    """
+
+    def __init__(self, coalesce_config: CoalesceConfig | None = None):
+        config = {**DEFAULT_AIOHTTP_COALESCE_CONFIG, **(coalesce_config or {})}
+        methods = frozenset(method.upper() for method in config["methods"])
+        if not methods <= IDEMPOTENT_METHODS:
+            raise ValueError(f"Requests can not be coalesced for methods {', '.join(methods - IDEMPOTENT_METHODS)}.")
+        self.methods = methods
+        self.routes = tuple(re.compile(route) for route in config["routes"])
+        self.fetches: dict[str, asyncio.Task] = {}
+
+    def applies(self, method: str, url: str) -> bool:
+        """
+        Check whether requests with this method to this target URL are coalesced.
+        """
+        if method not in self.methods:
+            return False
+        return not self.routes or any(route.search(url) for route in self.routes)
+
+    async def run(self, key: str, fetch: Callable[[], Awaitable]) -> tuple[object, bool]:
+        """
+        Return the result of the fetch of a key, and whether it was shared with an earlier request.
+        """
+        task = self.fetches.get(key)
+        shared = task is not None
+        if task is None:
+            task = self.fetches[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(partial(self._done, key))
+        return await asyncio.shield(task), shared
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self.fetches.get(key) is task:
+            del self.fetches[key]
+        if not task.cancelled():
+            # Retrieve the exception, so it is not reported when every waiter went away.
+            task.exception()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import re
+
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import hdrs
+from cssselect import SelectorError
+from lxml import etree
+from multidict import CIMultiDict
+from parsel import Selector
+from parsel.csstranslator import HTMLTranslator
+from w3lib.encoding import html_to_unicode
+
+from scrapy_aiohttp.utils import ExtractConfig, DEFAULT_AIOHTTP_EXTRACT_CONFIG, EXTRACTED_SIZE_HEADER
+from .metrics import ProxyMetrics
+
+EXTRACT_TYPES = ("css", "xpath", "re")
+EXTRACTED_CONTENT_TYPE = "application/json"
+
+_css_translator = HTMLTranslator()
+
+
+class ExtractField:
+    """
+    A field of an extraction spec: a CSS selector, an XPath expression or a regular expression,
+    and whether every match is kept or only the first one.
+    """
+
+    __slots__ = ("kind", "query", "all_matches", "pattern")
+
+    def __init__(self, kind: str, query: str, all_matches: bool = False):
+        if kind not in EXTRACT_TYPES:
+            raise ValueError(f"Unsupported extraction type {kind!r}.")
+        if not isinstance(query, str):
+            raise ValueError(f"Invalid {kind} query {query!r}.")
+        self.kind = kind
+        self.query = query
+        self.all_matches = bool(all_matches)
+        self.pattern = None
+        try:
+            if kind == "css":
+                _css_translator.css_to_xpath(query)
+            elif kind == "xpath":
+                etree.XPath(query)
+            else:
+                self.pattern = re.compile(query)
+        except (SelectorError, etree.XPathSyntaxError, re.error) as e:
+            raise ValueError(f"Invalid {kind} query {query!r}: {e}") from e
+
+    @classmethod
+    def parse(cls, spec: str | dict) -> "ExtractField":
+        """
+        Parse a field given as "type:query" for its first match, or as {"type": ..., "query": ..., "all": ...}.
+        """
+        if isinstance(spec, str):
+            kind, _, query = spec.partition(":")
+            return cls(kind, query)
+        if isinstance(spec, dict):
+            try:
+                return cls(spec["type"], spec["query"], spec.get("all", False))
+            except KeyError as e:
+                raise ValueError(f"Missing {e} in extraction field {spec!r}.") from None
+        raise ValueError(f"Invalid extraction field {spec!r}.")
+
+    def extract(self, selector: Selector | None, text: str):
+        if self.pattern is not None:
+            if self.all_matches:
+                return [match.group(1 if self.pattern.groups else 0) for match in self.pattern.finditer(text)]
+            match = self.pattern.search(text)
+            return match.group(1 if self.pattern.groups else 0) if match is not None else None
+        selected = selector.css(self.query) if self.kind == "css" else selector.xpath(self.query)
+        return selected.getall() if self.all_matches else selected.get()
+
+
+def parse_extract_spec(value: str) -> dict[str, ExtractField]:
+    """
+    Parse the JSON object of an extraction header, mapping output fields to their queries.
+    """
+    try:
+        spec = json.loads(value)
+    except ValueError as e:
+        raise ValueError(f"Invalid extraction spec: {e}") from None
+    if not isinstance(spec, dict) or not spec:
+        raise ValueError("The extraction spec must be a non-empty JSON object.")
+    return {str(name): ExtractField.parse(field) for name, field in spec.items()}
+
+
+def extract(spec: dict[str, ExtractField], body: bytes, content_type: str | None = None) -> bytes:
+    """
+    Apply an extraction spec to a response body, returning the extracted values as a JSON document.
+
+    The document is parsed only when a field uses a CSS selector or an XPath expression.
+    """
+    _, text = html_to_unicode(content_type, body)
+    selector = None
+    if any(field.pattern is None for field in spec.values()):
+        selector = Selector(text=text)
+    result = {name: field.extract(selector, text) for name, field in spec.items()}
+    return json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class ResponseExtractor:
+    """
+    Replaces response bodies by the values extracted from them, so only those are sent back to Scrapy.
+
+    Extraction runs in a pool of threads, outside of the event loop; lxml releases the GIL
+    while it parses, and the server workers spread extraction over more cores. Only successful
+    responses with a decoded body are extracted, the others are sent back as they are.
+    """
+
+    def __init__(self, extract_config: ExtractConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_EXTRACT_CONFIG, **(extract_config or {})}
+        self.workers = max(1, config["workers"])
+        # Created in the server worker, since the extractor is sent to spawned workers.
+        self._executor: ThreadPoolExecutor | None = None
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("extractions_total", "counter", "Responses replaced by the values extracted from them.")
+            metrics.describe("extract_bytes_saved_total", "counter", "Body bytes not sent back thanks to extraction.")
+
+    async def apply(
+            self, spec: dict[str, ExtractField], status: int, headers: CIMultiDict, body: bytes
+    ) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Extract the values of a response, answering with their JSON document.
+        """
+        if not 200 <= status < 300 or hdrs.CONTENT_ENCODING in headers:
+            return status, headers, body
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="AiohttpExtract")
+        loop = asyncio.get_running_loop()
+        extracted = await loop.run_in_executor(self._executor, extract, spec, body, headers.get(hdrs.CONTENT_TYPE))
+        headers = headers.copy()
+        headers[hdrs.CONTENT_TYPE] = EXTRACTED_CONTENT_TYPE
+        headers[EXTRACTED_SIZE_HEADER] = str(len(body))
+        if self.metrics is not None:
+            self.metrics.inc("extractions_total")
+            self.metrics.inc("extract_bytes_saved_total", max(0, len(body) - len(extracted)))
+        return status, headers, extracted
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,200 @@
+import bisect
+import hashlib
+import http.client
+import logging
+import socket
+import threading
+import time
+
+from urllib.parse import urlsplit
+
+from scrapy_aiohttp.utils import FarmConfig, DEFAULT_AIOHTTP_FARM_CONFIG
+from .utils.loopback import get_unix_path, get_request_route_url, get_loopback_url
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring of server URLs, with several points per server.
+
+    Removing a server only moves the keys it owned, to the servers following its points,
+    and adding one only takes keys from the others.
+    """
+
+    def __init__(self, keys: list[str], replicas: int = 160):
+        points = sorted((_hash(f"{key}#{replica}"), key) for key in keys for replica in range(replicas))
+        self._hashes = [point for point, _ in points]
+        self._keys = [key for _, key in points]
+
+    def iter_keys(self, key: str):
+        """
+        Iterate over the distinct servers from the point of a key onwards, its owner first.
+        """
+        start = bisect.bisect(self._hashes, _hash(key))
+        seen = set()
+        for index in range(start, start + len(self._keys)):
+            owner = self._keys[index % len(self._keys)]
+            if owner not in seen:
+                seen.add(owner)
+                yield owner
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self._path)
+
+
+def get_http_connection(server_url: str, timeout: float) -> http.client.HTTPConnection:
+    """
+    Get a blocking HTTP connection to a server, on its unix domain socket or over TCP.
+    """
+    path = get_unix_path(server_url)
+    if path is not None:
+        return _UnixHTTPConnection(path, timeout)
+    parsed_url = urlsplit(server_url)
+    return http.client.HTTPConnection(parsed_url.hostname, parsed_url.port, timeout=timeout)
+
+
+def check_health(server_url: str, timeout: float) -> bool:
+    """
+    Check that a server answers its health route.
+    """
+    connection = get_http_connection(server_url, timeout)
+    try:
+        connection.request("GET", "/health")
+        return connection.getresponse().status == 200
+    except (OSError, http.client.HTTPException):
+        return False
+    finally:
+        connection.close()
+
+
+class ServerNode:
+    """
+    A server of the farm, with the URLs of the loopback requests sent to it and its health.
+    """
+
+    __slots__ = ("server_url", "request_route_url", "request_url_prefix", "failures", "ejected_until")
+
+    def __init__(self, server_url: str):
+        self.server_url = server_url
+        self.request_route_url = get_request_route_url(server_url)
+        self.request_url_prefix = f"{self.request_route_url}/"
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    @property
+    def ejected(self) -> bool:
+        return time.monotonic() < self.ejected_until
+
+
+class ServerFarm:
+    """
+    Servers sharing the aiohttp requests of a crawl, routed by consistent hashing on the target host.
+
+    Each target host stays on one server, so its keep-alive connections, cache and throttling
+    state stay there too. A server whose loopback requests fail several times in a row, or
+    which fails a health check, is ejected and its hosts move to the next servers on the ring
+    until a health check passes again. When every server is ejected, requests go to the owner
+    of their host anyway.
+    """
+
+    def __init__(self, server_urls: list[str], farm_config: FarmConfig | None = None):
+        config = {**DEFAULT_AIOHTTP_FARM_CONFIG, **(farm_config or {})}
+        server_urls = list(dict.fromkeys(server_urls))
+        if not server_urls:
+            raise ValueError("A server farm needs at least one server URL.")
+        self.nodes = {server_url: ServerNode(server_url) for server_url in server_urls}
+        self._routes = {node.request_route_url: node for node in self.nodes.values()}
+        # Hosts of the loopback URLs, which are the download slots of requests without a per-site slot.
+        self.hosts = frozenset(urlsplit(get_loopback_url(server_url)).hostname for server_url in server_urls)
+        self._ring = HashRing(server_urls, config["replicas"])
+        self.max_failures = config["max_failures"]
+        self.ejection_time = config["ejection_time"]
+        self.health_check_interval = config["health_check_interval"]
+        self.health_check_timeout = config["health_check_timeout"]
+        self._stopping = threading.Event()
+        self._health_checker: threading.Thread | None = None
+
+    def route(self, host: str) -> ServerNode:
+        """
+        Get the server of a target host: its owner on the ring, or the next server that is not ejected.
+        """
+        owner = None
+        for server_url in self._ring.iter_keys(host):
+            node = self.nodes[server_url]
+            if not node.ejected:
+                return node
+            owner = owner or node
+        return owner
+
+    def get_node(self, request_route_url: str | None) -> ServerNode | None:
+        """
+        Get the server a loopback request was sent to from its target URL.
+        """
+        return self._routes.get(request_route_url)
+
+    def record_success(self, node: ServerNode):
+        node.failures = 0
+
+    def record_failure(self, node: ServerNode) -> bool:
+        """
+        Count a failed loopback request to a server, returning whether the server is ejected.
+        """
+        node.failures += 1
+        if node.failures >= self.max_failures and not node.ejected:
+            self._eject(node)
+        return node.ejected
+
+    def _eject(self, node: ServerNode):
+        node.ejected_until = time.monotonic() + self.ejection_time
+        logging.warning(f"Server {node.server_url} was ejected from the server farm.")
+
+    def _restore(self, node: ServerNode):
+        node.failures = 0
+        if node.ejected:
+            node.ejected_until = 0.0
+            logging.info(f"Server {node.server_url} is back in the server farm.")
+
+    def check_health(self):
+        """
+        Check every server, ejecting the ones failing the check and restoring the ones passing it.
+        """
+        for node in self.nodes.values():
+            if check_health(node.server_url, self.health_check_timeout):
+                self._restore(node)
+            elif not node.ejected:
+                node.failures = max(node.failures, self.max_failures)
+                self._eject(node)
+
+    def start(self):
+        """
+        Start checking the health of the servers in a background thread.
+        """
+        if self._health_checker is not None or self.health_check_interval <= 0:
+            return
+        self._stopping.clear()
+        self._health_checker = threading.Thread(
+            target=self._run_health_checks, name="AiohttpServerFarmHealthCheck", daemon=True
+        )
+        self._health_checker.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._health_checker is not None:
+            self._health_checker.join()
+            self._health_checker = None
+
+    def _run_health_checks(self):
+        while not self._stopping.wait(self.health_check_interval):
+            self.check_health()
@@ -0,0 +1,210 @@
+import asyncio
+import inspect
+from time import time
+
+from aiohttp import ClientSession, ClientTimeout, ClientConnectionError, ServerTimeoutError
+from multidict import CIMultiDict, CIMultiDictProxy
+from scrapy import Request
+from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+from scrapy.crawler import Crawler
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.defer import deferred_from_coro, maybe_deferred_to_future
+from scrapy.utils.reactor import is_asyncio_reactor_installed
+from twisted.internet import defer
+from twisted.internet.error import ConnectError, TimeoutError
+
+from scrapy_aiohttp.utils import (
+    RequestHeaders,
+    ConnectorConfig,
+    AsyncioReactorNotInstalledError,
+    SettingVariableNotFoundError,
+    MaxSizeExceededError,
+    HeaderPlan,
+    read_body,
+)
+from .request import AiohttpRequest
+from .sessions import create_client_session
+from .settings import get_connector_config
+
+
+class RequestView:
+    """
+    Minimal stand-in for aiohttp.web.Request passed to AIOHTTP_REQUEST_HEADERS_CONFIG callables.
+    """
+
+    def __init__(self, request: Request):
+        self.method = request.method
+        self.url = request.url
+        self.match_info = {"url": request.url}
+        self.headers = CIMultiDictProxy(CIMultiDict(
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, values in request.headers.items()
+            for value in values
+        ))
+
+
+class AiohttpDownloadHandler:
+    """
+    Scrapy download handler sending aiohttp requests in-process, on the asyncio reactor.
+
+    Requests that are not aiohttp requests are downloaded by the default HTTP handler.
+    """
+
+    lazy = False
+
+    def __init__(
+            self,
+            crawler: Crawler,
+            aiohttp_request_headers_config: RequestHeaders,
+            connector_config: ConnectorConfig | None = None,
+    ):
+        if not is_asyncio_reactor_installed():
+            raise AsyncioReactorNotInstalledError()
+        self.crawler = crawler
+        self.request_headers_config = aiohttp_request_headers_config
+        self._header_plan = HeaderPlan(aiohttp_request_headers_config)
+        self.connector_config = connector_config
+        self.default_timeout = crawler.settings.getfloat("DOWNLOAD_TIMEOUT")
+        self.default_maxsize = crawler.settings.getint("DOWNLOAD_MAXSIZE")
+        self.default_warnsize = crawler.settings.getint("DOWNLOAD_WARNSIZE")
+        self._client_session: ClientSession | None = None
+        self._fallback = HTTP11DownloadHandler.from_crawler(crawler)
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        settings = crawler.settings
+        aiohttp_request_headers_config = settings.get("AIOHTTP_REQUEST_HEADERS_CONFIG")
+
+        if aiohttp_request_headers_config is None:
+            raise SettingVariableNotFoundError("AIOHTTP_REQUEST_HEADERS_CONFIG")
+
+        return cls(
+            crawler,
+            aiohttp_request_headers_config,
+            connector_config=get_connector_config(settings),
+        )
+
+    @staticmethod
+    def is_aiohttp_request(request: Request) -> bool:
+        return isinstance(request, AiohttpRequest) or request.meta.get("aiohttp") is True
+
+    def download_request(self, request: Request, spider) -> defer.Deferred:
+        """Download aiohttp requests with aiohttp and everything else with the default handler."""
+
+        if not self.is_aiohttp_request(request):
+            return deferred_from_coro(self._await(self._fallback_download(request, spider)))
+        return deferred_from_coro(self._download_request(request))
+
+    def _fallback_download(self, request: Request, spider):
+        if inspect.iscoroutinefunction(self._fallback.download_request):
+            return self._fallback.download_request(request)
+        return self._fallback.download_request(request, spider)
+
+    @staticmethod
+    async def _await(result):
+        """Await a coroutine or a Deferred returned by the default handler."""
+
+        if isinstance(result, defer.Deferred):
+            return await maybe_deferred_to_future(result)
+        return await result
+
+    def _get_client_session(self) -> ClientSession:
+        if self._client_session is None:
+            # The compressed body is kept so HttpCompressionMiddleware decompresses it once.
+            self._client_session = create_client_session(self.connector_config, auto_decompress=False)
+        return self._client_session
+
+    @staticmethod
+    def _get_proxy_options(request: Request, request_headers: CIMultiDict) -> dict:
+        """
+        Get the aiohttp options of the proxy set by HttpProxyMiddleware, used as the default handler uses it.
+
+        Its Proxy-Authorization header goes in the CONNECT request of HTTPS targets, and with
+        the request itself, which is sent to the proxy, for HTTP targets.
+        """
+        proxy = request.meta.get("proxy")
+        if not proxy:
+            return {}
+        options = {"proxy": proxy}
+        proxy_authorization = request.headers.get(b"Proxy-Authorization")
+        if proxy_authorization:
+            value = proxy_authorization.decode("latin-1")
+            if urlparse_cached(request).scheme == "https":
+                options["proxy_headers"] = {"Proxy-Authorization": value}
+            else:
+                request_headers["Proxy-Authorization"] = value
+        return options
+
+    @staticmethod
+    def _get_cookie_options(request: Request, request_headers: CIMultiDict) -> dict:
+        """
+        Get the aiohttp options sending the cookies of a request.
+
+        The Cookie header set by CookiesMiddleware is sent as is, and already holds the cookies of
+        the request; without it, the cookies of the request are passed to aiohttp, as the server does.
+        """
+        cookie = request.headers.get(b"Cookie")
+        if cookie:
+            request_headers["Cookie"] = cookie.decode("latin-1")
+            return {}
+        cookies = request.cookies
+        if isinstance(cookies, list):
+            cookies = {cookie["name"]: cookie["value"] for cookie in cookies}
+        if not cookies:
+            return {}
+        return {"cookies": {str(name): str(value) for name, value in cookies.items()}}
+
+    async def _download_request(self, request: Request) -> Response:
+        session = self._get_client_session()
+        request_headers = self._header_plan.build(RequestView(request))
+        proxy_options = self._get_proxy_options(request, request_headers)
+        cookie_options = self._get_cookie_options(request, request_headers)
+        timeout = ClientTimeout(total=request.meta.get("download_timeout", self.default_timeout))
+        maxsize = request.meta.get("download_maxsize", self.default_maxsize)
+        warnsize = request.meta.get("download_warnsize", self.default_warnsize)
+        start_time = time()
+        try:
+            async with session.request(
+                    request.method,
+                    request.url,
+                    headers=request_headers,
+                    data=request.body or None,
+                    allow_redirects=False,
+                    timeout=timeout,
+                    **proxy_options,
+                    **cookie_options,
+            ) as response:
+                request.meta["download_latency"] = time() - start_time
+                body = await read_body(response, maxsize=maxsize, warnsize=warnsize)
+        except MaxSizeExceededError as e:
+            raise defer.CancelledError(str(e)) from e
+        except (asyncio.TimeoutError, ServerTimeoutError) as e:
+            raise TimeoutError(f"Getting {request.url} took longer than {timeout.total} seconds.") from e
+        except ClientConnectionError as e:
+            raise ConnectError(string=str(e)) from e
+
+        headers = Headers(response.raw_headers)
+        respcls = responsetypes.from_args(headers=headers, url=request.url, body=body)
+        return respcls(
+            url=request.url,
+            status=response.status,
+            headers=headers,
+            body=body,
+            request=request,
+            protocol=f"HTTP/{response.version.major}.{response.version.minor}",
+        )
+
+    def close(self) -> defer.Deferred:
+        return deferred_from_coro(self._close())
+
+    async def _close(self):
+        if self._client_session is not None:
+            await self._client_session.close()
+            self._client_session = None
+        close = getattr(self._fallback, "close", None)
+        if close is not None:
+            result = close()
+            if result is not None:
+                await self._await(result)
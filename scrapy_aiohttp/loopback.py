@@ -0,0 +1,113 @@
+import asyncio
+from time import time
+
+from aiohttp import ClientSession, ClientTimeout, ClientConnectionError, ServerTimeoutError, UnixConnector
+from scrapy import Request
+from scrapy.crawler import Crawler
+from scrapy.http import Headers, Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.reactor import is_asyncio_reactor_installed
+from twisted.internet import defer
+from twisted.internet.error import ConnectError, TimeoutError
+
+from scrapy_aiohttp.utils import AsyncioReactorNotInstalledError, MaxSizeExceededError, read_body
+from .utils.loopback import get_unix_path, split_loopback_url
+
+
+def create_loopback_session(server_url: str, **kwargs) -> ClientSession:
+    """
+    Create a ClientSession reaching the server, over its unix domain socket for a unix:// URL.
+    """
+    path = get_unix_path(server_url)
+    if path is not None:
+        kwargs["connector"] = UnixConnector(path=path)
+    return ClientSession(**kwargs)
+
+
+class LoopbackDownloadHandler:
+    """
+    Scrapy download handler sending the loopback requests to a server listening on a unix
+    domain socket.
+
+    AiohttpMiddleware rewrites requests to http+unix URLs when AIOHTTP_SERVER_URL is a unix://
+    URL; this handler must be set for that scheme in DOWNLOAD_HANDLERS. Requires the asyncio reactor.
+    """
+
+    lazy = False
+
+    def __init__(self, crawler: Crawler):
+        if not is_asyncio_reactor_installed():
+            raise AsyncioReactorNotInstalledError()
+        self.crawler = crawler
+        self.default_timeout = crawler.settings.getfloat("DOWNLOAD_TIMEOUT")
+        self.default_maxsize = crawler.settings.getint("DOWNLOAD_MAXSIZE")
+        self.default_warnsize = crawler.settings.getint("DOWNLOAD_WARNSIZE")
+        self._client_sessions: dict[str, ClientSession] = {}
+
+    @classmethod
+    def from_crawler(cls, crawler: Crawler):
+        return cls(crawler)
+
+    def download_request(self, request: Request, spider) -> defer.Deferred:
+        return deferred_from_coro(self._download_request(request))
+
+    def _get_client_session(self, path: str) -> ClientSession:
+        session = self._client_sessions.get(path)
+        if session is None:
+            # The body compressed by the server is kept for HttpCompressionMiddleware.
+            session = self._client_sessions[path] = create_loopback_session(
+                f"unix://{path}", auto_decompress=False
+            )
+        return session
+
+    async def _download_request(self, request: Request) -> Response:
+        path, url = split_loopback_url(request.url)
+        session = self._get_client_session(path)
+        headers = [
+            (name.decode("latin-1"), value.decode("latin-1"))
+            for name, values in request.headers.items()
+            for value in values
+        ]
+        timeout = ClientTimeout(total=request.meta.get("download_timeout", self.default_timeout))
+        maxsize = request.meta.get("download_maxsize", self.default_maxsize)
+        warnsize = request.meta.get("download_warnsize", self.default_warnsize)
+        start_time = time()
+        try:
+            async with session.request(
+                    request.method,
+                    url,
+                    headers=headers,
+                    data=request.body or None,
+                    allow_redirects=False,
+                    timeout=timeout,
+            ) as response:
+                request.meta["download_latency"] = time() - start_time
+                body = await read_body(response, maxsize=maxsize, warnsize=warnsize)
+        except MaxSizeExceededError as e:
+            raise defer.CancelledError(str(e)) from e
+        except (asyncio.TimeoutError, ServerTimeoutError) as e:
+            raise TimeoutError(f"Getting {request.url} took longer than {timeout.total} seconds.") from e
+        except ClientConnectionError as e:
+            raise ConnectError(string=str(e)) from e
+
+        response_headers = Headers()
+        for name, value in response.raw_headers:
+            response_headers.appendlist(name, value)
+        respcls = responsetypes.from_args(headers=response_headers, url=request.url, body=body)
+        return respcls(
+            url=request.url,
+            status=response.status,
+            headers=response_headers,
+            body=body,
+            request=request,
+            protocol=f"HTTP/{response.version.major}.{response.version.minor}",
+        )
+
+    def close(self) -> defer.Deferred:
+        return deferred_from_coro(self._close())
+
+    async def _close(self):
+        sessions, self._client_sessions = self._client_sessions, {}
+        for session in sessions.values():
+            await session.close()
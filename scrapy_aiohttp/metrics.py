@@ -0,0 +1,274 @@
+import time
+
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Iterable
+
+from aiohttp import TraceConfig
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+PREFIX = "scrapy_aiohttp_"
+
+
+class RequestTimings:
+    """
+    Timestamps of one proxied request, filled by the timing middleware and the trace callbacks.
+    """
+
+    __slots__ = (
+        "start", "upstream_start", "dns_start", "dns", "connect_start", "connect",
+        "headers", "end", "reused",
+    )
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.upstream_start = None
+        self.dns_start = None
+        self.dns = None
+        self.connect_start = None
+        self.connect = None
+        self.headers = None
+        self.end = None
+        self.reused = None
+
+    def phases(self) -> dict[str, float]:
+        """
+        Durations in seconds of the phases that happened so far.
+
+        queue: from the request arriving at the server to the upstream request start.
+        dns, connect: name resolution and connection setup, the latter including the TLS handshake.
+        ttfb: from the upstream request start to the response headers.
+        body: from the response headers to the end of the body.
+        total: from the request arriving at the server to the end of the body.
+        """
+        phases = {}
+        if self.upstream_start is not None:
+            phases["queue"] = self.upstream_start - self.start
+        if self.dns is not None:
+            phases["dns"] = self.dns
+        if self.connect is not None:
+            phases["connect"] = self.connect
+        if self.headers is not None and self.upstream_start is not None:
+            phases["ttfb"] = self.headers - self.upstream_start
+        if self.end is not None and self.headers is not None:
+            phases["body"] = self.end - self.headers
+        if self.end is not None:
+            phases["total"] = self.end - self.start
+        return phases
+
+    def header_value(self) -> str:
+        """
+        Format the phases in the Server-Timing syntax, with durations in milliseconds.
+        """
+        return ", ".join(f"{name};dur={duration * 1000:.3f}" for name, duration in self.phases().items())
+
+
+def parse_timings(value: str) -> dict[str, float]:
+    """
+    Parse a timings header value back into phase durations in seconds.
+    """
+    timings = {}
+    for item in value.split(","):
+        name, _, params = item.strip().partition(";")
+        if not params.startswith("dur="):
+            continue
+        try:
+            timings[name] = float(params[4:]) / 1000
+        except ValueError:
+            continue
+    return timings
+
+
+current_timings: ContextVar[RequestTimings | None] = ContextVar("current_timings", default=None)
+
+
+class Histogram:
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class ProxyMetrics:
+    """
+    In-process counters, gauges and histograms of the server, rendered in the Prometheus text format.
+
+    Every server worker process keeps its own metrics; with several workers, each series gets the
+    constant worker label and a scrape collects the series of all workers.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.labels: dict[str, str] = {}
+        self.descriptions: dict[str, tuple[str, str]] = {}
+        self.values: dict[str, dict[tuple, float]] = {}
+        self.histograms: dict[str, dict[tuple, Histogram]] = {}
+        self.describe("requests_total", "counter", "Requests handled by the server.")
+        self.describe("upstream_errors_total", "counter", "Upstream requests that failed without a response.")
+        self.describe("bytes_in_total", "counter", "Body bytes received from target servers.")
+        self.describe("bytes_out_total", "counter", "Body bytes sent back to Scrapy.")
+        self.describe("connections_created_total", "counter", "Upstream connections opened.")
+        self.describe("connections_reused_total", "counter", "Upstream requests sent on a pooled connection.")
+        self.describe("connection_reuse_ratio", "gauge", "Share of upstream requests sent on a pooled connection.")
+        self.describe("requests_in_progress", "gauge", "Requests being handled by the server.")
+        self.describe("upstream_requests_in_progress", "gauge", "Upstream requests holding a connection.")
+        self.describe("batch_items_total", "counter", "Requests handled as part of a batch.")
+        self.describe("coalesced_requests_total", "counter", "Requests answered by the fetch of an identical request.")
+        self.describe("phase_seconds", "histogram", "Duration of the phases of proxied requests.")
+
+    def describe(self, name: str, metric_type: str, help_text: str):
+        self.descriptions[name] = (metric_type, help_text)
+        if metric_type == "histogram":
+            self.histograms.setdefault(name, {})
+        else:
+            self.values.setdefault(name, {})
+
+    @staticmethod
+    def _key(labels: dict) -> tuple:
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        values = self.values[name]
+        key = self._key(labels)
+        values[key] = values.get(key, 0.0) + value
+
+    def set(self, name: str, value: float, **labels):
+        self.values[name][self._key(labels)] = value
+
+    def get(self, name: str, **labels) -> float:
+        return self.values[name].get(self._key(labels), 0.0)
+
+    def observe(self, name: str, value: float, **labels):
+        histograms = self.histograms[name]
+        key = self._key(labels)
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = Histogram(self.buckets)
+        histogram.observe(value)
+
+    def observe_timings(self, timings: RequestTimings):
+        for phase, duration in timings.phases().items():
+            self.observe("phase_seconds", duration, phase=phase)
+
+    def create_trace_config(self) -> TraceConfig:
+        """
+        Create the aiohttp TraceConfig filling the RequestTimings passed as trace_request_ctx.
+        """
+        trace_config = TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_dns_resolvehost_start.append(self._on_dns_start)
+        trace_config.on_dns_resolvehost_end.append(self._on_dns_end)
+        trace_config.on_connection_create_start.append(self._on_connection_create_start)
+        trace_config.on_connection_create_end.append(self._on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(self._on_connection_reuseconn)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    @staticmethod
+    def _timings(trace_config_ctx) -> RequestTimings | None:
+        timings = trace_config_ctx.trace_request_ctx
+        return timings if isinstance(timings, RequestTimings) else None
+
+    async def _on_request_start(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None and timings.upstream_start is None:
+            timings.upstream_start = time.monotonic()
+        self.inc("upstream_requests_in_progress")
+
+    async def _on_dns_start(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None:
+            timings.dns_start = time.monotonic()
+
+    async def _on_dns_end(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None and timings.dns_start is not None:
+            timings.dns = (timings.dns or 0.0) + time.monotonic() - timings.dns_start
+
+    async def _on_connection_create_start(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None:
+            timings.connect_start = time.monotonic()
+
+    async def _on_connection_create_end(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None and timings.connect_start is not None:
+            # The connection phase includes DNS resolution, which is reported on its own.
+            connect = time.monotonic() - timings.connect_start - (timings.dns or 0.0)
+            timings.connect = (timings.connect or 0.0) + max(0.0, connect)
+            timings.reused = False
+        self.inc("connections_created_total")
+
+    async def _on_connection_reuseconn(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None:
+            timings.reused = True
+        self.inc("connections_reused_total")
+
+    async def _on_request_end(self, session, trace_config_ctx, params):
+        timings = self._timings(trace_config_ctx)
+        if timings is not None:
+            timings.headers = time.monotonic()
+        self.inc("upstream_requests_in_progress", -1)
+
+    async def _on_request_exception(self, session, trace_config_ctx, params):
+        self.inc("upstream_errors_total")
+        self.inc("upstream_requests_in_progress", -1)
+
+    def _update_gauges(self):
+        reused = self.get("connections_reused_total")
+        total = reused + self.get("connections_created_total")
+        self.set("connection_reuse_ratio", reused / total if total else 0.0)
+
+    def _format_labels(self, key: tuple, extra: tuple = ()) -> str:
+        labels = key + tuple(self.labels.items()) + extra
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+    def samples(self) -> dict[str, list[str]]:
+        """
+        Get the sample lines of every metric in the Prometheus text exposition format, by metric name.
+        """
+        self._update_gauges()
+        samples = {}
+        for name, (metric_type, _) in self.descriptions.items():
+            full_name = PREFIX + name
+            lines = samples[name] = []
+            if metric_type != "histogram":
+                for key, value in self.values[name].items():
+                    lines.append(f"{full_name}{self._format_labels(key)} {value:g}")
+                continue
+            for key, histogram in self.histograms[name].items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    lines.append(f"{full_name}_bucket{self._format_labels(key, (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{self._format_labels(key)} {histogram.sum:g}")
+                lines.append(f"{full_name}_count{self._format_labels(key)} {histogram.count}")
+        return samples
+
+    def render(self, others: Iterable[dict[str, list[str]]] = ()) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format,
+        followed by the samples of the other workers for each metric.
+        """
+        samples = [self.samples(), *others]
+        lines = []
+        for name, (metric_type, help_text) in self.descriptions.items():
+            full_name = PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {metric_type}")
+            for worker_samples in samples:
+                lines.extend(worker_samples.get(name, ()))
+        return "\n".join(lines) + "\n"
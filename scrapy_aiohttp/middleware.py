@@ -1,32 +1,113 @@
-from urllib.parse import urljoin
+import json
 
-from scrapy import Request
+from urllib.parse import urlparse
+
+from scrapy import Request, signals
 from scrapy.http import Response
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.httpobj import urlparse_cached
 from scrapy.crawler import Crawler
+from twisted.internet.error import ConnectError, ConnectionLost
+from twisted.web.client import ResponseNeverReceived
 
 from scrapy_aiohttp.utils import (
     RequestHeaders,
+    FarmConfig,
+    PrewarmConfig,
     ServerNotAliveError,
-    SettingVariableNotFoundError
+    SettingVariableNotFoundError,
+    DEFAULT_CHUNK_SIZE,
+    COOKIES_HEADER,
+    TIMEOUT_HEADER,
+    ALLOW_REDIRECTS_HEADER,
+    PROXY_HEADER,
+    EXTRACT_HEADER,
+    SESSION_HEADER,
+    URL_HEADER,
+    HOST_DELAY_HEADER,
+    TIMINGS_HEADER,
+    CACHE_HEADER,
+    EXTRACTED_SIZE_HEADER,
 )
+from .farm import ServerFarm
+from .metrics import parse_timings
+from .prewarm import PrewarmQueue
 from .request import AiohttpRequest
 from .server import AiohttpServer
+from .settings import (
+    get_connector_config,
+    get_throttle_config,
+    get_cache_config,
+    get_coalesce_config,
+    get_timeout_config,
+    get_retry_config,
+    get_hedge_config,
+    get_proxy_config,
+    get_farm_config,
+    get_prewarm_config,
+    get_extract_config,
+    get_admission_config,
+    get_session_config,
+)
+from .slots import get_slot_policy
+from .utils.loopback import LOOPBACK_UNIX_SCHEME, get_loopback_url, get_unix_path, join_route
+
+
+# Errors of loopback requests that count as failures of the server they were sent to.
+SERVER_FAILURES = (ConnectError, ConnectionLost, ResponseNeverReceived)
 
 
 class AiohttpMiddleware:
     """Middleware for integrating aiohttp with Scrapy."""
 
     _server: AiohttpServer | None = None
+    _farm: ServerFarm | None = None
+    _prewarm: PrewarmQueue | None = None
 
-    def __init__(self, server_url, aiohttp_request_headers_config):
+    def __init__(
+            self,
+            server_url,
+            aiohttp_request_headers_config,
+            server_options: dict | None = None,
+            crawler: Crawler | None = None,
+            download_slot_policy="host",
+            farm_config: FarmConfig | None = None,
+            prewarm_config: PrewarmConfig | None = None,
+    ):
         self.server_url = server_url
+        self.crawler = crawler
+        self._get_download_slot = get_slot_policy(download_slot_policy)
+        if server_url is not None:
+            self.loopback_url = get_loopback_url(server_url)
+            self._server_host = urlparse(self.loopback_url).hostname
+            # Every aiohttp request is sent to the request route, followed by its own URL.
+            self._request_route_url = self._convert_url("/request", "").rstrip("/")
+            self._request_url_prefix = f"{self._request_route_url}/"
+        elif farm_config is None:
+            raise ValueError("Either 'server_url' or a server farm configuration must be specified.")
+        else:
+            self.loopback_url = self._server_host = self._request_route_url = self._request_url_prefix = None
+
+        if farm_config is not None:
+            server_urls = [server_url, *farm_config["server_urls"]] if server_url is not None else \
+                farm_config["server_urls"]
+            self._farm = ServerFarm(server_urls, farm_config)
+            self._farm.start()
+            if crawler is not None:
+                crawler.signals.connect(self._farm.stop, signal=signals.engine_stopped)
+
+        if prewarm_config is not None:
+            self._prewarm = PrewarmQueue(prewarm_config)
+            if crawler is not None:
+                crawler.signals.connect(self._prewarm_request, signal=signals.request_scheduled)
+                crawler.signals.connect(self._prewarm.stop, signal=signals.engine_stopped)
 
-        if self._server is None:
-            self.__run_server(server_url, aiohttp_request_headers_config)
+        if server_url is not None and self._server is None:
+            self.__run_server(server_url, aiohttp_request_headers_config, server_options or {})
 
     @classmethod
-    def __run_server(cls, server_url, aiohttp_request_headers_config: RequestHeaders):
-        cls._server = AiohttpServer(server_url=server_url)
+    def __run_server(cls, server_url, aiohttp_request_headers_config: RequestHeaders, server_options: dict):
+        cls._server = AiohttpServer(server_url=server_url, **server_options)
         cls._server.extract_request_header_config(aiohttp_request_headers_config)
         cls._server.run()
 
@@ -42,61 +123,263 @@ class AiohttpMiddleware:
         settings = crawler.settings
         server_url = settings.get("AIOHTTP_SERVER_URL")
         aiohttp_request_headers_config = settings.get("AIOHTTP_REQUEST_HEADERS_CONFIG")
+        farm_config = get_farm_config(settings)
+        proxy_config = get_proxy_config(settings)
+        # Connections of requests sent through upstream proxies are opened to the proxies, not to the targets.
+        prewarm_config = get_prewarm_config(settings) if proxy_config is None else None
 
-        if server_url is None:
+        if server_url is None and farm_config is None:
             raise SettingVariableNotFoundError("AIOHTTP_SERVER_URL")
         if aiohttp_request_headers_config is None:
             raise SettingVariableNotFoundError("AIOHTTP_REQUEST_HEADERS_CONFIG")
+        server_urls = [server_url] if server_url is not None else []
+        if farm_config is not None:
+            server_urls.extend(farm_config["server_urls"])
+        if any(get_unix_path(url) is not None for url in server_urls) and \
+                not settings.getwithbase("DOWNLOAD_HANDLERS").get(LOOPBACK_UNIX_SCHEME):
+            raise SettingVariableNotFoundError(f"DOWNLOAD_HANDLERS['{LOOPBACK_UNIX_SCHEME}']")
 
         return cls(
             server_url,
             aiohttp_request_headers_config,
+            server_options={
+                "connector_config": get_connector_config(settings),
+                "stream_responses": settings.getbool("AIOHTTP_STREAM_RESPONSES"),
+                "chunk_size": settings.getint("AIOHTTP_STREAM_CHUNK_SIZE", DEFAULT_CHUNK_SIZE),
+                "maxsize": settings.getint("DOWNLOAD_MAXSIZE"),
+                "warnsize": settings.getint("DOWNLOAD_WARNSIZE"),
+                "workers": settings.getint("AIOHTTP_SERVER_WORKERS", 1),
+                "health_check_interval": settings.getfloat("AIOHTTP_SERVER_HEALTH_CHECK_INTERVAL", 1.0),
+                "startup_timeout": settings.getfloat("AIOHTTP_SERVER_STARTUP_TIMEOUT", 10.0),
+                "start_method": settings.get("AIOHTTP_SERVER_START_METHOD"),
+                "decompress": not settings.getbool("AIOHTTP_DECOMPRESS_PASSTHROUGH"),
+                "loopback_compression": settings.get("AIOHTTP_LOOPBACK_COMPRESSION"),
+                "loopback_compression_min_size": settings.getint("AIOHTTP_LOOPBACK_COMPRESSION_MIN_SIZE", 1024),
+                "throttle_config": get_throttle_config(settings),
+                "metrics": settings.getbool("AIOHTTP_METRICS_ENABLED"),
+                "cache_config": get_cache_config(settings),
+                "coalesce_config": get_coalesce_config(settings),
+                "timeout_config": get_timeout_config(settings),
+                "retry_config": get_retry_config(settings),
+                "hedge_config": get_hedge_config(settings),
+                "proxy_config": proxy_config,
+                "prewarm_config": prewarm_config,
+                "extract_config": get_extract_config(settings),
+                "admission_config": get_admission_config(settings),
+                "session_config": get_session_config(settings),
+            },
+            crawler=crawler,
+            download_slot_policy=settings.get("AIOHTTP_DOWNLOAD_SLOT_POLICY", "host"),
+            farm_config=farm_config,
+            prewarm_config=prewarm_config,
         )
 
     def process_request(self, request: AiohttpRequest | Request, spider) -> AiohttpRequest | None:
         """Process the Scrapy request and convert it to an AiohttpRequest."""
 
-        if request.meta.get("_original_url"):
+        meta = request.meta
+        if meta.get("_original_url"):
+            # Requests converted earlier, e.g. retried ones, move away from an ejected server.
+            return self._reroute(request) if self._farm is not None else None
+        if not isinstance(request, AiohttpRequest) and meta.get("aiohttp") is not True:
             return
-        elif request.meta.get("aiohttp") is True:
-            request = self._convert_request(request)
 
-        if not isinstance(request, AiohttpRequest):
+        if self._farm is None:
+            route_url, url_prefix = self._request_route_url, self._request_url_prefix
+        else:
+            node = self._farm.route(self._get_route_key(meta, urlparse_cached(request).hostname))
+            route_url, url_prefix = node.request_route_url, node.request_url_prefix
+        new_request = self._convert_request(request, url_prefix + request.url.lstrip("/"))
+        new_meta = {"_original_url": request.url, "_target_url": route_url}
+        if self._get_download_slot is not None and "download_slot" not in meta:
+            new_meta["download_slot"] = self._get_download_slot(request)
+        new_request.meta.update(new_meta)
+        new_request.headers.update(self._get_control_headers(new_request))
+        return new_request
+
+    def _prewarm_request(self, request: Request, spider):
+        """
+        Ask the server of a newly scheduled aiohttp request to warm connections to its target,
+        while the request waits in the scheduler.
+
+        Requests with their own proxy in `meta["proxy"]` do not connect to their target, and
+        requests of a named session connect through the connection pool of their session.
+        """
+        meta = request.meta
+        if meta.get("_original_url") or meta.get("proxy") or meta.get("aiohttp_session") or \
+                not isinstance(request, AiohttpRequest) and meta.get("aiohttp") is not True:
             return
+        if self._farm is None:
+            server_url = self.server_url
+        else:
+            server_url = self._farm.route(urlparse_cached(request).hostname or "").server_url
+        self._prewarm.add(server_url, request.url)
 
-        new_request = request.replace(
-            url=self._convert_url("/request", request.url)
-        )
-        new_request.original_url = request.url
-        new_request.target_url = new_request.url.replace(request.url, '').rstrip('/')
-        return new_request
+    @staticmethod
+    def _get_route_key(meta: dict, hostname: str | None) -> str:
+        """
+        Get the key a request is routed by on the farm: its named session, so every request of
+        the session reaches the server keeping its cookies, or else its target host.
+        """
+        session = meta.get("aiohttp_session")
+        if session:
+            return f"session:{session}"
+        return hostname or ""
+
+    @staticmethod
+    def _get_control_headers(request: AiohttpRequest) -> dict[str, str]:
+        """
+        Move request data that must apply to the target request, not to the loopback request,
+        into control headers for the server.
+
+        The 'proxy' meta key is removed, so Scrapy does not send the loopback request through it.
+        The extraction spec of the 'aiohttp_extract' meta key is sent as JSON, and the named session
+        of the 'aiohttp_session' meta key as is.
+        """
+        headers = {}
+        cookies = request.cookies
+        if isinstance(cookies, list):
+            cookies = {cookie["name"]: cookie["value"] for cookie in cookies}
+        if cookies:
+            headers[COOKIES_HEADER] = json.dumps({str(name): str(value) for name, value in cookies.items()})
+        if "download_timeout" in request.meta:
+            headers[TIMEOUT_HEADER] = str(request.meta["download_timeout"])
+        if request.meta.get("dont_redirect"):
+            headers[ALLOW_REDIRECTS_HEADER] = "0"
+        extract = request.meta.get("aiohttp_extract")
+        if extract:
+            headers[EXTRACT_HEADER] = json.dumps(extract)
+        session = request.meta.get("aiohttp_session")
+        if session:
+            headers[SESSION_HEADER] = str(session)
+        proxy = request.meta.pop("proxy", None)
+        if proxy:
+            headers[PROXY_HEADER] = proxy
+        return headers
 
     @staticmethod
-    def _convert_request(request: Request) -> AiohttpRequest:
-        """Convert a Scrapy Request to an AiohttpRequest."""
+    def _convert_request(request: Request, url: str | None = None) -> AiohttpRequest:
+        """
+        Convert a Scrapy Request to an AiohttpRequest with all its attributes, in a single copy.
 
+        An AiohttpRequest is returned as it is unless a new URL is given. Other requests only pass
+        the attributes of a Scrapy Request, since those of subclasses, e.g. JsonRequest's dumps_kwargs,
+        are already applied to them and AiohttpRequest does not take them.
+        """
         if isinstance(request, AiohttpRequest):
-            return request
-        return AiohttpRequest(
-            url=request.url,
-            callback=request.callback,
-            method=request.method,
-            headers=request.headers,
-            body=request.body,
-            cookies=request.cookies,
-            meta=request.meta,
-        )
+            if url is None:
+                return request
+            cls, attributes = type(request), request.attributes
+        else:
+            cls, attributes = AiohttpRequest, Request.attributes
+        kwargs = {name: getattr(request, name) for name in attributes}
+        if url is not None:
+            kwargs["url"] = url
+        return cls(**kwargs)
 
     def _convert_url(self, handler: str, url: str) -> str:
-        server_url = self.server_url
-        target_url = urljoin(server_url, handler).rstrip('/')
+        target_url = join_route(self.loopback_url, handler).rstrip('/')
         site_url = url.lstrip('/')
         return f"{target_url}/{site_url}"
 
+    def _reroute(self, request: AiohttpRequest) -> AiohttpRequest | None:
+        """
+        Send a converted request to another server of the farm if its server was ejected.
+        """
+        node = self._farm.get_node(request.target_url)
+        if node is None or not node.ejected:
+            return None
+        new_node = self._farm.route(self._get_route_key(request.meta, urlparse(request.original_url).hostname))
+        if new_node is node:
+            return None
+        new_request = request.replace(url=new_node.request_url_prefix + request.original_url, dont_filter=True)
+        new_request.target_url = new_node.request_route_url
+        return new_request
+
+    def process_exception(self, request: Request | AiohttpRequest, exception: Exception, spider):
+        """
+        Count a failed loopback request against its server, sending it to another server once that one is ejected.
+        """
+        if self._farm is None or not isinstance(request, AiohttpRequest) or \
+                not isinstance(exception, SERVER_FAILURES):
+            return None
+        node = self._farm.get_node(request.target_url)
+        if node is None:
+            return None
+        self._farm.record_failure(node)
+        return self._reroute(request)
+
     def process_response(self, request: Request | AiohttpRequest, response: Response, spider):
         if not isinstance(request, AiohttpRequest):
             return response
 
-        origin_url = request.original_url
-        response._set_url(origin_url)
-        return response
+        if self._farm is not None:
+            node = self._farm.get_node(request.target_url)
+            if node is not None:
+                self._farm.record_success(node)
+        self._apply_host_delay(request, response)
+        headers = response.headers.copy()
+        timings = headers.pop(TIMINGS_HEADER, None)
+        if timings:
+            self._record_timings(request, timings[-1].decode())
+        cache = headers.pop(CACHE_HEADER, None)
+        if cache and self.crawler is not None and self.crawler.stats is not None:
+            self.crawler.stats.inc_value(f"aiohttp/cache/{cache[-1].decode().lower()}")
+        extracted_size = headers.pop(EXTRACTED_SIZE_HEADER, None)
+        if extracted_size:
+            self._record_extraction(int(extracted_size[-1]), len(response.body))
+        url = headers.pop(URL_HEADER, None)
+        url = url[-1].decode() if url else request.original_url
+        respcls = responsetypes.from_args(headers=headers, url=url, body=response.body)
+        return response.replace(cls=respcls, url=url, headers=headers)
+
+    def _record_timings(self, request: AiohttpRequest, value: str):
+        """
+        Add the phase durations reported by the server to the crawler stats.
+
+        Each phase is summed in 'aiohttp/timings/<phase>' and its maximum kept in
+        'aiohttp/timings/<phase>/max'. The loopback phase is the part of the Scrapy download
+        latency spent outside of the server.
+        """
+        if self.crawler is None or self.crawler.stats is None:
+            return
+        timings = parse_timings(value)
+        latency = request.meta.get("download_latency")
+        if latency is not None and "total" in timings:
+            timings["loopback"] = max(0.0, latency - timings["total"])
+        stats = self.crawler.stats
+        stats.inc_value("aiohttp/timings/count")
+        for phase, duration in timings.items():
+            stats.inc_value(f"aiohttp/timings/{phase}", duration, start=0.0)
+            stats.max_value(f"aiohttp/timings/{phase}/max", duration)
+
+    def _record_extraction(self, size: int, extracted_size: int):
+        """
+        Add the body sizes of a response extracted by the server to the crawler stats.
+
+        'aiohttp/extract/bytes_saved' sums the bytes that were not sent back to Scrapy.
+        """
+        if self.crawler is None or self.crawler.stats is None:
+            return
+        stats = self.crawler.stats
+        stats.inc_value("aiohttp/extract/count")
+        stats.inc_value("aiohttp/extract/bytes_in", size)
+        stats.inc_value("aiohttp/extract/bytes_out", extracted_size)
+        stats.inc_value("aiohttp/extract/bytes_saved", max(0, size - extracted_size))
+
+    def _apply_host_delay(self, request: AiohttpRequest, response: Response):
+        """
+        Apply the target host delay reported by the server to the download slot of the request.
+
+        Nothing is changed while the request uses the slot of the server itself, which is shared
+        by all aiohttp requests.
+        """
+        delay = response.headers.get(HOST_DELAY_HEADER)
+        if delay is None or self.crawler is None or self.crawler.engine is None:
+            return
+        key = request.meta.get("download_slot") or urlparse_cached(request).hostname
+        if key == self._server_host or self._farm is not None and key in self._farm.hosts:
+            return
+        slot = self.crawler.engine.downloader.slots.get(key)
+        if slot is not None:
+            slot.delay = max(float(delay), self.crawler.settings.getfloat("DOWNLOAD_DELAY"))
@@ -0,0 +1,214 @@
+import asyncio
+import http.client
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from aiohttp import BaseConnector, ClientError, ClientTimeout, hdrs
+from aiohttp.client_reqrep import ClientRequest
+from yarl import URL
+
+from scrapy_aiohttp.utils import PrewarmConfig, DEFAULT_AIOHTTP_PREWARM_CONFIG
+from .farm import get_http_connection
+from .metrics import ProxyMetrics
+
+PREWARM_CONTENT_TYPE = "application/json"
+
+
+def get_origin(url: str | URL) -> str | None:
+    """
+    Get the scheme, host and port of an http or https URL, or None for any other URL.
+    """
+    try:
+        url = URL(url)
+    except (TypeError, ValueError):
+        return None
+    if url.scheme not in ("http", "https") or not url.host:
+        return None
+    return f"{url.scheme}://{url.host}:{url.port}"
+
+
+class ConnectionPrewarmer:
+    """
+    Opens pooled connections to the origins of upcoming requests, before the requests arrive.
+
+    Opening a connection resolves the host, connects and completes the TLS handshake, then
+    leaves the connection idle in the pool, where the first request to the origin picks it up.
+    At most max_hosts origins are warm at the same time: a warmed origin counts against this
+    budget, and is not warmed again, until idle_timeout seconds have passed.
+    """
+
+    def __init__(self, prewarm_config: PrewarmConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_PREWARM_CONFIG, **(prewarm_config or {})}
+        self.max_hosts = config["max_hosts"]
+        self.connections = max(1, config["connections"])
+        self.concurrency = max(1, config["concurrency"])
+        self.idle_timeout = config["idle_timeout"]
+        self.timeout = config["timeout"]
+        self._warm: OrderedDict[str, float] = OrderedDict()
+        # Created in the event loop of the server worker, since the prewarmer is sent to spawned workers.
+        self._semaphore: asyncio.Semaphore | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("prewarms_total", "counter", "Origins pre-warmed, by result.")
+
+    def admit(self, origins: list[str]) -> list[str]:
+        """
+        Get the origins to warm, taking them from the budget, and skip the others.
+        """
+        now = time.monotonic()
+        while self._warm and next(iter(self._warm.values())) <= now:
+            self._warm.popitem(last=False)
+        admitted = []
+        for origin in dict.fromkeys(filter(None, map(get_origin, origins))):
+            if origin in self._warm or len(self._warm) >= self.max_hosts:
+                continue
+            self._warm[origin] = now + self.idle_timeout
+            admitted.append(origin)
+        self._count("skipped", len(origins) - len(admitted))
+        return admitted
+
+    def schedule(self, connector: BaseConnector, origins: list[str]) -> list[str]:
+        """
+        Start warming the admitted origins in the background, returning them.
+        """
+        admitted = self.admit(origins)
+        for origin in admitted:
+            task = asyncio.ensure_future(self.warm(connector, origin))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        return admitted
+
+    async def warm(self, connector: BaseConnector, origin: str) -> bool:
+        """
+        Open the connections of an origin and release them to the pool.
+
+        An origin that fails is removed from the budget, so it can be warmed again.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            request = ClientRequest(hdrs.METH_GET, URL(origin), loop=asyncio.get_running_loop())
+            timeout = ClientTimeout(sock_connect=self.timeout)
+            results = await asyncio.gather(*(
+                asyncio.wait_for(connector.connect(request, [], timeout), self.timeout)
+                for _ in range(self.connections)
+            ), return_exceptions=True)
+        failed = False
+        for result in results:
+            if isinstance(result, BaseException):
+                if not isinstance(result, (asyncio.TimeoutError, ClientError, OSError)):
+                    raise result
+                logging.debug(f"Pre-warming {origin} failed: {result!r}")
+                failed = True
+            else:
+                result.release()
+        if failed:
+            self._warm.pop(origin, None)
+        self._count("failed" if failed else "warmed")
+        return not failed
+
+    def _count(self, result: str, value: int = 1):
+        if self.metrics is not None and value:
+            self.metrics.inc("prewarms_total", value, result=result)
+
+    async def close(self):
+        """
+        Cancel the warm-ups still running.
+        """
+        for task in self._tasks:
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class PrewarmQueue:
+    """
+    Sends the origins of upcoming aiohttp requests to the /prewarm route of their server.
+
+    Origins are gathered for flush_interval seconds and sent in batches by a background thread,
+    so the crawl never waits for them. An origin is sent once per idle_timeout seconds, which is
+    how long the server keeps it warm.
+    """
+
+    # Number of origins remembered as sent.
+    max_origins = 10000
+
+    def __init__(self, prewarm_config: PrewarmConfig | None = None):
+        config = {**DEFAULT_AIOHTTP_PREWARM_CONFIG, **(prewarm_config or {})}
+        self.idle_timeout = config["idle_timeout"]
+        self.timeout = config["timeout"]
+        self.flush_interval = config["flush_interval"]
+        self.batch_size = max(1, config["batch_size"])
+        self._sent: OrderedDict[str, float] = OrderedDict()
+        self._pending: dict[str, list[str]] = {}
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._sender: threading.Thread | None = None
+
+    def add(self, server_url: str, url: str):
+        """
+        Queue the origin of a URL for the server the request to it is sent to, unless it is still warm.
+        """
+        origin = get_origin(url)
+        if origin is None:
+            return
+        now = time.monotonic()
+        key = f"{server_url} {origin}"
+        with self._condition:
+            if self._sent.get(key, 0.0) > now:
+                return
+            self._sent[key] = now + self.idle_timeout
+            self._sent.move_to_end(key)
+            if len(self._sent) > self.max_origins:
+                self._sent.popitem(last=False)
+            self._pending.setdefault(server_url, []).append(origin)
+            if self._sender is None and not self._stopping:
+                self._sender = threading.Thread(target=self._run, name="AiohttpPrewarmSender", daemon=True)
+                self._sender.start()
+            self._condition.notify()
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+            sender, self._sender = self._sender, None
+        if sender is not None:
+            sender.join()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if self._stopping:
+                    return
+            # Gather the origins of the requests scheduled together into one batch.
+            time.sleep(self.flush_interval)
+            with self._condition:
+                pending, self._pending = self._pending, {}
+            for server_url, origins in pending.items():
+                for start in range(0, len(origins), self.batch_size):
+                    self.send(server_url, origins[start:start + self.batch_size])
+
+    def send(self, server_url: str, origins: list[str]) -> bool:
+        """
+        Post origins to the /prewarm route of a server.
+        """
+        connection = get_http_connection(server_url, self.timeout)
+        try:
+            connection.request(
+                "POST", "/prewarm", json.dumps(origins), {hdrs.CONTENT_TYPE: PREWARM_CONTENT_TYPE}
+            )
+            response = connection.getresponse()
+            response.read()
+            return response.status == 202
+        except (OSError, http.client.HTTPException) as e:
+            logging.debug(f"Pre-warming through {server_url} failed: {e!r}")
+            return False
+        finally:
+            connection.close()
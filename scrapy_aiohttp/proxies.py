@@ -0,0 +1,314 @@
+import asyncio
+import hashlib
+import inspect
+import logging
+import time
+
+from contextlib import asynccontextmanager
+
+from aiohttp import ClientSession, ClientError
+
+from scrapy_aiohttp.utils import ProxyConfig, DEFAULT_AIOHTTP_PROXY_CONFIG
+from .metrics import ProxyMetrics
+
+PROXY_STRATEGIES = ("round_robin", "least_latency", "sticky")
+
+
+class NoUpstreamProxyError(ClientError):
+    def __init__(self, message="No upstream proxy is available."):
+        super().__init__(message)
+
+
+class UpstreamProxy:
+    """
+    An upstream proxy of the pool, with its health and its own pooled client session.
+    """
+
+    # Weight of the latest request in the moving averages of latency and error rate.
+    smoothing = 0.2
+
+    def __init__(self, url: str):
+        self.url = url
+        self.session: ClientSession | None = None
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.evicted_until = 0.0
+        self.probing = False
+        self.active = 0
+        self.retired = False
+
+    @property
+    def cooling_down(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    @property
+    def score(self) -> float:
+        """
+        Health score of the proxy, lower is better. Proxies that were never used score 0.
+        """
+        return self.latency / max(0.1, 1.0 - self.error_rate)
+
+    def reset(self):
+        """
+        Forget the health of the proxy, before it is tried again after an eviction.
+        """
+        self.latency = self.error_rate = 0.0
+        self.requests = self.failures = 0
+        self.cooldown_until = 0.0
+
+    def record(self, latency: float | None, failed: bool):
+        self.requests += 1
+        self.error_rate += self.smoothing * (float(failed) - self.error_rate)
+        if failed:
+            self.failures += 1
+        else:
+            self.failures = 0
+            self.latency = latency if self.requests == 1 else self.latency + self.smoothing * (latency - self.latency)
+
+
+class ProxyAttempt:
+    """
+    A request sent through an upstream proxy, whose outcome is recorded when it ends.
+    """
+
+    __slots__ = ("proxy", "start_time", "latency", "status")
+
+    def __init__(self, proxy: UpstreamProxy):
+        self.proxy = proxy
+        self.start_time = time.monotonic()
+        self.latency: float | None = None
+        self.status: int | None = None
+
+    def respond(self, status: int):
+        """
+        Note the arrival of the response headers.
+        """
+        self.latency = time.monotonic() - self.start_time
+        self.status = status
+
+
+class ProxyPool:
+    """
+    Pool of upstream proxies the server sends its requests through.
+
+    Proxies are chosen round-robin, by the lowest health score, or sticky per target host.
+    A proxy failing several requests in a row cools down for a while, and a proxy whose error
+    rate stays too high is evicted. When every proxy cools down, the one ready first is used.
+    An evicted proxy is tried again after eviction_cooldown seconds with a single probe request:
+    it is back in the pool when the probe succeeds, and evicted again otherwise.
+    The proxies come from a list or from a provider called again every refresh_interval seconds.
+    """
+
+    def __init__(self, proxy_config: ProxyConfig, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_PROXY_CONFIG, **proxy_config}
+        if config["strategy"] not in PROXY_STRATEGIES:
+            raise ValueError(f"Unsupported upstream proxy strategy {config['strategy']!r}.")
+        self.strategy = config["strategy"]
+        self.refresh_interval = config["refresh_interval"]
+        self.error_statuses = frozenset(config["error_statuses"])
+        self.max_failures = config["max_failures"]
+        self.cooldown = config["cooldown"]
+        self.max_error_rate = config["max_error_rate"]
+        self.min_requests = config["min_requests"]
+        self.eviction_cooldown = config["eviction_cooldown"]
+        self.proxies: dict[str, UpstreamProxy] = {}
+        self.evicted: dict[str, UpstreamProxy] = {}
+        self._provider = None
+        self._next_refresh = 0.0
+        self._refreshing: asyncio.Task | None = None
+        self._counter = 0
+        self._sticky: dict[str, str] = {}
+        self._closing: set[asyncio.Task] = set()
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("upstream_proxies", "gauge", "Upstream proxies of the pool by state.")
+            metrics.describe("upstream_proxy_cooldowns_total", "counter", "Upstream proxy cool-downs.")
+            metrics.describe("upstream_proxy_evictions_total", "counter", "Upstream proxies evicted from the pool.")
+            metrics.describe(
+                "upstream_proxy_reinstatements_total", "counter", "Evicted upstream proxies back in the pool."
+            )
+        if callable(config["proxies"]):
+            self._provider = config["proxies"]
+        else:
+            self.update(config["proxies"])
+            self._next_refresh = float("inf")
+
+    def update(self, urls):
+        """
+        Replace the proxies of the pool, keeping the health of the proxies still in it.
+
+        Evicted proxies stay evicted until their probe, and are forgotten when they are not in the new list.
+        """
+        urls = list(dict.fromkeys(urls))
+        for url in set(self.proxies) - set(urls):
+            self._retire(self.proxies.pop(url))
+        for url in set(self.evicted) - set(urls):
+            del self.evicted[url]
+        for url in urls:
+            if url not in self.proxies and url not in self.evicted:
+                self.proxies[url] = UpstreamProxy(url)
+        self._update_gauges()
+
+    async def refresh(self):
+        """
+        Get the proxies from the provider, if it is time to.
+        """
+        if self._provider is None or time.monotonic() < self._next_refresh:
+            return
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+        await asyncio.shield(self._refreshing)
+
+    async def _refresh(self):
+        """
+        Call the provider, keeping the current proxies until the next refresh when it fails.
+        """
+        try:
+            urls = self._provider()
+            if inspect.isawaitable(urls):
+                urls = await urls
+            self.update(urls)
+        except Exception as e:
+            logging.warning(f"Upstream proxy provider failed: {e!r}")
+        self._next_refresh = time.monotonic() + self.refresh_interval
+
+    async def choose(self, host: str) -> UpstreamProxy:
+        """
+        Choose the proxy of a request to a target host.
+        """
+        await self.refresh()
+        self._reinstate()
+        if not self.proxies:
+            raise NoUpstreamProxyError()
+        # A proxy being probed takes no other request until its probe succeeds.
+        candidates = [
+            proxy for proxy in self.proxies.values() if not proxy.cooling_down and not (proxy.probing and proxy.active)
+        ]
+        if not candidates:
+            return min(self.proxies.values(), key=lambda proxy: proxy.cooldown_until)
+        if self.strategy == "least_latency":
+            return min(candidates, key=lambda proxy: proxy.score)
+        if self.strategy == "sticky":
+            return self._get_sticky(host, candidates)
+        self._counter += 1
+        return candidates[self._counter % len(candidates)]
+
+    def _get_sticky(self, host: str, candidates: list[UpstreamProxy]) -> UpstreamProxy:
+        """
+        Get the proxy of a host by rendezvous hashing, so hosts only move when their proxy is unavailable.
+        """
+        proxy = self.proxies.get(self._sticky.get(host))
+        if proxy is None or proxy.cooling_down:
+            proxy = max(candidates, key=lambda candidate: hashlib.blake2b(
+                f"{host} {candidate.url}".encode(), digest_size=8
+            ).digest())
+            if len(self._sticky) >= 10000:
+                self._sticky.clear()
+            self._sticky[host] = proxy.url
+        return proxy
+
+    @asynccontextmanager
+    async def attempt(self, host: str):
+        """
+        Send a request to a target host through a proxy of the pool, recording how it went.
+
+        The request fails when it raises a client error or a timeout, or answers with an error status.
+        """
+        attempt = ProxyAttempt(await self.choose(host))
+        attempt.proxy.active += 1
+        try:
+            yield attempt
+        except (asyncio.TimeoutError, ClientError):
+            self.record(attempt.proxy, None, True)
+            raise
+        else:
+            self.record(attempt.proxy, attempt.latency, attempt.status in self.error_statuses)
+        finally:
+            attempt.proxy.active -= 1
+            if attempt.proxy.retired and not attempt.proxy.active:
+                self._close_session(attempt.proxy)
+
+    def record(self, proxy: UpstreamProxy, latency: float | None, failed: bool):
+        """
+        Update the health of a proxy with the outcome of a request, cooling it down or evicting it,
+        or ending the probe of a proxy back from an eviction.
+        """
+        proxy.record(latency, failed)
+        if proxy.retired:
+            return
+        if proxy.probing:
+            proxy.probing = False
+            if failed:
+                self._evict(proxy)
+            elif self.metrics is not None:
+                self.metrics.inc("upstream_proxy_reinstatements_total")
+        elif not failed:
+            return
+        elif proxy.requests >= self.min_requests and proxy.error_rate >= self.max_error_rate:
+            self._evict(proxy)
+            if self.metrics is not None:
+                self.metrics.inc("upstream_proxy_evictions_total")
+        elif proxy.failures >= self.max_failures and not proxy.cooling_down:
+            proxy.cooldown_until = time.monotonic() + self.cooldown
+            if self.metrics is not None:
+                self.metrics.inc("upstream_proxy_cooldowns_total")
+        self._update_gauges()
+
+    def _evict(self, proxy: UpstreamProxy):
+        """
+        Take a proxy out of the pool until it is probed, after eviction_cooldown seconds.
+        """
+        if self.proxies.get(proxy.url) is not proxy:
+            return
+        del self.proxies[proxy.url]
+        self._retire(proxy)
+        proxy.evicted_until = time.monotonic() + self.eviction_cooldown
+        self.evicted[proxy.url] = proxy
+
+    def _reinstate(self):
+        """
+        Put the evicted proxies whose eviction cool-down is over back in the pool, to be probed.
+        """
+        if not self.evicted:
+            return
+        now = time.monotonic()
+        for url, proxy in list(self.evicted.items()):
+            if proxy.evicted_until <= now:
+                del self.evicted[url]
+                proxy.reset()
+                proxy.retired = False
+                proxy.probing = True
+                self.proxies[url] = proxy
+        self._update_gauges()
+
+    def _retire(self, proxy: UpstreamProxy):
+        proxy.retired = True
+        if not proxy.active:
+            self._close_session(proxy)
+
+    def _close_session(self, proxy: UpstreamProxy):
+        session, proxy.session = proxy.session, None
+        if session is not None:
+            task = asyncio.ensure_future(session.close())
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def _update_gauges(self):
+        if self.metrics is None:
+            return
+        cooling = sum(proxy.cooling_down for proxy in self.proxies.values())
+        self.metrics.set("upstream_proxies", len(self.proxies) - cooling, state="active")
+        self.metrics.set("upstream_proxies", cooling, state="cooling")
+        self.metrics.set("upstream_proxies", len(self.evicted), state="evicted")
+
+    async def close(self):
+        """
+        Close the sessions of every proxy.
+        """
+        for proxy in self.proxies.values():
+            self._close_session(proxy)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
@@ -24,11 +24,12 @@ class AiohttpRequest(Request):
             flags: Optional[List[str]] = None,
             cb_kwargs: Optional[dict] = None,
     ) -> None:
-        if meta is not None:
-            if "aiohttp" in meta:
-                if not isinstance(meta.get("aiohttp"), bool):
+        if meta:
+            # A single lookup for the common case of a missing or True 'aiohttp' key.
+            aiohttp = meta.get("aiohttp", True)
+            if aiohttp is not True:
+                if not isinstance(aiohttp, bool):
                     raise ValueError("'aiohttp' key in meta must be a boolean value.")
-            if meta.get("aiohttp", None) is False:
                 raise ValueError("Aiohttp request should not have 'aiohttp' key set to False in meta.")
 
         super().__init__(url, callback, method, headers, body, cookies, meta,
@@ -0,0 +1,177 @@
+import asyncio
+import math
+import random
+import time
+
+from collections import deque
+from typing import Awaitable, Callable
+
+from aiohttp import ClientConnectionError, ClientConnectorCertificateError, hdrs
+from multidict import CIMultiDict
+
+from scrapy_aiohttp.utils import (
+    RetryConfig,
+    HedgeConfig,
+    DEFAULT_AIOHTTP_RETRY_CONFIG,
+    DEFAULT_AIOHTTP_HEDGE_CONFIG,
+)
+from .coalesce import IDEMPOTENT_METHODS
+from .metrics import ProxyMetrics
+from .throttle import parse_retry_after
+
+Fetch = Callable[[], Awaitable[tuple[int, CIMultiDict, bytes]]]
+
+
+def _get_methods(methods) -> frozenset[str]:
+    methods = frozenset(method.upper() for method in methods)
+    if not methods <= IDEMPOTENT_METHODS:
+        raise ValueError(f"Requests can not be sent twice for methods {', '.join(methods - IDEMPOTENT_METHODS)}.")
+    return methods
+
+
+class RetryPolicy:
+    """
+    Retry upstream requests inside the server, before Scrapy sees the failure.
+
+    Connection errors, connect and read timeouts, and responses with a retryable status are
+    retried with exponential backoff and full jitter, honoring a short enough Retry-After.
+    A request that ran out of its total timeout is not retried, and no retry starts after
+    the deadline of the request.
+    """
+
+    def __init__(self, retry_config: RetryConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_RETRY_CONFIG, **(retry_config or {})}
+        self.times = config["times"]
+        self.statuses = frozenset(config["statuses"])
+        self.methods = _get_methods(config["methods"])
+        self.backoff_base = config["backoff_base"]
+        self.backoff_max = config["backoff_max"]
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("retries_total", "counter", "Upstream request retries by reason.")
+
+    def applies(self, method: str) -> bool:
+        return method in self.methods
+
+    def get_backoff(self, retry: int, retry_after: str | None = None) -> float:
+        """
+        Get the seconds to wait before a retry, the first retry being retry 0.
+        """
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None and seconds <= self.backoff_max:
+            return seconds
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+    async def run(self, fetch: Fetch, deadline: float | None = None) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Run a fetch until it succeeds, it fails in a way that is not retried, or the retries are exhausted.
+        """
+        retry = 0
+        while True:
+            error = result = None
+            try:
+                result = await fetch()
+            except ClientConnectionError as e:
+                if retry >= self.times or isinstance(e, ClientConnectorCertificateError):
+                    raise
+                error, reason, retry_after = e, type(e).__name__, None
+            else:
+                status, headers, _ = result
+                if status not in self.statuses or retry >= self.times:
+                    return result
+                reason, retry_after = str(status), headers.get(hdrs.RETRY_AFTER)
+            backoff = self.get_backoff(retry, retry_after)
+            if deadline is not None and time.monotonic() + backoff >= deadline:
+                if error is not None:
+                    raise error
+                return result
+            if self.metrics is not None:
+                self.metrics.inc("retries_total", reason=reason)
+            await asyncio.sleep(backoff)
+            retry += 1
+
+
+class HedgePolicy:
+    """
+    Send a second attempt of a slow upstream request and use whichever answers first.
+
+    The hedging delay is a latency percentile of the recent attempts of the worker, so only
+    the slowest requests are sent twice. The losing attempt is cancelled.
+    """
+
+    def __init__(self, hedge_config: HedgeConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_HEDGE_CONFIG, **(hedge_config or {})}
+        if not 0 < config["percentile"] < 100:
+            raise ValueError("The hedging percentile must be between 0 and 100.")
+        self.percentile = config["percentile"]
+        self.min_delay = config["min_delay"]
+        self.max_delay = config["max_delay"]
+        self.min_samples = config["min_samples"]
+        self.methods = _get_methods(config["methods"])
+        self.latencies: deque[float] = deque(maxlen=config["window"])
+        # The percentile is computed again once this many latencies were recorded since the last time.
+        self._refresh_interval = max(1, config["window"] // 20)
+        self._recorded = 0
+        self._delay: float | None = None
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("hedged_requests_total", "counter", "Upstream requests sent a second time.")
+            metrics.describe("hedge_wins_total", "counter", "Hedged requests answered first by the second attempt.")
+
+    def applies(self, method: str) -> bool:
+        return method in self.methods
+
+    def record(self, latency: float):
+        self.latencies.append(latency)
+        self._recorded += 1
+
+    def get_delay(self) -> float | None:
+        """
+        Get the seconds after which a request is hedged, or None while too few latencies are known.
+        """
+        if len(self.latencies) < self.min_samples:
+            return None
+        if self._delay is None or self._recorded >= self._refresh_interval:
+            latencies = sorted(self.latencies)
+            index = min(len(latencies) - 1, math.ceil(len(latencies) * self.percentile / 100) - 1)
+            self._delay = min(self.max_delay, max(self.min_delay, latencies[index]))
+            self._recorded = 0
+        return self._delay
+
+    async def _attempt(self, fetch: Fetch) -> tuple[int, CIMultiDict, bytes]:
+        start_time = time.monotonic()
+        result = await fetch()
+        self.record(time.monotonic() - start_time)
+        return result
+
+    async def run(self, fetch: Fetch) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Run a fetch, starting a second one if the first is still running after the hedging delay.
+        """
+        delay = self.get_delay()
+        first = asyncio.ensure_future(self._attempt(fetch))
+        if delay is None:
+            return await first
+        second = None
+        try:
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            if done:
+                return first.result()
+            if self.metrics is not None:
+                self.metrics.inc("hedged_requests_total")
+            second = asyncio.ensure_future(self._attempt(fetch))
+            pending = {first, second}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is second and self.metrics is not None:
+                            self.metrics.inc("hedge_wins_total")
+                        return task.result()
+            raise error
+        finally:
+            first.cancel()
+            if second is not None:
+                second.cancel()
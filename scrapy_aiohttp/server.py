@@ -1,34 +1,184 @@
+import asyncio
+import hashlib
+import json
 import logging
+import multiprocessing
+import os
+import pickle
+import socket
+import stat
+import threading
+import time
 
 from typing import Callable
 from urllib.parse import urlparse
+from contextlib import asynccontextmanager, nullcontext
 from functools import partial
-from multiprocessing import Process
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
 
-from aiohttp import web, ClientSession, ClientResponseError, ClientError
+from aiohttp import (
+    web, hdrs, ClientSession, ClientResponse, ClientResponseError, ClientError, ClientTimeout, DummyCookieJar,
+)
 from aiohttp.web import middleware, Request
 from multidict import CIMultiDictProxy, CIMultiDict
 
-from scrapy_aiohttp.utils import RequestHeaders
+from scrapy_aiohttp.utils import (
+    RequestHeaders,
+    ConnectorConfig,
+    ThrottleConfig,
+    CacheConfig,
+    CoalesceConfig,
+    TimeoutConfig,
+    RetryConfig,
+    HedgeConfig,
+    ProxyConfig,
+    PrewarmConfig,
+    ExtractConfig,
+    AdmissionConfig,
+    SessionConfig,
+    DEFAULT_AIOHTTP_CONNECTOR_CONFIG,
+    DEFAULT_AIOHTTP_TIMEOUT_CONFIG,
+    DEFAULT_CHUNK_SIZE,
+    COOKIES_HEADER,
+    TIMEOUT_HEADER,
+    ALLOW_REDIRECTS_HEADER,
+    PROXY_HEADER,
+    EXTRACT_HEADER,
+    SESSION_HEADER,
+    URL_HEADER,
+    HOST_DELAY_HEADER,
+    TIMINGS_HEADER,
+    CACHE_HEADER,
+    HOP_BY_HOP_HEADERS,
+    MaxSizeExceededError,
+    ServerStartupError,
+    HeaderContext,
+    HeaderPlan,
+    check_expected_size,
+    iter_body,
+    read_body,
+)
+from .admission import AdmissionControl, current_ticket
+from .cache import ResponseCache, CacheEntry, PRIVATE_HEADERS
+from .coalesce import SingleFlight
+from .extract import ExtractField, ResponseExtractor, parse_extract_spec
+from .metrics import ProxyMetrics, RequestTimings, current_timings
+from .prewarm import ConnectionPrewarmer
+from .proxies import ProxyPool, UpstreamProxy
+from .retry import RetryPolicy, HedgePolicy
+from .sessions import SessionPool, create_client_session, create_ssl_context
+from .throttle import HostThrottle, HostSlot
+from .utils.batch import BatchItem, BATCH_RESULTS_CONTENT_TYPE, encode_result_head
+from .utils.compression import check_compression, get_compressor, accepts_encoding
+from .utils.loopback import get_unix_path
+from ._worker import serve
+
+
+class StreamAbortedError(ClientError):
+    """
+    A streamed response aborted after its headers were sent to Scrapy, because the upstream body failed.
+    """
+
+    def __init__(self, stream: web.StreamResponse, error: Exception):
+        self.stream = stream
+        super().__init__(f"Streamed response aborted: {error!r}")
 
 
 class AiohttpServer:
     """
     Aiohttp-based proxy server for forwarding HTTP requests to another server
     """
-    __request_headers_config: RequestHeaders = {}
 
-    def __init__(self, host=None, port=None, *, server_url=None):
+    def __init__(
+            self,
+            host=None,
+            port=None,
+            *,
+            server_url=None,
+            connector_config: ConnectorConfig | None = None,
+            stream_responses: bool = False,
+            chunk_size: int = DEFAULT_CHUNK_SIZE,
+            maxsize: int = 0,
+            warnsize: int = 0,
+            workers: int = 1,
+            health_check_interval: float = 1.0,
+            startup_timeout: float = 10.0,
+            start_method: str | None = None,
+            decompress: bool = True,
+            loopback_compression: str | None = None,
+            loopback_compression_min_size: int = 1024,
+            throttle_config: ThrottleConfig | None = None,
+            metrics: bool = False,
+            cache_config: CacheConfig | None = None,
+            coalesce_config: CoalesceConfig | None = None,
+            timeout_config: TimeoutConfig | None = None,
+            retry_config: RetryConfig | None = None,
+            hedge_config: HedgeConfig | None = None,
+            proxy_config: ProxyConfig | None = None,
+            prewarm_config: PrewarmConfig | None = None,
+            extract_config: ExtractConfig | None = None,
+            admission_config: AdmissionConfig | None = None,
+            session_config: SessionConfig | None = None,
+    ):
         self.handlers: set = None
-        self._process: Process = None
-        self.app = web.Application()
-        self.app.middlewares.extend((
-            self._handler_validation_middleware,
-        ))
-        self.app.add_routes((
-            web.RouteDef('GET', '/request/{url:https?.*}', self._handle_request, {}),
-        ))
-        if server_url is not None:
+        self.__request_headers_config: RequestHeaders = {}
+        self._header_plan: HeaderPlan | None = None
+        self.stream_responses = stream_responses
+        self.chunk_size = chunk_size
+        self.maxsize = maxsize
+        self.warnsize = warnsize
+        self.decompress = decompress
+        if loopback_compression is not None:
+            check_compression(loopback_compression)
+        self.loopback_compression = loopback_compression
+        self.loopback_compression_min_size = loopback_compression_min_size
+        # Without decompression the body is forwarded as is, so its Content-Encoding stays valid.
+        excluded_headers = HOP_BY_HOP_HEADERS if not decompress else HOP_BY_HOP_HEADERS | {hdrs.CONTENT_ENCODING}
+        self._excluded_response_headers = frozenset(name.lower() for name in excluded_headers)
+        self._throttle = HostThrottle(throttle_config) if throttle_config is not None else None
+        if workers < 1:
+            raise ValueError("The number of server workers must be at least 1.")
+        self.workers = workers
+        self.health_check_interval = health_check_interval
+        self.startup_timeout = startup_timeout
+        self.start_method = start_method
+        self._context = multiprocessing.get_context(start_method)
+        self.restarts = 0
+        self._processes: list[BaseProcess] = []
+        # Connections to the worker processes, to ask them to drain when the server stops.
+        self._connections: list[Connection] = []
+        self._sockets: list[socket.socket] = []
+        # Loopback sockets of each worker, the requests of a named session are forwarded to the worker owning it.
+        self._worker_sockets: list[socket.socket] = []
+        self._worker_urls: list[str] = []
+        self._worker_index = 0
+        self._worker_session: ClientSession | None = None
+        self._supervisor: threading.Thread | None = None
+        self._stopping = threading.Event()
+        self._client_session: ClientSession | None = None
+        self._session_options: dict = {}
+        self.connector_config: ConnectorConfig = {**DEFAULT_AIOHTTP_CONNECTOR_CONFIG, **(connector_config or {})}
+        self.metrics = ProxyMetrics() if metrics else None
+        self._cache = ResponseCache(cache_config, self.metrics) if cache_config is not None else None
+        self._singleflight = SingleFlight(coalesce_config) if coalesce_config is not None else None
+        timeout_config = {**DEFAULT_AIOHTTP_TIMEOUT_CONFIG, **(timeout_config or {})}
+        self.timeout = ClientTimeout(
+            total=timeout_config["total"], sock_connect=timeout_config["connect"], sock_read=timeout_config["read"]
+        )
+        self._retry = RetryPolicy(retry_config, self.metrics) if retry_config is not None else None
+        self._hedge = HedgePolicy(hedge_config, self.metrics) if hedge_config is not None else None
+        self._proxy_pool = ProxyPool(proxy_config, self.metrics) if proxy_config is not None else None
+        self._prewarmer = ConnectionPrewarmer(prewarm_config, self.metrics) if prewarm_config is not None else None
+        self._extractor = ResponseExtractor(extract_config, self.metrics)
+        self._admission = AdmissionControl(admission_config, self.metrics)
+        self._sessions = SessionPool(session_config, self.metrics)
+        self.app = self._create_app()
+        self._unix_path = get_unix_path(server_url) if server_url is not None else None
+        if self._unix_path is not None:
+            self._host = None
+            self._port = None
+        elif server_url is not None:
             parsed_url = urlparse(server_url)
             self._host = parsed_url.hostname
             self._port = parsed_url.port
@@ -38,34 +188,339 @@ class AiohttpServer:
         else:
             raise AttributeError("Either 'server_url' or both 'host' and 'port' must be specified.")
 
+    def _create_app(self) -> web.Application:
+        app = web.Application()
+        app.middlewares.extend((
+            self._handler_validation_middleware,
+        ))
+        app.add_routes((
+            web.RouteDef(hdrs.METH_ANY, '/request/{url:https?.*}', self._handle_request, {}),
+            web.RouteDef(hdrs.METH_POST, '/batch', self._handle_batch, {}),
+            web.RouteDef(hdrs.METH_GET, '/health', self._handle_health, {}),
+        ))
+        if self._prewarmer is not None:
+            app.add_routes((
+                web.RouteDef(hdrs.METH_POST, '/prewarm', self._handle_prewarm, {}),
+            ))
+        if self.metrics is not None:
+            app.middlewares.append(self._timing_middleware)
+            app.add_routes((
+                web.RouteDef(hdrs.METH_GET, '/metrics', self._handle_metrics, {}),
+            ))
+        app.middlewares.append(self._admission_middleware)
+        app.on_startup.append(self._on_startup)
+        app.on_cleanup.append(self._on_cleanup)
+        return app
+
+    def __getstate__(self) -> dict:
+        """
+        Get the state sent to worker processes started with spawn or forkserver.
+
+        The application and the state managing the worker processes stay in the parent;
+        the application is rebuilt in the worker.
+        """
+        state = self.__dict__.copy()
+        for name in ("app", "handlers", "_supervisor", "_stopping", "_context"):
+            state[name] = None
+        state["_processes"] = []
+        state["_connections"] = []
+        state["_sockets"] = []
+        state["_worker_sockets"] = []
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._stopping = threading.Event()
+        self._context = multiprocessing.get_context(self.start_method)
+        self.app = self._create_app()
+        self._prerun_configurator()
+
     def _prerun_configurator(self):
         """
         Configuration before server is started.
         """
         self.handlers = {route.handler for route in self.app.router.routes()}
+        self._header_plan = HeaderPlan(self.__request_headers_config)
+
+    @property
+    def _process(self) -> BaseProcess | None:
+        return self._processes[0] if self._processes else None
+
+    @property
+    def url(self) -> str:
+        if self._unix_path is not None:
+            return f"unix://{self._unix_path}"
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def alive_workers(self) -> int:
+        return sum(process.is_alive() for process in self._processes)
 
     def run(self):
         """
-        Start server in a separate process.
+        Start server worker processes sharing the listening sockets.
+
+        Returns once every worker is serving, and raises ServerStartupError when one of them
+        fails to start or is not ready within startup_timeout seconds.
         """
         self._prerun_configurator()
-        self._process = Process(
-            target=web.run_app,
-            args=(self.app,),
-            kwargs={"host": self._host, "port": self._port},
-            name="AiohttpServer",
+        self._sockets = self._bind_sockets()
+        if self.workers > 1:
+            self._worker_sockets = [self._bind_worker_socket() for _ in range(self.workers)]
+            self._worker_urls = [f"http://127.0.0.1:{sock.getsockname()[1]}" for sock in self._worker_sockets]
+        self._stopping.clear()
+        self._processes = []
+        self._connections = []
+        deadline = time.monotonic() + self.startup_timeout
+        try:
+            for index in range(self.workers):
+                process, connection = self._start_worker(index)
+                self._processes.append(process)
+                self._connections.append(connection)
+                self._wait_ready(process, connection, deadline)
+        except ServerStartupError:
+            self.stop()
+            raise
+        logging.info(f"Server at {self.url} is ready.")
+        self._supervisor = threading.Thread(target=self._supervise, name="AiohttpServerSupervisor", daemon=True)
+        self._supervisor.start()
+
+    def stop(self, drain_timeout: float | None = None) -> dict[str, int] | None:
+        """
+        Stop the server processes.
+
+        Without drain_timeout, the workers are terminated at once. With it, every worker first
+        rejects new requests with a 503 and waits at most drain_timeout seconds for the requests
+        in flight to finish. The requests still in flight then are dropped, and the counts of the
+        requests that completed, were dropped or were rejected while draining are returned.
+        """
+        self._stopping.set()
+        if self._supervisor is not None:
+            self._supervisor.join()
+            self._supervisor = None
+        report = self._drain_workers(drain_timeout) if drain_timeout is not None else None
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join()
+        for connection in self._connections:
+            connection.close()
+        self._processes = []
+        self._connections = []
+        for sock in self._sockets + self._worker_sockets:
+            sock.close()
+        self._sockets = []
+        self._worker_sockets = []
+        if self._unix_path is not None:
+            try:
+                os.unlink(self._unix_path)
+            except FileNotFoundError:
+                pass
+        logging.info(f"Server at {self.url} has been stopped.")
+        return report
+
+    def _drain_workers(self, drain_timeout: float) -> dict[str, int]:
+        """
+        Ask every worker to drain, and sum their reports.
+
+        A worker that does not report within the drain timeout and the startup timeout counts
+        every request it had in flight as dropped, which is unknown and left out.
+        """
+        report = {"in_flight": 0, "completed": 0, "dropped": 0, "rejected": 0}
+        connections = []
+        for process, connection in zip(self._processes, self._connections):
+            try:
+                connection.send(("drain", drain_timeout))
+                connections.append((process, connection))
+            except OSError:
+                pass
+        deadline = time.monotonic() + drain_timeout + self.startup_timeout
+        for process, connection in connections:
+            try:
+                if connection.poll(max(0.0, deadline - time.monotonic())):
+                    for name, value in connection.recv().items():
+                        report[name] += value
+                    continue
+            except (EOFError, OSError):
+                pass
+            logging.warning(f"{process.name} did not report after draining.")
+        if report["dropped"]:
+            logging.warning(
+                f"Server at {self.url} dropped {report['dropped']} requests still in flight after draining."
+            )
+        logging.info(f"Server at {self.url} drained: {report}")
+        return report
+
+    def _bind_sockets(self) -> list[socket.socket]:
+        """
+        Bind the listening sockets once in the parent process, so every worker accepts on them.
+        """
+        if self._unix_path is not None:
+            return [self._bind_unix_socket(self._unix_path)]
+        sockets = []
+        error = None
+        addresses = {
+            (family, address[:2])
+            for family, *_, address in socket.getaddrinfo(
+                self._host, self._port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE
+            )
+        }
+        for family, address in addresses:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if family == socket.AF_INET6:
+                    sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
+                sock.bind(address)
+                sock.listen(socket.SOMAXCONN)
+            except OSError as e:
+                sock.close()
+                error = e
+                continue
+            sockets.append(sock)
+        if not sockets:
+            raise error
+        return sockets
+
+    @staticmethod
+    def _bind_worker_socket() -> socket.socket:
+        """
+        Bind the loopback socket only one worker accepts on, at a free port.
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.bind(("127.0.0.1", 0))
+            sock.listen(socket.SOMAXCONN)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _bind_unix_socket(path: str) -> socket.socket:
+        """
+        Bind a unix domain socket, replacing the socket file left by a previous run.
+        """
+        try:
+            if stat.S_ISSOCK(os.stat(path).st_mode):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.bind(path)
+            sock.listen(socket.SOMAXCONN)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _start_worker(self, index: int) -> tuple[BaseProcess, Connection]:
+        """
+        Start a worker process, returning it with the connection it reports its readiness on
+        and receives the drain request on.
+        """
+        connection, worker_connection = self._context.Pipe()
+        sockets = self._sockets + self._worker_sockets[index:index + 1]
+        process = self._context.Process(
+            target=serve,
+            args=(self, sockets, worker_connection, index),
+            name=f"AiohttpServer-{index}",
             daemon=True)
-        self._process.start()
+        try:
+            process.start()
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            connection.close()
+            raise ServerStartupError(
+                f"The server can not be sent to a worker started with "
+                f"'{self._context.get_start_method()}': {e}. Use module-level functions "
+                f"in AIOHTTP_REQUEST_HEADERS_CONFIG or the 'fork' start method."
+            ) from e
+        finally:
+            # Only the worker keeps the sending end, so its exit is seen as the end of the pipe.
+            worker_connection.close()
+        return process, connection
 
-    def stop(self):
+    def _wait_ready(self, process: BaseProcess, connection: Connection, deadline: float):
         """
-        Terminate server process.
+        Wait for a worker to report that it is serving on the listening sockets.
         """
-        self._process.terminate()
-        self._process.join()
-        self._process = None
-        server_info = f"Server at http://{self._host}:{self._port}"
-        logging.info(f"{server_info} has been stopped.")
+        try:
+            if not connection.poll(max(0.0, deadline - time.monotonic())):
+                raise ServerStartupError(f"{process.name} was not ready within {self.startup_timeout} seconds.")
+            error = connection.recv()
+        except EOFError:
+            connection.close()
+            process.join(1.0)
+            raise ServerStartupError(f"{process.name} exited with code {process.exitcode} before it was ready.")
+        except ServerStartupError:
+            connection.close()
+            raise
+        if error is not None:
+            connection.close()
+            raise ServerStartupError(f"{process.name} failed to start: {error}")
+
+    def _supervise(self):
+        """
+        Restart worker processes that exited until the server is stopped.
+        """
+        while not self._stopping.wait(self.health_check_interval):
+            for index, process in enumerate(self._processes):
+                if process.is_alive() or self._stopping.is_set():
+                    continue
+                logging.warning(f"{process.name} exited with code {process.exitcode}, restarting it.")
+                process.join()
+                self._connections[index].close()
+                process, connection = self._start_worker(index)
+                self._processes[index] = process
+                self._connections[index] = connection
+                self.restarts += 1
+                try:
+                    self._wait_ready(process, connection, time.monotonic() + self.startup_timeout)
+                except ServerStartupError as e:
+                    logging.warning(f"Restarted worker failed to start: {e}")
+
+    async def _on_startup(self, app: web.Application):
+        """
+        Open the pooled client session shared by all proxied requests.
+
+        Upstream proxies and named sessions get their own sessions, opened on first use with the same options.
+        With several workers, the session forwarding requests to the other workers is opened as well,
+        and the metrics of this worker get its worker label.
+        """
+        self._session_options = {
+            "ssl_context": create_ssl_context(bool(self.connector_config["ssl"])),
+            "auto_decompress": self.decompress,
+            "trace_configs": [self.metrics.create_trace_config()] if self.metrics is not None else None,
+            "timeout": self.timeout,
+        }
+        self._client_session = create_client_session(self.connector_config, **self._session_options)
+        if self._worker_urls:
+            self._worker_session = ClientSession(
+                cookie_jar=DummyCookieJar(), auto_decompress=False, timeout=ClientTimeout(total=None)
+            )
+            if self.metrics is not None:
+                self.metrics.labels = {"worker": str(self._worker_index)}
+
+    async def _on_cleanup(self, app: web.Application):
+        """
+        Close the shared client session and its connection pool, save the cookies of the named sessions
+        and close them, drop the response cache and stop the extraction threads.
+        """
+        if self._prewarmer is not None:
+            await self._prewarmer.close()
+        await self._sessions.close()
+        if self._worker_session is not None:
+            await self._worker_session.close()
+            self._worker_session = None
+        if self._client_session is not None:
+            await self._client_session.close()
+            self._client_session = None
+        if self._proxy_pool is not None:
+            await self._proxy_pool.close()
+        if self._cache is not None:
+            self._cache.clear()
+        self._extractor.close()
 
     @property
     def request_header_config(self) -> RequestHeaders:
@@ -87,12 +542,14 @@ class AiohttpServer:
         - None: Inherit the header value from the incoming request's headers. The proxy server will pass along the same value it receives.
         """
         self.__request_headers_config[name] = value
+        self._header_plan = None
 
     def extract_request_header_config(self, request_headers: RequestHeaders):
         """
         Extract request_headers to request_headers_config.
         """
         self.__request_headers_config.update(request_headers)
+        self._header_plan = None
 
     @middleware
     async def _handler_validation_middleware(self, request: Request, handler: Callable | partial):
@@ -103,51 +560,623 @@ class AiohttpServer:
             return await handler(request)
         return web.Response(status=404, text="Handler not found in the list of allowed handlers")
 
-    async def _handle_request(self, request: Request) -> web.Response:
+    @middleware
+    async def _timing_middleware(self, request: Request, handler: Callable | partial):
+        """
+        Middleware to time proxied requests and count them in the server metrics.
+        """
+        if request.match_info.handler in (self._handle_metrics, self._handle_health, self._handle_prewarm):
+            return await handler(request)
+        metrics = self.metrics
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        metrics.inc("requests_in_progress")
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            if response.prepared:
+                metrics.inc("bytes_out_total", response.body_length)
+            else:
+                metrics.inc("bytes_out_total", response.content_length or 0)
+            return response
+        finally:
+            current_timings.reset(token)
+            metrics.inc("requests_in_progress", -1)
+            metrics.inc("requests_total", status=status)
+            metrics.observe_timings(timings)
+
+    @middleware
+    async def _admission_middleware(self, request: Request, handler: Callable | partial):
+        """
+        Middleware to admit proxy requests within the limits of the worker, rejecting the others with a 503.
+        """
+        if request.match_info.handler not in (self._handle_request, self._handle_batch):
+            return await handler(request)
+        admission = self._admission
+        ticket = await admission.admit()
+        if ticket is None:
+            return web.Response(
+                status=503, text="Server overloaded", headers={hdrs.RETRY_AFTER: str(admission.retry_after)}
+            )
+        token = current_ticket.set(ticket)
+        try:
+            return await handler(request)
+        finally:
+            current_ticket.reset(token)
+            admission.release(ticket)
+
+    async def _drain(self, timeout: float | None) -> dict[str, int]:
+        """
+        Drain this worker: reject new requests and wait for the requests in flight.
+
+        The cookie jars of the named sessions are saved before the report is sent, since the worker
+        is terminated once the parent receives it.
+        """
+        report = await self._admission.drain(timeout)
+        self._sessions.export()
+        return report
+
+    async def _handle_health(self, request: Request) -> web.Response:
+        """
+        Answer the health checks of the middleware, which ejects servers that fail them from a server farm.
+        """
+        return web.Response(text="OK")
+
+    async def _handle_prewarm(self, request: Request) -> web.Response:
+        """
+        Start opening pooled connections to a JSON list of origins, before the requests to them arrive.
+
+        Answers with the origins being warmed. Nothing is warmed when upstream requests go through
+        the upstream proxy pool, since their connections are opened to the proxies.
+        """
+        try:
+            origins = await request.json()
+        except ValueError:
+            origins = None
+        if not isinstance(origins, list) or not all(isinstance(origin, str) for origin in origins):
+            return web.Response(status=400, text="Expected a JSON list of origins")
+        if self._proxy_pool is not None:
+            return web.json_response({"warming": []}, status=202)
+        warming = self._prewarmer.schedule(self._client_session.connector, origins)
+        return web.json_response({"warming": warming}, status=202)
+
+    async def _handle_metrics(self, request: Request) -> web.Response:
+        """
+        Return the metrics of all server workers in the Prometheus text format.
+
+        With several workers, the worker handling the scrape collects the samples of the others from their
+        loopback sockets, which answer `?scope=worker` with their own samples only.
+        """
+        if request.query.get("scope") == "worker":
+            return web.json_response(self.metrics.samples())
+        others = []
+        for index, worker_url in enumerate(self._worker_urls):
+            if index == self._worker_index:
+                continue
+            try:
+                async with self._worker_session.get(
+                        f"{worker_url}/metrics", params={"scope": "worker"}, timeout=ClientTimeout(total=5)
+                ) as response:
+                    response.raise_for_status()
+                    others.append(await response.json())
+            except (asyncio.TimeoutError, ClientError) as e:
+                logging.warning(f"Metrics of worker {index} unavailable: {e}")
+        return web.Response(text=self.metrics.render(others), content_type="text/plain", charset="utf-8")
+
+    async def _handle_request(self, request: Request) -> web.StreamResponse:
         """
         Handle incoming proxy requests by forwarding them to the target server and returning the response.
+
+        Requests with an extraction spec get the values extracted from the response instead, so
+        their response is buffered even when responses are streamed.
         """
-        url = request.match_info.get("url")
-        request_headers = self._get_request_headers(request)
-        try:
-            async with ClientSession(headers=request_headers, trust_env=True) as session:
-                async with session.get(url=url) as response:
-                    body = await response.read()
-                    status = response.status
-        except ClientResponseError as cre:
-            logging.warning(f"ClientResponseError: {cre}")
-            return web.Response(status=cre.status, text=f"ClientResponseError: {cre}")
-        except ClientError as ce:
-            logging.warning(f"ClientError: {ce}")
-            return web.Response(status=500, text=f"ClientError: {ce}")
+        worker = self._get_session_worker(request)
+        if worker is not None:
+            status, headers, body = await self._forward_to_worker(request, worker)
+            return self._make_response(request, status, headers, body)
+        try:
+            extract_spec = self._get_extract_spec(request)
+        except ValueError as e:
+            return web.Response(status=400, text=str(e))
+        if extract_spec is not None:
+            status, headers, body = await self._proxy_extract(request, extract_spec)
+        elif self.stream_responses:
+            url, request_headers, options, host = self._prepare_request(request)
+            session_name = request.headers.get(SESSION_HEADER) or None
+            try:
+                return await self._forward_stream(request, url, request_headers, options, host, session_name)
+            except StreamAbortedError as e:
+                # Nothing more can be sent, Scrapy sees the aborted transfer as a connection error.
+                return e.stream
+            except (MaxSizeExceededError, asyncio.TimeoutError, ClientError) as e:
+                status, headers, body = self._get_error_result(url, e)
         else:
-            web_response = web.Response(
-                body=body,
-                status=status,
-                content_type="text/html",
+            status, headers, body = await self._proxy(request)
+        return self._make_response(request, status, headers, body)
+
+    async def _handle_batch(self, request: Request) -> web.StreamResponse:
+        """
+        Handle a batch of proxy requests sent as one JSON fetch spec per line.
+
+        Responses are streamed back in the order they complete, each as a JSON line with its id,
+        status, headers and body length, followed by the body.
+        """
+        stream = web.StreamResponse(headers={hdrs.CONTENT_TYPE: BATCH_RESULTS_CONTENT_TYPE})
+        await stream.prepare(request)
+        payload = await request.content.read()
+        lock = asyncio.Lock()
+        tasks = [
+            asyncio.ensure_future(self._handle_batch_item(line, stream, lock))
+            for line in payload.split(b"\n") if line.strip()
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        await stream.write_eof()
+        return stream
+
+    async def _handle_batch_item(self, line: bytes, stream: web.StreamResponse, lock: asyncio.Lock):
+        item_id = None
+        try:
+            item = BatchItem.from_json(line)
+            item_id = item.id
+            worker = self._get_session_worker(item)
+            extract_spec = self._get_extract_spec(item) if worker is None else None
+        except ValueError as e:
+            logging.warning(f"Invalid batch item: {e}")
+            status, headers, body = 400, CIMultiDict({hdrs.CONTENT_TYPE: "text/plain; charset=utf-8"}), str(e).encode()
+        else:
+            timings = None
+            if self.metrics is not None:
+                timings = RequestTimings()
+                current_timings.set(timings)
+            if worker is not None:
+                status, headers, body = await self._forward_to_worker(item, worker)
+            elif extract_spec is not None:
+                status, headers, body = await self._proxy_extract(item, extract_spec)
+            else:
+                status, headers, body = await self._proxy(item)
+            if timings is not None:
+                self.metrics.inc("batch_items_total", status=status)
+                self.metrics.observe_timings(timings)
+        async with lock:
+            await stream.write(encode_result_head(item_id, status, headers.items(), len(body)))
+            await stream.write(body)
+
+    def _get_session_worker(self, request: Request | BatchItem) -> int | None:
+        """
+        Get the worker owning the named session of a request, when it is another worker.
+
+        With several workers, the kernel spreads the loopback connections over them, so every named
+        session is owned by one worker, found by hashing its name, which keeps its cookie jar.
+        """
+        session_name = request.headers.get(SESSION_HEADER)
+        if not session_name or len(self._worker_urls) < 2:
+            return None
+        digest = hashlib.blake2b(session_name.encode(), digest_size=8).digest()
+        worker = int.from_bytes(digest, "big") % len(self._worker_urls)
+        return worker if worker != self._worker_index else None
+
+    async def _forward_to_worker(self, request: Request | BatchItem, worker: int) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Get the whole response to a proxy request from the worker owning its named session.
+
+        The request is sent with its control headers to the loopback socket of that worker, asking
+        for an identity encoding, so the response is compressed for Scrapy here if needed.
+        """
+        url = f"{self._worker_urls[worker]}/request/{self._get_target_url(request)}"
+        excluded = {name.lower() for name in HOP_BY_HOP_HEADERS | {hdrs.HOST, hdrs.ACCEPT_ENCODING}}
+        headers = CIMultiDict(
+            (name, value) for name, value in request.headers.items() if name.lower() not in excluded
+        )
+        headers[hdrs.ACCEPT_ENCODING] = "identity"
+        data = request.content if request.body_exists else None
+        try:
+            async with self._worker_session.request(
+                    request.method, url, headers=headers, data=data, allow_redirects=False
+            ) as response:
+                body = await response.read()
+        except (asyncio.TimeoutError, ClientError) as e:
+            return self._get_error_result(url, e)
+        response_headers = CIMultiDict(
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in self._excluded_response_headers
+        )
+        return response.status, response_headers, body
+
+    def _get_extract_spec(self, request: Request | BatchItem) -> dict[str, ExtractField] | None:
+        """
+        Get the extraction spec of a proxy request from its control header, raising ValueError when it is invalid.
+        """
+        value = request.headers.get(EXTRACT_HEADER)
+        return parse_extract_spec(value) if value is not None else None
+
+    async def _proxy_extract(
+            self, request: Request | BatchItem, extract_spec: dict[str, ExtractField]
+    ) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Get the response to a proxy request with the values extracted from its body as body.
+        """
+        status, headers, body = await self._proxy(request)
+        try:
+            return await self._extractor.apply(extract_spec, status, headers, body)
+        except ValueError as e:
+            logging.warning(f"Extraction failed: {e}")
+            return 400, CIMultiDict({hdrs.CONTENT_TYPE: "text/plain; charset=utf-8"}), str(e).encode()
+
+    def _prepare_request(self, request: Request | BatchItem) -> tuple[str, CIMultiDict, dict, str]:
+        """
+        Get the target URL, headers and aiohttp request options of a proxy request, and its target host.
+        """
+        url = self._get_target_url(request)
+        context = HeaderContext(request)
+        request_headers = self._build_request_headers(request, context)
+        options = self._get_request_options(request)
+        if "timeout" in options:
+            # The timeout of the request replaces the total timeout only.
+            options["timeout"] = ClientTimeout(
+                total=options["timeout"].total,
+                sock_connect=self.timeout.sock_connect,
+                sock_read=self.timeout.sock_read,
             )
-            return web_response
+        if request.body_exists:
+            if request.content_length is not None:
+                request_headers[hdrs.CONTENT_LENGTH] = str(request.content_length)
+            options["data"] = request.content
+        timings = current_timings.get()
+        if timings is not None:
+            options["trace_request_ctx"] = timings
+        return url, request_headers, options, context.url.host
+
+    async def _proxy(self, request: Request | BatchItem) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Get the whole response to a proxy request from the cache, from an identical request
+        in flight or from the target server.
+
+        Requests of a named session skip the cache and are not coalesced, since their response
+        depends on the cookies of the session, and may update them.
+
+        Errors are turned into error responses.
+        """
+        url, request_headers, options, host = self._prepare_request(request)
+        session_name = request.headers.get(SESSION_HEADER) or None
+        cache_key = entry = None
+        if self._cache is not None and not request.body_exists and session_name is None and \
+                self._cache.is_cacheable_request(request.method, request.headers, request_headers):
+            cache_key = self._cache.make_key(request.method, url, request_headers, options)
+            entry = self._cache.get(cache_key)
+            if entry is not None and entry.is_fresh() and not self._cache.requires_revalidation(request.headers):
+                result = await self._get_cached_result(entry, "HIT")
+                if result is not None:
+                    return result
+                entry = None
+            if entry is not None:
+                request_headers.update(entry.conditional_headers())
+        coalesce_key = None
+        if self._singleflight is not None and not request.body_exists and session_name is None and \
+                self._singleflight.applies(request.method, url):
+            coalesce_key = cache_key or ResponseCache.make_key(request.method, url, request_headers, options)
+        shared = False
+        fetch = self._get_fetch(request.method, url, request_headers, options, host, session_name)
+        try:
+            if coalesce_key is None:
+                status, headers, body = await fetch()
+            else:
+                (status, headers, body), shared = await self._singleflight.run(coalesce_key, fetch)
+                headers = self._get_coalesced_headers(headers, shared)
+        except (MaxSizeExceededError, asyncio.TimeoutError, ClientError) as e:
+            return self._get_error_result(url, e)
+        if cache_key is None:
+            return status, headers, body
+        if status == 304 and entry is not None:
+            result = await self._get_cached_result(self._cache.revalidate(entry, headers), "REVALIDATED")
+            if result is not None:
+                # The cookies set by the 304 response are for this request only.
+                result[1].extend((name, value) for name, value in headers.items() if name.lower() in PRIVATE_HEADERS)
+                return result
+        if not shared:
+            await self._cache.store(cache_key, status, headers, body)
+        self._cache.count("miss")
+        headers[CACHE_HEADER] = "MISS"
+        return status, headers, body
+
+    def _get_fetch(
+            self, method: str, url: str, request_headers: CIMultiDict, options: dict, host: str,
+            session_name: str | None = None,
+    ):
+        """
+        Get the fetch of an upstream request, hedged and retried according to the server policies.
+
+        Requests with a body are sent once, since their body is read from the incoming request.
+        """
+        fetch = partial(self._fetch, method, url, request_headers, options, host, session_name)
+        if "data" in options:
+            return fetch
+        if self._hedge is not None and self._hedge.applies(method):
+            fetch = partial(self._hedge.run, fetch)
+        if self._retry is not None and self._retry.applies(method):
+            total = options.get("timeout", self.timeout).total
+            deadline = time.monotonic() + total if total else None
+            fetch = partial(self._retry.run, fetch, deadline)
+        return fetch
+
+    @staticmethod
+    def _get_error_result(url: str, error: Exception) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Log an upstream error and get the error response returned to Scrapy for it.
+        """
+        if isinstance(error, MaxSizeExceededError):
+            logging.warning(f"MaxSizeExceededError: {error}")
+            status, text = 502, f"MaxSizeExceededError: {error}"
+        elif isinstance(error, asyncio.TimeoutError):
+            logging.warning(f"TimeoutError: {url} {error}")
+            status, text = 504, f"TimeoutError: {url}"
+        elif isinstance(error, ClientResponseError):
+            logging.warning(f"ClientResponseError: {error}")
+            status, text = error.status, f"ClientResponseError: {error}"
+        else:
+            logging.warning(f"ClientError: {error}")
+            status, text = 500, f"ClientError: {error}"
+        return status, CIMultiDict({hdrs.CONTENT_TYPE: "text/plain; charset=utf-8"}), text.encode()
+
+    async def _fetch(
+            self, method: str, url: str, request_headers: CIMultiDict, options: dict, host: str,
+            session_name: str | None = None,
+    ) -> tuple[int, CIMultiDict, bytes]:
+        """
+        Send a request to the target server and read its whole body.
+        """
+        upstream = self._upstream(host, options, session_name)
+        async with self._throttle_slot(host) as slot, upstream as (session, options, attempt):
+            start_time = time.monotonic()
+            async with session.request(method, url, headers=request_headers, **options) as response:
+                self._record_latency(slot, start_time, response)
+                if attempt is not None:
+                    attempt.respond(response.status)
+                ticket = current_ticket.get()
+                if ticket is not None:
+                    # The announced length is charged while the body is read, then the length read.
+                    expected_size = response.content_length or 0
+                    self._admission.charge(ticket, expected_size)
+                    try:
+                        body = await read_body(response, self.chunk_size, self.maxsize, self.warnsize)
+                    finally:
+                        self._admission.charge(ticket, -expected_size)
+                    self._admission.charge(ticket, len(body))
+                else:
+                    body = await read_body(response, self.chunk_size, self.maxsize, self.warnsize)
+                timings = current_timings.get()
+                if timings is not None:
+                    timings.end = time.monotonic()
+                    self.metrics.inc("bytes_in_total", len(body))
+                return response.status, self._get_response_headers(response, slot), body
+
+    async def _forward_stream(
+            self, request: Request, url: str, request_headers: CIMultiDict, options: dict, host: str,
+            session_name: str | None = None,
+    ) -> web.StreamResponse:
+        """
+        Send a request to the target server and stream its body back to Scrapy.
+        """
+        upstream = self._upstream(host, options, session_name)
+        async with self._throttle_slot(host) as slot, upstream as (session, options, attempt):
+            start_time = time.monotonic()
+            async with session.request(request.method, url, headers=request_headers, **options) as response:
+                self._record_latency(slot, start_time, response)
+                if attempt is not None:
+                    attempt.respond(response.status)
+                return await self._stream_response(request, response, slot)
+
+    @asynccontextmanager
+    async def _upstream(self, host: str, options: dict, session_name: str | None = None):
+        """
+        Get the client session and options of an upstream request, and its upstream proxy attempt.
+
+        Requests of a named session use its client session. Requests go through a proxy of the
+        upstream proxy pool, if any, unless they set their own proxy.
+        """
+        async with self._named_session(session_name) as named_session:
+            if self._proxy_pool is None or "proxy" in options:
+                yield named_session or self._client_session, options, None
+                return
+            async with self._proxy_pool.attempt(host) as attempt:
+                session = named_session or self._get_proxy_session(attempt.proxy)
+                yield session, {**options, "proxy": attempt.proxy.url}, attempt
+
+    def _named_session(self, session_name: str | None):
+        if session_name is None:
+            return nullcontext()
+        return self._sessions.use(session_name, partial(
+            create_client_session, self.connector_config, **self._session_options
+        ))
+
+    def _get_proxy_session(self, proxy: UpstreamProxy) -> ClientSession:
+        """
+        Get the pooled client session of an upstream proxy, opening it on first use.
+        """
+        if proxy.session is None:
+            proxy.session = create_client_session(self.connector_config, **self._session_options)
+        return proxy.session
+
+    def _throttle_slot(self, host: str):
+        return self._throttle.slot(host) if self._throttle is not None else nullcontext()
+
+    def _record_latency(self, slot: HostSlot | None, start_time: float, response: ClientResponse):
+        if slot is not None:
+            self._throttle.record(
+                slot, time.monotonic() - start_time, response.status, response.headers.get(hdrs.RETRY_AFTER)
+            )
+
+    def _get_coalesced_headers(self, headers: CIMultiDict, shared: bool) -> CIMultiDict:
+        """
+        Copy the headers of a coalesced fetch for one of its requests.
+
+        The body is shared by all the requests as it is, while each gets its own headers.
+        Requests that waited for an earlier fetch report their own timings.
+        """
+        headers = CIMultiDict(headers)
+        if shared:
+            if self.metrics is not None:
+                self.metrics.inc("coalesced_requests_total")
+            timings = current_timings.get()
+            if timings is not None:
+                timings.end = time.monotonic()
+                headers[TIMINGS_HEADER] = timings.header_value()
+        return headers
+
+    async def _get_cached_result(self, entry: CacheEntry, result: str) -> tuple[int, CIMultiDict, bytes] | None:
+        """
+        Get the response stored in a cache entry, or None if its body is gone.
+        """
+        body = await self._cache.load(entry)
+        if body is None:
+            return None
+        self._cache.count(result.lower())
+        headers = CIMultiDict(entry.headers)
+        headers[CACHE_HEADER] = result
+        return entry.status, headers, body
+
+    def _make_response(self, request: Request, status: int, headers: CIMultiDict, body: bytes) -> web.Response:
+        """
+        Build the buffered response to Scrapy, compressing its body for the loopback hop if needed.
+        """
+        encoding = self._get_loopback_encoding(request, headers, len(body))
+        if encoding is not None:
+            compressor = get_compressor(encoding)
+            body = compressor.compress(body) + compressor.flush()
+            headers[hdrs.CONTENT_ENCODING] = encoding
+        return web.Response(body=body, status=status, headers=headers)
+
+    async def _stream_response(
+            self, request: Request, response: ClientResponse, slot: HostSlot | None = None
+    ) -> web.StreamResponse:
+        """
+        Forward the upstream body chunk by chunk without buffering it.
+
+        An announced Content-Length over maxsize is rejected before anything is sent. A body that
+        grows over maxsize, or that fails upstream, while streaming aborts the transfer, so Scrapy
+        sees an incomplete response at once; upstream failures are raised as StreamAbortedError.
+        """
+        check_expected_size(str(response.url), response.content_length, self.maxsize, self.warnsize)
+        headers = self._get_response_headers(response, slot)
+        encoding = self._get_loopback_encoding(request, headers, response.content_length)
+        compressor = None
+        if encoding is not None:
+            compressor = get_compressor(encoding)
+            headers[hdrs.CONTENT_ENCODING] = encoding
+        stream = web.StreamResponse(status=response.status, headers=headers)
+        await stream.prepare(request)
+        timings = current_timings.get()
+        try:
+            async for chunk in iter_body(response, self.chunk_size, self.maxsize):
+                if timings is not None:
+                    self.metrics.inc("bytes_in_total", len(chunk))
+                if compressor is not None:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    await stream.write(chunk)
+        except MaxSizeExceededError as e:
+            logging.warning(f"MaxSizeExceededError: {e}")
+            self._abort_stream(request)
+            return stream
+        except (asyncio.TimeoutError, ClientError) as e:
+            logging.warning(f"Streaming failed: {response.url} {e!r}")
+            self._abort_stream(request)
+            raise StreamAbortedError(stream, e) from e
+        finally:
+            if timings is not None:
+                timings.end = time.monotonic()
+        if compressor is not None:
+            await stream.write(compressor.flush())
+        await stream.write_eof()
+        return stream
+
+    @staticmethod
+    def _abort_stream(request: Request):
+        if request.transport is not None:
+            request.transport.close()
+
+    def _get_loopback_encoding(self, request: Request, headers: CIMultiDict, size: int | None) -> str | None:
+        """
+        Choose the content coding of the response sent back to Scrapy, if it should be compressed.
+
+        Bodies that are already encoded, smaller than the minimum size, or in a coding Scrapy does
+        not accept are sent as they are.
+        """
+        encoding = self.loopback_compression
+        if encoding is None or hdrs.CONTENT_ENCODING in headers:
+            return None
+        if size is not None and size < self.loopback_compression_min_size:
+            return None
+        if not accepts_encoding(request.headers.get(hdrs.ACCEPT_ENCODING), encoding):
+            return None
+        return encoding
+
+    def _get_response_headers(self, response: ClientResponse, slot: HostSlot | None = None) -> CIMultiDict:
+        """
+        Get the upstream response headers to send back to Scrapy.
+
+        Hop-by-hop and framing headers are dropped. Content-Encoding is dropped as well when
+        aiohttp has decompressed the body. The final URL is added in the URL header, the
+        current delay of the target host in the host delay header when throttling is enabled,
+        and the phase durations measured so far in the timings header when metrics are enabled.
+        """
+        excluded_headers = self._excluded_response_headers
+        headers = CIMultiDict(
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in excluded_headers
+        )
+        headers[URL_HEADER] = str(response.url)
+        if slot is not None:
+            headers[HOST_DELAY_HEADER] = f"{max(slot.delay, slot.retry_after):.3f}"
+        timings = current_timings.get()
+        if timings is not None:
+            headers[TIMINGS_HEADER] = timings.header_value()
+        return headers
+
+    @staticmethod
+    def _get_target_url(request: Request) -> str:
+        """
+        Get the target URL of a proxy request, including its query string.
+        """
+        url = request.match_info.get("url")
+        if request.query_string:
+            return f"{url}?{request.query_string}"
+        return url
+
+    @staticmethod
+    def _get_request_options(request: Request) -> dict:
+        """
+        Translate the control headers set by AiohttpMiddleware into aiohttp request options.
+        """
+        headers = request.headers
+        options = {}
+        if COOKIES_HEADER in headers:
+            options["cookies"] = json.loads(headers[COOKIES_HEADER])
+        if TIMEOUT_HEADER in headers:
+            options["timeout"] = ClientTimeout(total=float(headers[TIMEOUT_HEADER]))
+        if headers.get(ALLOW_REDIRECTS_HEADER) == "0":
+            options["allow_redirects"] = False
+        if PROXY_HEADER in headers:
+            options["proxy"] = headers[PROXY_HEADER]
+        return options
 
     def _get_request_headers(self, request: Request) -> CIMultiDictProxy:
         """
         Get the request headers, including any custom headers added by the application.
         """
-        request_headers = request.headers
-        saved_headers = []
-        for head, value in self.__request_headers_config.items():
-            if head in request_headers:
-                if value is None:
-                    values = request_headers.getall(head)
-                    saved_headers.extend((head, val) for val in values)
-                    continue
+        return CIMultiDictProxy(self._build_request_headers(request))
 
-            if value is None:
-                continue
-            elif isinstance(value, Callable):
-                saved_headers.append((head, value(request)))
-            elif isinstance(value, str):
-                saved_headers.append((head, value))
-            else:
-                raise TypeError(f'Value {type(value)} error for head: {head}')
+    def _build_request_headers(self, request: Request, context: HeaderContext | None = None) -> CIMultiDict:
+        """
+        Build the mutable request headers of a proxy request.
 
-        return CIMultiDictProxy(CIMultiDict(saved_headers))
+        The headers are built from the plan compiled in `_prerun_configurator`, which is
+        compiled again after the request headers configuration changes.
+        """
+        if self._header_plan is None:
+            self._header_plan = HeaderPlan(self.__request_headers_config)
+        return self._header_plan.build(request, context)
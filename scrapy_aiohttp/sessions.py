@@ -0,0 +1,206 @@
+import asyncio
+import hashlib
+import logging
+import os
+import ssl
+
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Callable
+
+from aiohttp import ClientSession, TCPConnector, CookieJar, DummyCookieJar
+
+from scrapy_aiohttp.utils import (
+    ConnectorConfig,
+    SessionConfig,
+    DEFAULT_AIOHTTP_CONNECTOR_CONFIG,
+    DEFAULT_AIOHTTP_SESSION_CONFIG,
+)
+from .metrics import ProxyMetrics
+
+
+def create_ssl_context(verify: bool = True) -> ssl.SSLContext | bool:
+    """
+    Create the SSL context shared by every connection of a connector.
+
+    Returns False when certificate verification is disabled.
+    """
+    if not verify:
+        return False
+    return ssl.create_default_context()
+
+
+def create_connector(
+        connector_config: ConnectorConfig | None = None,
+        ssl_context: ssl.SSLContext | bool | None = None,
+) -> TCPConnector:
+    """
+    Create a pooled TCPConnector from the connector configuration.
+    """
+    config = {**DEFAULT_AIOHTTP_CONNECTOR_CONFIG, **(connector_config or {})}
+    if ssl_context is None:
+        ssl_context = create_ssl_context(bool(config["ssl"]))
+    return TCPConnector(
+        limit=config["limit"],
+        limit_per_host=config["limit_per_host"],
+        keepalive_timeout=config["keepalive_timeout"],
+        ttl_dns_cache=config["ttl_dns_cache"],
+        ssl=ssl_context,
+    )
+
+
+def create_client_session(
+        connector_config: ConnectorConfig | None = None,
+        ssl_context: ssl.SSLContext | bool | None = None,
+        **kwargs,
+) -> ClientSession:
+    """
+    Create a long-lived ClientSession with its own connection pool.
+
+    The session does not keep cookies unless a cookie jar is passed explicitly,
+    so responses of unrelated requests never leak into each other.
+    """
+    kwargs.setdefault("cookie_jar", DummyCookieJar())
+    kwargs.setdefault("trust_env", True)
+    return ClientSession(
+        connector=create_connector(connector_config, ssl_context),
+        **kwargs,
+    )
+
+
+def get_cookie_jar_path(directory: str, name: str) -> str:
+    """
+    Get the file the cookie jar of a named session is saved to, in the format of `CookieJar.save`.
+    """
+    digest = hashlib.blake2b(name.encode(), digest_size=16).hexdigest()
+    return os.path.join(directory, f"{digest}.cookies")
+
+
+class NamedSession:
+    """
+    A named client session of the pool, with the number of requests using it.
+    """
+
+    __slots__ = ("name", "session", "active", "retired")
+
+    def __init__(self, name: str, session: ClientSession):
+        self.name = name
+        self.session = session
+        self.active = 0
+        self.retired = False
+
+
+class SessionPool:
+    """
+    Named client sessions of a server worker, each with its own cookie jar and connection pool.
+
+    Requests of a named session share the cookies set by the targets, and reuse the keep-alive
+    connections of the session along with their TLS sessions. At most max_sessions sessions stay
+    open; opening one more closes the least recently used one once its requests end. With a
+    directory, the cookie jar of a session is saved there when the session is closed, and loaded
+    again when a session of the same name is opened, by this crawl or by the next one. With several
+    server workers, each session is owned by one of them, so a jar is only kept and saved by one worker.
+    """
+
+    def __init__(self, session_config: SessionConfig | None = None, metrics: ProxyMetrics | None = None):
+        config = {**DEFAULT_AIOHTTP_SESSION_CONFIG, **(session_config or {})}
+        self.max_sessions = max(1, config["max_sessions"])
+        self.directory = config["directory"]
+        self.allow_ip_cookies = bool(config["allow_ip_cookies"])
+        self.sessions: OrderedDict[str, NamedSession] = OrderedDict()
+        self._closing: set[asyncio.Task] = set()
+        self.metrics = metrics
+        if metrics is not None:
+            metrics.describe("named_sessions", "gauge", "Named sessions open.")
+            metrics.describe("named_session_evictions_total", "counter", "Named sessions closed to open another one.")
+
+    @asynccontextmanager
+    async def use(self, name: str, create: Callable[..., ClientSession]):
+        """
+        Send a request with a named session, opening it with `create(cookie_jar=...)` when it is not open.
+        """
+        named = self.sessions.get(name)
+        if named is None:
+            named = NamedSession(name, create(cookie_jar=self.load_cookie_jar(name)))
+            self.sessions[name] = named
+            while len(self.sessions) > self.max_sessions:
+                _, evicted = self.sessions.popitem(last=False)
+                self._retire(evicted)
+                if self.metrics is not None:
+                    self.metrics.inc("named_session_evictions_total")
+            if self.metrics is not None:
+                self.metrics.set("named_sessions", len(self.sessions))
+        else:
+            self.sessions.move_to_end(name)
+        named.active += 1
+        try:
+            yield named.session
+        finally:
+            named.active -= 1
+            if named.retired and not named.active:
+                self._close_session(named)
+
+    def load_cookie_jar(self, name: str) -> CookieJar:
+        """
+        Get the cookie jar of a named session, with the cookies saved in the directory, if any.
+        """
+        cookie_jar = CookieJar(unsafe=self.allow_ip_cookies)
+        if self.directory is None:
+            return cookie_jar
+        path = get_cookie_jar_path(self.directory, name)
+        if os.path.exists(path):
+            try:
+                cookie_jar.load(path)
+            except Exception as e:
+                logging.warning(f"Could not load the cookies of session {name!r}: {e!r}")
+        return cookie_jar
+
+    def save_cookie_jar(self, name: str, cookie_jar: CookieJar):
+        """
+        Save the cookie jar of a named session to the directory, if any.
+
+        The jar is written to a temporary file first, so a jar being saved by another server
+        worker or loaded by the next crawl is never read half written.
+        """
+        if self.directory is None:
+            return
+        path = get_cookie_jar_path(self.directory, name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            cookie_jar.save(temp_path)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logging.warning(f"Could not save the cookies of session {name!r}: {e!r}")
+
+    def export(self):
+        """
+        Save the cookie jars of every open session to the directory.
+        """
+        for named in self.sessions.values():
+            self.save_cookie_jar(named.name, named.session.cookie_jar)
+
+    def _retire(self, named: NamedSession):
+        named.retired = True
+        # Saved now, so the session can be opened again before its requests end.
+        self.save_cookie_jar(named.name, named.session.cookie_jar)
+        if not named.active:
+            self._close_session(named)
+
+    def _close_session(self, named: NamedSession):
+        self.save_cookie_jar(named.name, named.session.cookie_jar)
+        task = asyncio.ensure_future(named.session.close())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def close(self):
+        """
+        Save the cookie jars of every session and close the sessions.
+        """
+        sessions, self.sessions = self.sessions, OrderedDict()
+        for named in sessions.values():
+            self._close_session(named)
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        if self.metrics is not None:
+            self.metrics.set("named_sessions", 0)
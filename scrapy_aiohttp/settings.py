@@ -0,0 +1,252 @@
+from scrapy.settings import Settings
+from scrapy.utils.misc import load_object
+
+from scrapy_aiohttp.utils import (
+    ConnectorConfig,
+    ThrottleConfig,
+    CacheConfig,
+    CoalesceConfig,
+    TimeoutConfig,
+    RetryConfig,
+    HedgeConfig,
+    ProxyConfig,
+    FarmConfig,
+    PrewarmConfig,
+    ExtractConfig,
+    AdmissionConfig,
+    SessionConfig,
+    DEFAULT_AIOHTTP_CONNECTOR_CONFIG,
+    DEFAULT_AIOHTTP_THROTTLE_CONFIG,
+    DEFAULT_AIOHTTP_CACHE_CONFIG,
+    DEFAULT_AIOHTTP_COALESCE_CONFIG,
+    DEFAULT_AIOHTTP_TIMEOUT_CONFIG,
+    DEFAULT_AIOHTTP_RETRY_CONFIG,
+    DEFAULT_AIOHTTP_HEDGE_CONFIG,
+    DEFAULT_AIOHTTP_PROXY_CONFIG,
+    DEFAULT_AIOHTTP_FARM_CONFIG,
+    DEFAULT_AIOHTTP_PREWARM_CONFIG,
+    DEFAULT_AIOHTTP_EXTRACT_CONFIG,
+    DEFAULT_AIOHTTP_ADMISSION_CONFIG,
+    DEFAULT_AIOHTTP_SESSION_CONFIG,
+)
+
+
+def get_connector_config(settings: Settings) -> ConnectorConfig:
+    """Collect the AIOHTTP_CONNECTOR_* settings for an aiohttp connection pool."""
+
+    default = DEFAULT_AIOHTTP_CONNECTOR_CONFIG
+    return {
+        "limit": settings.getint("AIOHTTP_CONNECTOR_LIMIT", default["limit"]),
+        "limit_per_host": settings.getint("AIOHTTP_CONNECTOR_LIMIT_PER_HOST", default["limit_per_host"]),
+        "keepalive_timeout": settings.getfloat("AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT", default["keepalive_timeout"]),
+        "ttl_dns_cache": settings.getint("AIOHTTP_CONNECTOR_TTL_DNS_CACHE", default["ttl_dns_cache"]),
+        "ssl": settings.getbool("AIOHTTP_CONNECTOR_SSL", default["ssl"]),
+    }
+
+
+def get_throttle_config(settings: Settings) -> ThrottleConfig | None:
+    """Collect the AIOHTTP_THROTTLE_* settings, or None when server-side throttling is disabled."""
+
+    if not settings.getbool("AIOHTTP_THROTTLE_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_THROTTLE_CONFIG
+    return {
+        "concurrency_per_host": settings.getint(
+            "AIOHTTP_THROTTLE_CONCURRENCY_PER_HOST", default["concurrency_per_host"]
+        ),
+        "start_delay": settings.getfloat("AIOHTTP_THROTTLE_START_DELAY", default["start_delay"]),
+        "min_delay": settings.getfloat("AIOHTTP_THROTTLE_MIN_DELAY", default["min_delay"]),
+        "max_delay": settings.getfloat("AIOHTTP_THROTTLE_MAX_DELAY", default["max_delay"]),
+        "target_concurrency": settings.getfloat(
+            "AIOHTTP_THROTTLE_TARGET_CONCURRENCY", default["target_concurrency"]
+        ),
+        "max_hosts": settings.getint("AIOHTTP_THROTTLE_MAX_HOSTS", default["max_hosts"]),
+    }
+
+
+def get_cache_config(settings: Settings) -> CacheConfig | None:
+    """Collect the AIOHTTP_CACHE_* settings, or None when the server response cache is disabled."""
+
+    if not settings.getbool("AIOHTTP_CACHE_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_CACHE_CONFIG
+    return {
+        "memory_size": settings.getint("AIOHTTP_CACHE_MEMORY_SIZE", default["memory_size"]),
+        "spill_size": settings.getint("AIOHTTP_CACHE_SPILL_SIZE", default["spill_size"]),
+        "disk_size": settings.getint("AIOHTTP_CACHE_DISK_SIZE", default["disk_size"]),
+        "directory": settings.get("AIOHTTP_CACHE_DIR", default["directory"]),
+        "default_ttl": settings.getfloat("AIOHTTP_CACHE_DEFAULT_TTL", default["default_ttl"]),
+    }
+
+
+def get_coalesce_config(settings: Settings) -> CoalesceConfig | None:
+    """Collect the AIOHTTP_COALESCE_* settings, or None when request coalescing is disabled."""
+
+    if not settings.getbool("AIOHTTP_COALESCE_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_COALESCE_CONFIG
+    return {
+        "methods": tuple(settings.getlist("AIOHTTP_COALESCE_METHODS", default["methods"])),
+        "routes": tuple(settings.getlist("AIOHTTP_COALESCE_ROUTES", default["routes"])),
+    }
+
+
+def _get_optional_float(settings: Settings, name: str, default: float | None) -> float | None:
+    value = settings.get(name, default)
+    return None if value is None else float(value)
+
+
+def get_timeout_config(settings: Settings) -> TimeoutConfig:
+    """Collect the AIOHTTP_TIMEOUT_* settings of the upstream requests of the server."""
+
+    default = DEFAULT_AIOHTTP_TIMEOUT_CONFIG
+    return {
+        "total": _get_optional_float(settings, "AIOHTTP_TIMEOUT_TOTAL", default["total"]),
+        "connect": _get_optional_float(settings, "AIOHTTP_TIMEOUT_CONNECT", default["connect"]),
+        "read": _get_optional_float(settings, "AIOHTTP_TIMEOUT_READ", default["read"]),
+    }
+
+
+def get_retry_config(settings: Settings) -> RetryConfig | None:
+    """Collect the AIOHTTP_RETRY_* settings, or None when retries inside the server are disabled."""
+
+    if not settings.getbool("AIOHTTP_RETRY_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_RETRY_CONFIG
+    return {
+        "times": settings.getint("AIOHTTP_RETRY_TIMES", default["times"]),
+        "statuses": tuple(int(status) for status in settings.getlist("AIOHTTP_RETRY_STATUSES", default["statuses"])),
+        "methods": tuple(settings.getlist("AIOHTTP_RETRY_METHODS", default["methods"])),
+        "backoff_base": settings.getfloat("AIOHTTP_RETRY_BACKOFF_BASE", default["backoff_base"]),
+        "backoff_max": settings.getfloat("AIOHTTP_RETRY_BACKOFF_MAX", default["backoff_max"]),
+    }
+
+
+def get_hedge_config(settings: Settings) -> HedgeConfig | None:
+    """Collect the AIOHTTP_HEDGE_* settings, or None when hedged requests are disabled."""
+
+    if not settings.getbool("AIOHTTP_HEDGE_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_HEDGE_CONFIG
+    return {
+        "percentile": settings.getfloat("AIOHTTP_HEDGE_PERCENTILE", default["percentile"]),
+        "min_delay": settings.getfloat("AIOHTTP_HEDGE_MIN_DELAY", default["min_delay"]),
+        "max_delay": settings.getfloat("AIOHTTP_HEDGE_MAX_DELAY", default["max_delay"]),
+        "window": settings.getint("AIOHTTP_HEDGE_WINDOW", default["window"]),
+        "min_samples": settings.getint("AIOHTTP_HEDGE_MIN_SAMPLES", default["min_samples"]),
+        "methods": tuple(settings.getlist("AIOHTTP_HEDGE_METHODS", default["methods"])),
+    }
+
+
+def get_proxy_config(settings: Settings) -> ProxyConfig | None:
+    """
+    Collect the AIOHTTP_UPSTREAM_PROXY* settings, or None when no upstream proxies are set.
+
+    AIOHTTP_UPSTREAM_PROXIES is a list of proxy URLs, a callable provider, or the import path of one.
+    """
+    proxies = settings.get("AIOHTTP_UPSTREAM_PROXIES")
+    if not proxies:
+        return None
+    if isinstance(proxies, str) and "://" not in proxies:
+        proxies = load_object(proxies)
+    elif not callable(proxies):
+        proxies = tuple(settings.getlist("AIOHTTP_UPSTREAM_PROXIES"))
+    default = DEFAULT_AIOHTTP_PROXY_CONFIG
+    return {
+        "proxies": proxies,
+        "strategy": settings.get("AIOHTTP_UPSTREAM_PROXY_STRATEGY", default["strategy"]),
+        "refresh_interval": settings.getfloat(
+            "AIOHTTP_UPSTREAM_PROXY_REFRESH_INTERVAL", default["refresh_interval"]
+        ),
+        "error_statuses": tuple(
+            int(status)
+            for status in settings.getlist("AIOHTTP_UPSTREAM_PROXY_ERROR_STATUSES", default["error_statuses"])
+        ),
+        "max_failures": settings.getint("AIOHTTP_UPSTREAM_PROXY_MAX_FAILURES", default["max_failures"]),
+        "cooldown": settings.getfloat("AIOHTTP_UPSTREAM_PROXY_COOLDOWN", default["cooldown"]),
+        "max_error_rate": settings.getfloat("AIOHTTP_UPSTREAM_PROXY_MAX_ERROR_RATE", default["max_error_rate"]),
+        "min_requests": settings.getint("AIOHTTP_UPSTREAM_PROXY_MIN_REQUESTS", default["min_requests"]),
+        "eviction_cooldown": settings.getfloat(
+            "AIOHTTP_UPSTREAM_PROXY_EVICTION_COOLDOWN", default["eviction_cooldown"]
+        ),
+    }
+
+
+def get_farm_config(settings: Settings) -> FarmConfig | None:
+    """
+    Collect the AIOHTTP_SERVER_URLS and AIOHTTP_FARM_* settings, or None when AIOHTTP_SERVER_URLS is not set.
+    """
+    server_urls = settings.getlist("AIOHTTP_SERVER_URLS")
+    if not server_urls:
+        return None
+    default = DEFAULT_AIOHTTP_FARM_CONFIG
+    return {
+        "server_urls": tuple(server_urls),
+        "replicas": settings.getint("AIOHTTP_FARM_REPLICAS", default["replicas"]),
+        "max_failures": settings.getint("AIOHTTP_FARM_MAX_FAILURES", default["max_failures"]),
+        "ejection_time": settings.getfloat("AIOHTTP_FARM_EJECTION_TIME", default["ejection_time"]),
+        "health_check_interval": settings.getfloat(
+            "AIOHTTP_FARM_HEALTH_CHECK_INTERVAL", default["health_check_interval"]
+        ),
+        "health_check_timeout": settings.getfloat(
+            "AIOHTTP_FARM_HEALTH_CHECK_TIMEOUT", default["health_check_timeout"]
+        ),
+    }
+
+
+def get_prewarm_config(settings: Settings) -> PrewarmConfig | None:
+    """
+    Collect the AIOHTTP_PREWARM_* settings, or None when connection pre-warming is disabled.
+
+    Warmed origins expire after AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT unless AIOHTTP_PREWARM_IDLE_TIMEOUT is set.
+    """
+    if not settings.getbool("AIOHTTP_PREWARM_ENABLED"):
+        return None
+    default = DEFAULT_AIOHTTP_PREWARM_CONFIG
+    keepalive_timeout = settings.getfloat(
+        "AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT", DEFAULT_AIOHTTP_CONNECTOR_CONFIG["keepalive_timeout"]
+    )
+    return {
+        "max_hosts": settings.getint("AIOHTTP_PREWARM_MAX_HOSTS", default["max_hosts"]),
+        "connections": settings.getint("AIOHTTP_PREWARM_CONNECTIONS", default["connections"]),
+        "concurrency": settings.getint("AIOHTTP_PREWARM_CONCURRENCY", default["concurrency"]),
+        "idle_timeout": settings.getfloat("AIOHTTP_PREWARM_IDLE_TIMEOUT", keepalive_timeout),
+        "timeout": settings.getfloat("AIOHTTP_PREWARM_TIMEOUT", default["timeout"]),
+        "flush_interval": settings.getfloat("AIOHTTP_PREWARM_FLUSH_INTERVAL", default["flush_interval"]),
+        "batch_size": settings.getint("AIOHTTP_PREWARM_BATCH_SIZE", default["batch_size"]),
+    }
+
+
+def get_extract_config(settings: Settings) -> ExtractConfig:
+    """Collect the AIOHTTP_EXTRACT_* settings of the server-side extraction of responses."""
+
+    default = DEFAULT_AIOHTTP_EXTRACT_CONFIG
+    return {
+        "workers": settings.getint("AIOHTTP_EXTRACT_WORKERS", default["workers"]),
+    }
+
+
+def get_admission_config(settings: Settings) -> AdmissionConfig:
+    """Collect the AIOHTTP_ADMISSION_* settings limiting the requests each server worker admits."""
+
+    default = DEFAULT_AIOHTTP_ADMISSION_CONFIG
+    return {
+        "max_in_flight": settings.getint("AIOHTTP_ADMISSION_MAX_IN_FLIGHT", default["max_in_flight"]),
+        "max_queue": settings.getint("AIOHTTP_ADMISSION_MAX_QUEUE", default["max_queue"]),
+        "queue_timeout": settings.getfloat("AIOHTTP_ADMISSION_QUEUE_TIMEOUT", default["queue_timeout"]),
+        "max_buffered_bytes": settings.getint(
+            "AIOHTTP_ADMISSION_MAX_BUFFERED_BYTES", default["max_buffered_bytes"]
+        ),
+        "retry_after": settings.getint("AIOHTTP_ADMISSION_RETRY_AFTER", default["retry_after"]),
+    }
+
+
+def get_session_config(settings: Settings) -> SessionConfig:
+    """Collect the AIOHTTP_SESSIONS_* settings of the named sessions of the server."""
+
+    default = DEFAULT_AIOHTTP_SESSION_CONFIG
+    return {
+        "max_sessions": settings.getint("AIOHTTP_SESSIONS_MAX", default["max_sessions"]),
+        "directory": settings.get("AIOHTTP_SESSIONS_DIR", default["directory"]),
+        "allow_ip_cookies": settings.getbool("AIOHTTP_SESSIONS_ALLOW_IP_COOKIES", default["allow_ip_cookies"]),
+    }
@@ -0,0 +1,45 @@
+from typing import Callable
+
+from scrapy import Request
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+from tldextract import TLDExtract
+
+# The bundled public suffix list snapshot is used, so no network request is made.
+_extract_domain = TLDExtract(cache_dir=None, suffix_list_urls=())
+
+
+def host_slot(request: Request) -> str:
+    """Download slot of a request keyed on the host of its target URL."""
+
+    return urlparse_cached(request).hostname or ""
+
+
+def domain_slot(request: Request) -> str:
+    """Download slot of a request keyed on the registrable domain of its target URL."""
+
+    hostname = host_slot(request)
+    extracted = _extract_domain(hostname)
+    if extracted.domain and extracted.suffix:
+        return f"{extracted.domain}.{extracted.suffix}"
+    return hostname
+
+
+SLOT_POLICIES = {
+    "host": host_slot,
+    "domain": domain_slot,
+}
+
+
+def get_slot_policy(policy: str | Callable[[Request], str] | None) -> Callable[[Request], str] | None:
+    """
+    Get the function returning the download slot of a request with its original URL.
+
+    The policy is 'host', 'domain', a callable, or the import path of a callable.
+    None disables per-site slots, so all aiohttp requests share the slot of the server.
+    """
+    if policy is None or callable(policy):
+        return policy
+    if policy in SLOT_POLICIES:
+        return SLOT_POLICIES[policy]
+    return load_object(policy)
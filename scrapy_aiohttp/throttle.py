@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+from scrapy_aiohttp.utils import ThrottleConfig, DEFAULT_AIOHTTP_THROTTLE_CONFIG
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Parse a Retry-After header value, in seconds or as an HTTP date, into a number of seconds.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class HostSlot:
+    """
+    Throttling state of a single target host.
+    """
+
+    def __init__(self, concurrency: int, delay: float):
+        self.concurrency = concurrency
+        self.delay = delay
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.lock = asyncio.Lock()
+        self.last_start = 0.0
+        self.blocked_until = 0.0
+        self.active = 0
+
+    @property
+    def retry_after(self) -> float:
+        return max(0.0, self.blocked_until - time.monotonic())
+
+    async def wait(self):
+        """
+        Wait for the host delay since the previous request start, and for any Retry-After block.
+        """
+        async with self.lock:
+            now = time.monotonic()
+            wait = max(self.last_start + self.delay, self.blocked_until) - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.last_start = time.monotonic()
+
+
+class HostThrottle:
+    """
+    Per target host concurrency limit with an adaptive delay between requests.
+
+    The delay follows the AutoThrottle algorithm: it moves towards latency / target_concurrency,
+    never decreases on error responses, and is doubled on 429 and 503 responses, honoring
+    their Retry-After header.
+    """
+
+    backoff_statuses = frozenset((429, 503))
+
+    def __init__(self, throttle_config: ThrottleConfig | None = None):
+        config = {**DEFAULT_AIOHTTP_THROTTLE_CONFIG, **(throttle_config or {})}
+        self.concurrency = config["concurrency_per_host"]
+        self.start_delay = config["start_delay"]
+        self.min_delay = config["min_delay"]
+        self.max_delay = config["max_delay"]
+        self.target_concurrency = config["target_concurrency"]
+        self.max_hosts = config["max_hosts"]
+        self.slots: OrderedDict[str, HostSlot] = OrderedDict()
+
+    def get_slot(self, host: str) -> HostSlot:
+        slot = self.slots.get(host)
+        if slot is None:
+            slot = self.slots[host] = HostSlot(self.concurrency, max(self.start_delay, self.min_delay))
+            self._evict_idle_slots()
+        else:
+            self.slots.move_to_end(host)
+        return slot
+
+    def _evict_idle_slots(self):
+        for host in list(self.slots):
+            if len(self.slots) <= self.max_hosts:
+                break
+            slot = self.slots[host]
+            if not slot.active and not slot.retry_after:
+                del self.slots[host]
+
+    @asynccontextmanager
+    async def slot(self, host: str):
+        """
+        Hold one of the host concurrency slots, after waiting for the host delay.
+        """
+        slot = self.get_slot(host)
+        slot.active += 1
+        try:
+            async with slot.semaphore:
+                await slot.wait()
+                yield slot
+        finally:
+            slot.active -= 1
+
+    def record(self, slot: HostSlot, latency: float, status: int, retry_after: str | None = None):
+        """
+        Adapt the host delay to the latency and status of a response.
+        """
+        if status in self.backoff_statuses:
+            seconds = parse_retry_after(retry_after)
+            delay = max(slot.delay * 2, self.min_delay, 1.0)
+            if seconds is not None:
+                slot.blocked_until = max(slot.blocked_until, time.monotonic() + seconds)
+                delay = max(delay, seconds)
+            slot.delay = min(delay, self.max_delay)
+            return
+
+        target_delay = latency / self.target_concurrency
+        new_delay = max(target_delay, (slot.delay + target_delay) / 2.0)
+        new_delay = min(max(self.min_delay, new_delay), self.max_delay)
+        if status != 200 and new_delay <= slot.delay:
+            return
+        slot.delay = new_delay
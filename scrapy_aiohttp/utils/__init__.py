@@ -1,10 +1,63 @@
 from .exceptions import (
     ServerNotAliveError,
+    ServerStartupError,
     SettingVariableNotFoundError,
+    AsyncioReactorNotInstalledError,
+    MaxSizeExceededError,
 )
 from .types import (
     RequestHeaders,
+    ConnectorConfig,
+    ThrottleConfig,
+    CacheConfig,
+    CoalesceConfig,
+    TimeoutConfig,
+    RetryConfig,
+    HedgeConfig,
+    ProxyConfig,
+    FarmConfig,
+    PrewarmConfig,
+    ExtractConfig,
+    AdmissionConfig,
+    SessionConfig,
 )
 from .constants import (
     DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+    DEFAULT_AIOHTTP_CONNECTOR_CONFIG,
+    DEFAULT_AIOHTTP_THROTTLE_CONFIG,
+    DEFAULT_AIOHTTP_CACHE_CONFIG,
+    DEFAULT_AIOHTTP_COALESCE_CONFIG,
+    DEFAULT_AIOHTTP_TIMEOUT_CONFIG,
+    DEFAULT_AIOHTTP_RETRY_CONFIG,
+    DEFAULT_AIOHTTP_HEDGE_CONFIG,
+    DEFAULT_AIOHTTP_PROXY_CONFIG,
+    DEFAULT_AIOHTTP_FARM_CONFIG,
+    DEFAULT_AIOHTTP_PREWARM_CONFIG,
+    DEFAULT_AIOHTTP_EXTRACT_CONFIG,
+    DEFAULT_AIOHTTP_ADMISSION_CONFIG,
+    DEFAULT_AIOHTTP_SESSION_CONFIG,
+    COOKIES_HEADER,
+    TIMEOUT_HEADER,
+    ALLOW_REDIRECTS_HEADER,
+    PROXY_HEADER,
+    EXTRACT_HEADER,
+    SESSION_HEADER,
+    URL_HEADER,
+    HOST_DELAY_HEADER,
+    TIMINGS_HEADER,
+    CACHE_HEADER,
+    EXTRACTED_SIZE_HEADER,
+    HOP_BY_HOP_HEADERS,
+)
+from .headers import (
+    HeaderContext,
+    HeaderPlan,
+    get_request_headers,
+    target_host,
+)
+from .body import (
+    DEFAULT_CHUNK_SIZE,
+    check_expected_size,
+    iter_body,
+    read_body,
 )
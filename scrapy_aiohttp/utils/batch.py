@@ -0,0 +1,83 @@
+import base64
+import json
+
+from typing import Iterable
+
+from multidict import CIMultiDict, CIMultiDictProxy
+
+# Content type of a batch: one JSON fetch spec per line.
+BATCH_CONTENT_TYPE = "application/x-ndjson"
+# Content type of the batch results: a JSON line per result, followed by the result body.
+BATCH_RESULTS_CONTENT_TYPE = "application/vnd.scrapy-aiohttp.batch"
+
+
+class BatchItem:
+    """
+    A request of a batch, with the attributes of aiohttp.web.Request the server uses to proxy it.
+    """
+
+    query_string = ""
+
+    def __init__(self, item_id: str, method: str, url: str, headers: Iterable[tuple[str, str]], body: bytes = b""):
+        if not url.startswith(("http://", "https://")):
+            raise ValueError(f"Unsupported URL {url!r}.")
+        self.id = item_id
+        self.method = method.upper()
+        self.url = url
+        self.match_info = {"url": url}
+        self.headers = CIMultiDictProxy(CIMultiDict(headers))
+        self.content = body
+
+    @property
+    def body_exists(self) -> bool:
+        return bool(self.content)
+
+    @property
+    def content_length(self) -> int:
+        return len(self.content)
+
+    @classmethod
+    def from_json(cls, line: bytes) -> "BatchItem":
+        """
+        Parse a fetch spec line, raising ValueError when it is invalid.
+        """
+        try:
+            spec = json.loads(line)
+            body = base64.b64decode(spec["body"]) if spec.get("body") else b""
+            return cls(str(spec["id"]), spec.get("method", "GET"), spec["url"], spec.get("headers", ()), body)
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"Invalid batch item: {e!r}") from e
+
+
+def encode_item(item_id: str, method: str, url: str, headers: Iterable[tuple[str, str]], body: bytes = b"") -> bytes:
+    """
+    Encode a fetch spec line of a batch.
+    """
+    spec = {"id": item_id, "method": method, "url": url, "headers": list(headers)}
+    if body:
+        spec["body"] = base64.b64encode(body).decode("ascii")
+    return json.dumps(spec).encode() + b"\n"
+
+
+def encode_result_head(item_id: str | None, status: int, headers: Iterable[tuple[str, str]], length: int) -> bytes:
+    """
+    Encode the line sent before the body of a batch result.
+    """
+    return json.dumps({"id": item_id, "status": status, "headers": list(headers), "length": length}).encode() + b"\n"
+
+
+async def read_results(stream):
+    """
+    Iterate over the (id, status, headers, body) results of a batch response, as they arrive.
+
+    Raises asyncio.IncompleteReadError when the stream ends in the middle of a result body.
+    """
+    while True:
+        line = await stream.readline()
+        if not line:
+            return
+        if not line.strip():
+            continue
+        head = json.loads(line)
+        body = await stream.readexactly(head["length"])
+        yield head["id"], head["status"], head["headers"], body
@@ -0,0 +1,47 @@
+import logging
+
+from .exceptions import MaxSizeExceededError
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+
+def check_expected_size(url: str, expected_size: int | None, maxsize: int = 0, warnsize: int = 0):
+    """
+    Check the announced Content-Length before any of the body is read.
+
+    A maxsize or warnsize of 0 disables the corresponding check.
+    """
+    if expected_size is None:
+        return
+    if maxsize and expected_size > maxsize:
+        raise MaxSizeExceededError(url, expected_size, maxsize)
+    if warnsize and expected_size > warnsize:
+        logging.warning(f"Expected response size ({expected_size}) larger than download warn size ({warnsize}) "
+                        f"for {url}.")
+
+
+async def iter_body(response, chunk_size: int = DEFAULT_CHUNK_SIZE, maxsize: int = 0, warnsize: int = 0):
+    """
+    Iterate over an aiohttp client response body, aborting as soon as it grows over maxsize.
+    """
+    url = str(response.url)
+    check_expected_size(url, response.content_length, maxsize, warnsize)
+    received = 0
+    warned = False
+    async for chunk in response.content.iter_chunked(chunk_size):
+        received += len(chunk)
+        if maxsize and received > maxsize:
+            raise MaxSizeExceededError(url, received, maxsize)
+        if warnsize and not warned and received > warnsize:
+            warned = True
+            logging.warning(f"Received more bytes than download warn size ({warnsize}) for {url}.")
+        yield chunk
+
+
+async def read_body(response, chunk_size: int = DEFAULT_CHUNK_SIZE, maxsize: int = 0, warnsize: int = 0) -> bytes:
+    """
+    Read a whole aiohttp client response body within the maxsize and warnsize limits.
+    """
+    if not maxsize and not warnsize:
+        return await response.read()
+    return b"".join([chunk async for chunk in iter_body(response, chunk_size, maxsize, warnsize)])
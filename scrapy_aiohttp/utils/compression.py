@@ -0,0 +1,106 @@
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class ZlibCompressor:
+    """Incremental gzip or deflate compressor."""
+
+    def __init__(self, wbits: int):
+        self._compressobj = zlib.compressobj(6, zlib.DEFLATED, wbits)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressobj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressobj.flush()
+
+
+class BrotliCompressor:
+    """Incremental brotli compressor."""
+
+    def __init__(self):
+        self._compressor = brotli.Compressor()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdCompressor:
+    """Incremental zstd compressor."""
+
+    def __init__(self):
+        if zstd is not None:
+            self._compressobj = zstd.ZstdCompressor()
+        else:
+            self._compressobj = zstandard.ZstdCompressor().compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressobj.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressobj.flush()
+
+
+COMPRESSORS = {
+    "gzip": lambda: ZlibCompressor(16 + zlib.MAX_WBITS),
+    "deflate": lambda: ZlibCompressor(zlib.MAX_WBITS),
+    "br": BrotliCompressor,
+    "zstd": ZstdCompressor,
+}
+
+
+def check_compression(encoding: str):
+    """
+    Check that a content coding is known and that its library is installed.
+    """
+    if encoding not in COMPRESSORS:
+        raise ValueError(f"Unsupported compression {encoding!r}, use one of {', '.join(COMPRESSORS)}.")
+    if encoding == "br" and brotli is None:
+        raise ValueError("The 'br' compression requires the brotli or brotlicffi package.")
+    if encoding == "zstd" and zstd is None and zstandard is None:
+        raise ValueError("The 'zstd' compression requires the backports.zstd or zstandard package.")
+
+
+def get_compressor(encoding: str):
+    """
+    Create an incremental compressor with compress() and flush() methods for a content coding.
+    """
+    check_compression(encoding)
+    return COMPRESSORS[encoding]()
+
+
+def accepts_encoding(accept_encoding: str | None, encoding: str) -> bool:
+    """
+    Check whether an Accept-Encoding header value allows a content coding.
+    """
+    if not accept_encoding:
+        return False
+    for token in accept_encoding.split(","):
+        coding, _, params = token.partition(";")
+        if coding.strip().lower() != encoding:
+            continue
+        return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
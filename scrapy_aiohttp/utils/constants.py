@@ -1,12 +1,28 @@
-from urllib.parse import urlparse
-
-from .types import RequestHeaders
+from .headers import target_host
+from .types import (
+    RequestHeaders,
+    ConnectorConfig,
+    ThrottleConfig,
+    CacheConfig,
+    CoalesceConfig,
+    TimeoutConfig,
+    RetryConfig,
+    HedgeConfig,
+    ProxyConfig,
+    FarmConfig,
+    PrewarmConfig,
+    ExtractConfig,
+    AdmissionConfig,
+    SessionConfig,
+)
 
 DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG: RequestHeaders = {
         # If the header value is a Callable function,
         # the function is executed with the HTTP request object (request: aiohttp.web.Request)
-        # as an argument when constructing the header.
-        "Host": lambda request: urlparse(request.match_info.get("url")).hostname,
+        # as an argument when constructing the header. A function taking a second argument
+        # also receives a HeaderContext, whose parsed target URL is shared by all functions.
+        # Module-level functions, unlike lambdas, can also be sent to spawned server workers.
+        "Host": target_host,
 
         # If the header value is a string, it is used as a static value for the header.
         "Content-Type": "text/html",
@@ -16,3 +32,214 @@ DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG: RequestHeaders = {
         # same value for this header as it receives in the incoming request.
         "User-Agent": None,
 }
+
+DEFAULT_AIOHTTP_CONNECTOR_CONFIG: ConnectorConfig = {
+        # Total number of simultaneous upstream connections (AIOHTTP_CONNECTOR_LIMIT).
+        "limit": 100,
+        # Simultaneous connections to a single host, 0 means no limit (AIOHTTP_CONNECTOR_LIMIT_PER_HOST).
+        "limit_per_host": 0,
+        # Seconds an idle keep-alive connection is kept in the pool (AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT).
+        "keepalive_timeout": 15.0,
+        # Seconds resolved DNS entries are cached (AIOHTTP_CONNECTOR_TTL_DNS_CACHE).
+        "ttl_dns_cache": 10,
+        # Verify certificates with one SSL context shared by all connections (AIOHTTP_CONNECTOR_SSL).
+        "ssl": True,
+}
+
+DEFAULT_AIOHTTP_THROTTLE_CONFIG: ThrottleConfig = {
+        # Simultaneous requests the server sends to a single host (AIOHTTP_THROTTLE_CONCURRENCY_PER_HOST).
+        "concurrency_per_host": 8,
+        # Initial delay between requests to a host, in seconds (AIOHTTP_THROTTLE_START_DELAY).
+        "start_delay": 0.0,
+        # Bounds of the adaptive delay, in seconds (AIOHTTP_THROTTLE_MIN_DELAY, AIOHTTP_THROTTLE_MAX_DELAY).
+        "min_delay": 0.0,
+        "max_delay": 60.0,
+        # Average number of requests in flight to each host (AIOHTTP_THROTTLE_TARGET_CONCURRENCY).
+        "target_concurrency": 4.0,
+        # Number of hosts whose throttling state is kept (AIOHTTP_THROTTLE_MAX_HOSTS).
+        "max_hosts": 10000,
+}
+
+DEFAULT_AIOHTTP_CACHE_CONFIG: CacheConfig = {
+        # Body bytes kept in memory by each server worker (AIOHTTP_CACHE_MEMORY_SIZE).
+        "memory_size": 64 * 1024 * 1024,
+        # Bodies of at least this size are stored on disk, 0 keeps every body in memory (AIOHTTP_CACHE_SPILL_SIZE).
+        "spill_size": 1024 * 1024,
+        # Body bytes kept on disk by each server worker (AIOHTTP_CACHE_DISK_SIZE).
+        "disk_size": 1024 * 1024 * 1024,
+        # Parent directory of the disk tiers, the system temporary directory when None (AIOHTTP_CACHE_DIR).
+        "directory": None,
+        # Seconds responses without Cache-Control or Expires stay fresh (AIOHTTP_CACHE_DEFAULT_TTL).
+        "default_ttl": 0.0,
+}
+
+DEFAULT_AIOHTTP_COALESCE_CONFIG: CoalesceConfig = {
+        # Methods of the requests that are coalesced, all idempotent (AIOHTTP_COALESCE_METHODS).
+        "methods": ("GET", "HEAD"),
+        # Regular expressions of the target URLs whose requests are coalesced,
+        # all URLs when empty (AIOHTTP_COALESCE_ROUTES).
+        "routes": (),
+}
+
+DEFAULT_AIOHTTP_TIMEOUT_CONFIG: TimeoutConfig = {
+        # Seconds an upstream request may take in total, None for no limit (AIOHTTP_TIMEOUT_TOTAL).
+        # The download_timeout of a request replaces it for that request.
+        "total": 300.0,
+        # Seconds to open a connection to the target host, None for no limit (AIOHTTP_TIMEOUT_CONNECT).
+        "connect": 30.0,
+        # Seconds to wait for the next bytes of a response, None for no limit (AIOHTTP_TIMEOUT_READ).
+        "read": None,
+}
+
+DEFAULT_AIOHTTP_RETRY_CONFIG: RetryConfig = {
+        # Attempts after the first one for a failed upstream request (AIOHTTP_RETRY_TIMES).
+        "times": 2,
+        # Response statuses retried besides connection errors and timeouts (AIOHTTP_RETRY_STATUSES).
+        "statuses": (408, 429, 500, 502, 503, 504, 522, 524),
+        # Methods of the requests that are retried, all idempotent (AIOHTTP_RETRY_METHODS).
+        "methods": ("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"),
+        # Backoff before a retry is a random duration up to base * 2 ** retry seconds,
+        # capped at max, or the Retry-After of the response if it is not longer than max
+        # (AIOHTTP_RETRY_BACKOFF_BASE, AIOHTTP_RETRY_BACKOFF_MAX).
+        "backoff_base": 0.1,
+        "backoff_max": 5.0,
+}
+
+DEFAULT_AIOHTTP_HEDGE_CONFIG: HedgeConfig = {
+        # A second attempt is sent when the first one is slower than this latency percentile
+        # of the recent upstream requests (AIOHTTP_HEDGE_PERCENTILE).
+        "percentile": 95.0,
+        # Bounds of the hedging delay, in seconds (AIOHTTP_HEDGE_MIN_DELAY, AIOHTTP_HEDGE_MAX_DELAY).
+        "min_delay": 0.05,
+        "max_delay": 10.0,
+        # Number of recent latencies the percentile is computed from, and the number needed
+        # before any request is hedged (AIOHTTP_HEDGE_WINDOW, AIOHTTP_HEDGE_MIN_SAMPLES).
+        "window": 1000,
+        "min_samples": 50,
+        # Methods of the requests that are hedged, all idempotent (AIOHTTP_HEDGE_METHODS).
+        "methods": ("GET", "HEAD"),
+}
+
+DEFAULT_AIOHTTP_PROXY_CONFIG: ProxyConfig = {
+        # Upstream proxy URLs, or a callable returning them, possibly as an awaitable (AIOHTTP_UPSTREAM_PROXIES).
+        "proxies": (),
+        # How a proxy is chosen: "round_robin", "least_latency" by health score,
+        # or "sticky" per target host (AIOHTTP_UPSTREAM_PROXY_STRATEGY).
+        "strategy": "round_robin",
+        # Seconds between two calls of a proxy provider (AIOHTTP_UPSTREAM_PROXY_REFRESH_INTERVAL).
+        "refresh_interval": 300.0,
+        # Response statuses counted as proxy failures besides errors (AIOHTTP_UPSTREAM_PROXY_ERROR_STATUSES).
+        "error_statuses": (403, 407, 429, 502, 503, 504),
+        # Failures in a row putting a proxy in cool-down, and the cool-down in seconds
+        # (AIOHTTP_UPSTREAM_PROXY_MAX_FAILURES, AIOHTTP_UPSTREAM_PROXY_COOLDOWN).
+        "max_failures": 3,
+        "cooldown": 60.0,
+        # Smoothed error rate evicting a proxy once it served at least min_requests requests
+        # (AIOHTTP_UPSTREAM_PROXY_MAX_ERROR_RATE, AIOHTTP_UPSTREAM_PROXY_MIN_REQUESTS).
+        "max_error_rate": 0.8,
+        "min_requests": 20,
+        # Seconds before an evicted proxy is tried again with a single probe request, which puts it back
+        # in the pool when it succeeds (AIOHTTP_UPSTREAM_PROXY_EVICTION_COOLDOWN).
+        "eviction_cooldown": 300.0,
+}
+
+DEFAULT_AIOHTTP_FARM_CONFIG: FarmConfig = {
+        # URLs of the servers already running, besides the local server of AIOHTTP_SERVER_URL (AIOHTTP_SERVER_URLS).
+        "server_urls": (),
+        # Points of each server on the hash ring; more points spread the target hosts more evenly
+        # (AIOHTTP_FARM_REPLICAS).
+        "replicas": 160,
+        # Failed loopback requests in a row ejecting a server, and the seconds it stays ejected
+        # unless a health check passes first (AIOHTTP_FARM_MAX_FAILURES, AIOHTTP_FARM_EJECTION_TIME).
+        "max_failures": 3,
+        "ejection_time": 30.0,
+        # Seconds between two health checks of every server, and the timeout of a check
+        # (AIOHTTP_FARM_HEALTH_CHECK_INTERVAL, AIOHTTP_FARM_HEALTH_CHECK_TIMEOUT).
+        "health_check_interval": 5.0,
+        "health_check_timeout": 2.0,
+}
+
+DEFAULT_AIOHTTP_PREWARM_CONFIG: PrewarmConfig = {
+        # Target hosts each server worker keeps warm at the same time; origins beyond it are not
+        # warmed until others expire (AIOHTTP_PREWARM_MAX_HOSTS).
+        "max_hosts": 256,
+        # Connections opened to each origin, and origins warmed at the same time
+        # (AIOHTTP_PREWARM_CONNECTIONS, AIOHTTP_PREWARM_CONCURRENCY).
+        "connections": 1,
+        "concurrency": 16,
+        # Seconds a warmed origin counts against max_hosts and is not warmed again; the middleware
+        # uses AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT, after which the unused connections are closed
+        # (AIOHTTP_PREWARM_IDLE_TIMEOUT).
+        "idle_timeout": 15.0,
+        # Seconds allowed to open the connections of an origin (AIOHTTP_PREWARM_TIMEOUT).
+        "timeout": 5.0,
+        # Seconds the middleware gathers new origins for, and the most origins sent at once
+        # (AIOHTTP_PREWARM_FLUSH_INTERVAL, AIOHTTP_PREWARM_BATCH_SIZE).
+        "flush_interval": 0.05,
+        "batch_size": 64,
+}
+
+DEFAULT_AIOHTTP_EXTRACT_CONFIG: ExtractConfig = {
+        # Threads of each server worker applying the extraction specs of requests (AIOHTTP_EXTRACT_WORKERS).
+        "workers": 4,
+}
+
+DEFAULT_AIOHTTP_ADMISSION_CONFIG: AdmissionConfig = {
+        # Requests each server worker handles at the same time, 0 means no limit (AIOHTTP_ADMISSION_MAX_IN_FLIGHT).
+        "max_in_flight": 0,
+        # Requests waiting for one of the max_in_flight slots, and the seconds they wait at most
+        # before being rejected (AIOHTTP_ADMISSION_MAX_QUEUE, AIOHTTP_ADMISSION_QUEUE_TIMEOUT).
+        "max_queue": 0,
+        "queue_timeout": 1.0,
+        # Response body bytes the requests in flight of a server worker may buffer before new
+        # requests are rejected, 0 means no limit (AIOHTTP_ADMISSION_MAX_BUFFERED_BYTES).
+        "max_buffered_bytes": 0,
+        # Seconds sent in the Retry-After header of rejected requests (AIOHTTP_ADMISSION_RETRY_AFTER).
+        "retry_after": 1,
+}
+
+DEFAULT_AIOHTTP_SESSION_CONFIG: SessionConfig = {
+        # Named sessions each server worker keeps open; the least recently used one is closed
+        # beyond it (AIOHTTP_SESSIONS_MAX).
+        "max_sessions": 100,
+        # Directory the cookie jars of named sessions are saved to when they are closed, and loaded
+        # from when they are opened again, None to keep them in memory only (AIOHTTP_SESSIONS_DIR).
+        "directory": None,
+        # Keep the cookies of hosts given by IP address, which browsers ignore (AIOHTTP_SESSIONS_ALLOW_IP_COOKIES).
+        "allow_ip_cookies": False,
+}
+
+# Control headers set by AiohttpMiddleware on the request sent to the server.
+# They carry request data that Scrapy would otherwise apply to the loopback request,
+# and they are never forwarded to the target server.
+COOKIES_HEADER = "X-Aiohttp-Cookies"
+TIMEOUT_HEADER = "X-Aiohttp-Timeout"
+ALLOW_REDIRECTS_HEADER = "X-Aiohttp-Allow-Redirects"
+PROXY_HEADER = "X-Aiohttp-Proxy"
+EXTRACT_HEADER = "X-Aiohttp-Extract"
+SESSION_HEADER = "X-Aiohttp-Session"
+
+# Response header set by the server with the final URL of the target response, after redirects.
+URL_HEADER = "X-Aiohttp-Url"
+# Response header set by the server with the current delay between requests to the target host.
+HOST_DELAY_HEADER = "X-Aiohttp-Host-Delay"
+# Response header set by the server with the phase durations of the request, in the Server-Timing syntax.
+TIMINGS_HEADER = "X-Aiohttp-Timings"
+# Response header set by the server on cacheable requests: HIT, REVALIDATED or MISS.
+CACHE_HEADER = "X-Aiohttp-Cache"
+# Response header set by the server on extracted responses, with the size of the body the values were extracted from.
+EXTRACTED_SIZE_HEADER = "X-Aiohttp-Extracted-Size"
+
+# Upstream response headers that describe the upstream connection or body framing
+# and are not forwarded to Scrapy.
+HOP_BY_HOP_HEADERS = frozenset((
+        "Connection",
+        "Keep-Alive",
+        "Proxy-Authenticate",
+        "Proxy-Authorization",
+        "TE",
+        "Trailer",
+        "Transfer-Encoding",
+        "Upgrade",
+        "Content-Length",
+))
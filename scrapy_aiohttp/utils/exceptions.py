@@ -3,6 +3,25 @@ class ServerNotAliveError(Exception):
         super().__init__(message)
 
 
+class ServerStartupError(Exception):
+    def __init__(self, message="The server did not start."):
+        super().__init__(message)
+
+
 class SettingVariableNotFoundError(Exception):
     def __init__(self, variable_name):
         super().__init__(f"Setting variable '{variable_name}' not found.")
+
+
+class AsyncioReactorNotInstalledError(Exception):
+    def __init__(self, message="The asyncio reactor is not installed. Set TWISTED_REACTOR to "
+                               "'twisted.internet.asyncioreactor.AsyncioSelectorReactor'."):
+        super().__init__(message)
+
+
+class MaxSizeExceededError(Exception):
+    def __init__(self, url, size, maxsize):
+        self.url = url
+        self.size = size
+        self.maxsize = maxsize
+        super().__init__(f"Response size ({size}) larger than download max size ({maxsize}) for {url}.")
@@ -0,0 +1,111 @@
+import inspect
+
+from multidict import CIMultiDictProxy, CIMultiDict
+from yarl import URL
+
+from .types import RequestHeaders
+
+
+class HeaderContext:
+    """
+    Per-request values shared by the callable header values of a HeaderPlan.
+
+    Callables requiring a second argument receive the context, so the target URL of the
+    request is parsed once however many callables use it.
+    """
+
+    __slots__ = ("request", "_url")
+
+    def __init__(self, request):
+        self.request = request
+        self._url: URL | None = None
+
+    @property
+    def url(self) -> URL:
+        """Target URL of the request."""
+        if self._url is None:
+            self._url = URL(self.request.match_info["url"])
+        return self._url
+
+
+def target_host(request, context: HeaderContext) -> str:
+    """
+    Host of the target URL, the default value of the Host header.
+    """
+    return context.url.raw_host
+
+
+def _accepts_context(func) -> bool:
+    """
+    Whether a callable header value requires a second positional argument, the HeaderContext.
+
+    Parameters with a default are not counted, so a callable such as `f(request, default=None)`
+    is still called with the request only.
+    """
+    try:
+        parameters = inspect.signature(func).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    positional = (inspect.Parameter.POSITIONAL_ONLY, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+    required = [p for p in parameters if p.kind in positional and p.default is p.empty]
+    return len(required) >= 2
+
+
+class HeaderPlan:
+    """
+    Request headers configuration compiled once into the work left for each request.
+
+    Static values are merged into one multidict copied per request, inherited headers are
+    a list of names looked up in the incoming headers, and callables are kept in a list
+    together with whether they take a HeaderContext.
+    """
+
+    __slots__ = ("static", "inherited", "callables")
+
+    def __init__(self, request_headers_config: RequestHeaders):
+        static = CIMultiDict()
+        inherited = []
+        callables = []
+        for head, value in request_headers_config.items():
+            if value is None:
+                inherited.append(head)
+            elif isinstance(value, str):
+                static.add(head, value)
+            elif callable(value):
+                callables.append((head, value, _accepts_context(value)))
+            else:
+                raise TypeError(f'Value {type(value)} error for head: {head}')
+        self.static = static
+        self.inherited = tuple(inherited)
+        self.callables = tuple(callables)
+
+    def build(self, request, context: HeaderContext | None = None) -> CIMultiDict:
+        """
+        Build the headers of one request.
+
+        The request is an aiohttp.web.Request or any object with the same `headers` and
+        `match_info` attributes; it is also passed to the callable header values.
+        """
+        headers = self.static.copy()
+        request_headers = request.headers
+        for head in self.inherited:
+            for value in request_headers.getall(head, ()):
+                headers.add(head, value)
+        for head, func, accepts_context in self.callables:
+            if accepts_context:
+                if context is None:
+                    context = HeaderContext(request)
+                headers.add(head, func(request, context))
+            else:
+                headers.add(head, func(request))
+        return headers
+
+
+def get_request_headers(request_headers_config: RequestHeaders, request) -> CIMultiDictProxy:
+    """
+    Build aiohttp request headers from the request headers configuration.
+
+    The configuration is compiled on every call, keep a HeaderPlan to build the headers
+    of many requests.
+    """
+    return CIMultiDictProxy(HeaderPlan(request_headers_config).build(request))
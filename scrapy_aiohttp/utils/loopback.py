@@ -0,0 +1,74 @@
+from urllib.parse import urljoin, urlparse, urlsplit, urlunsplit, quote, unquote
+
+# Scheme of AIOHTTP_SERVER_URL for a server listening on a unix domain socket.
+UNIX_SCHEME = "unix"
+# Scheme of the loopback requests Scrapy sends to a server listening on a unix domain socket.
+LOOPBACK_UNIX_SCHEME = "http+unix"
+# Base URL of HTTP requests sent over a unix domain socket, where the host is not used.
+UNIX_HTTP_BASE_URL = "http://localhost"
+
+
+def get_unix_path(server_url: str) -> str | None:
+    """
+    Get the socket path of a unix:// server URL, or None for a TCP server URL.
+    """
+    parsed_url = urlparse(server_url)
+    if parsed_url.scheme != UNIX_SCHEME:
+        return None
+    path = unquote(parsed_url.netloc + parsed_url.path)
+    if not path:
+        raise ValueError(f"The server URL {server_url!r} has no socket path.")
+    return path
+
+
+def get_loopback_url(server_url: str) -> str:
+    """
+    Get the base URL of the loopback requests Scrapy sends to the server.
+
+    For a unix:// server URL it is an http+unix URL with the quoted socket path as its host,
+    which LoopbackDownloadHandler sends over the socket.
+    """
+    path = get_unix_path(server_url)
+    if path is None:
+        return server_url
+    return f"{LOOPBACK_UNIX_SCHEME}://{quote(path, safe='')}/"
+
+
+def split_loopback_url(url: str) -> tuple[str, str]:
+    """
+    Split an http+unix loopback URL into its socket path and the HTTP URL sent over the socket.
+    """
+    parsed_url = urlsplit(url)
+    if parsed_url.scheme != LOOPBACK_UNIX_SCHEME:
+        raise ValueError(f"Unsupported loopback URL {url!r}.")
+    target = parsed_url.path or "/"
+    if parsed_url.query:
+        target = f"{target}?{parsed_url.query}"
+    return unquote(parsed_url.netloc), f"{UNIX_HTTP_BASE_URL}{target}"
+
+
+def join_route(base_url: str, route: str) -> str:
+    """
+    Join an absolute route to a server or loopback base URL.
+
+    Unlike urljoin, it keeps the host of http+unix URLs, whose scheme urljoin does not know.
+    """
+    if urlsplit(base_url).scheme != LOOPBACK_UNIX_SCHEME:
+        return urljoin(base_url, route)
+    return urlunsplit(urlsplit(base_url)._replace(path=route, query="", fragment=""))
+
+
+def get_request_route_url(server_url: str) -> str:
+    """
+    Get the URL of the request route of a server, which Scrapy sends the loopback requests to.
+    """
+    return join_route(get_loopback_url(server_url), "/request")
+
+
+def get_server_route_url(server_url: str, route: str) -> str:
+    """
+    Get the HTTP URL of a server route, sent over the socket for a unix:// server URL.
+    """
+    if get_unix_path(server_url) is not None:
+        return urljoin(UNIX_HTTP_BASE_URL, route)
+    return urljoin(server_url, route)
@@ -1,5 +1,16 @@
 from typing import TypeAlias, Callable
 
-import aiohttp.web
-
-RequestHeaders: TypeAlias = dict[str, str | Callable[[aiohttp.web.Request], str] | None]
+RequestHeaders: TypeAlias = dict[str, str | Callable[..., str] | None]
+ConnectorConfig: TypeAlias = dict[str, int | float | bool | None]
+ThrottleConfig: TypeAlias = dict[str, int | float]
+CacheConfig: TypeAlias = dict[str, int | float | str | None]
+CoalesceConfig: TypeAlias = dict[str, list[str] | tuple[str, ...]]
+TimeoutConfig: TypeAlias = dict[str, float | None]
+RetryConfig: TypeAlias = dict[str, int | float | list | tuple]
+HedgeConfig: TypeAlias = dict[str, int | float | list | tuple]
+ProxyConfig: TypeAlias = dict[str, list[str] | tuple | Callable | str | int | float]
+FarmConfig: TypeAlias = dict[str, tuple[str, ...] | int | float]
+PrewarmConfig: TypeAlias = dict[str, int | float]
+ExtractConfig: TypeAlias = dict[str, int]
+AdmissionConfig: TypeAlias = dict[str, int | float]
+SessionConfig: TypeAlias = dict[str, int | str | bool | None]
@@ -0,0 +1,131 @@
+import asyncio
+import socket
+from unittest import IsolatedAsyncioTestCase, mock
+
+from aiohttp import web, ClientSession, ClientError
+from aiohttp.test_utils import TestServer, TestClient
+
+from scrapy_aiohttp import AiohttpServer
+from scrapy_aiohttp.admission import AdmissionControl
+from scrapy_aiohttp.metrics import ProxyMetrics
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def make_origin(delay: float) -> TestServer:
+    async def handle(request):
+        await asyncio.sleep(delay)
+        return web.Response(body=b"x" * 1000)
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    origin = TestServer(app)
+    await origin.start_server()
+    return origin
+
+
+class TestAdmissionControl(IsolatedAsyncioTestCase):
+
+    async def test_in_flight_and_queue(self):
+        metrics = ProxyMetrics()
+        admission = AdmissionControl({"max_in_flight": 1, "max_queue": 1, "queue_timeout": 0.05}, metrics)
+        first = await admission.admit()
+        self.assertIsNotNone(first)
+        queued = asyncio.ensure_future(admission.admit())
+        await asyncio.sleep(0)
+        self.assertIsNone(await admission.admit())
+        self.assertIsNone(await queued)
+        self.assertEqual(metrics.get("admission_rejected_total", reason="in_flight"), 1)
+        self.assertEqual(metrics.get("admission_rejected_total", reason="queue"), 1)
+
+        queued = asyncio.ensure_future(admission.admit())
+        await asyncio.sleep(0)
+        admission.release(first)
+        second = await queued
+        self.assertIsNotNone(second)
+        self.assertEqual(admission.in_flight, 1)
+        admission.release(second)
+        self.assertEqual(admission.in_flight, 0)
+
+    async def test_handover_at_queue_timeout(self):
+        admission = AdmissionControl({"max_in_flight": 1, "max_queue": 1})
+        first = await admission.admit()
+
+        async def handover_then_timeout(waiter, timeout):
+            # The slot is handed over to the waiter, but the wait times out anyway, as on Python 3.12+.
+            admission.release(first)
+            raise asyncio.TimeoutError()
+
+        with mock.patch("asyncio.wait_for", handover_then_timeout):
+            second = await admission.admit()
+        self.assertIsNotNone(second)
+        self.assertEqual(admission.in_flight, 1)
+        admission.release(second)
+        self.assertEqual(admission.in_flight, 0)
+        self.assertIsNotNone(await admission.admit())
+
+    async def test_buffered_bytes(self):
+        admission = AdmissionControl({"max_buffered_bytes": 100})
+        ticket = await admission.admit()
+        admission.charge(ticket, 100)
+        self.assertIsNone(await admission.admit())
+        admission.release(ticket)
+        self.assertEqual(admission.buffered_bytes, 0)
+        self.assertIsNotNone(await admission.admit())
+
+    async def test_drain(self):
+        admission = AdmissionControl({"max_in_flight": 2, "max_queue": 1})
+        first, second = await admission.admit(), await admission.admit()
+        queued = asyncio.ensure_future(admission.admit())
+        await asyncio.sleep(0)
+        asyncio.get_running_loop().call_later(0.05, admission.release, first)
+        report = await admission.drain(0.2)
+        self.assertIsNone(await queued)
+        self.assertIsNone(await admission.admit())
+        self.assertEqual(report, {"in_flight": 2, "completed": 1, "dropped": 1, "rejected": 1})
+        admission.release(second)
+
+
+class TestServerAdmission(IsolatedAsyncioTestCase):
+
+    async def test_handle_request_overloaded(self):
+        origin = await make_origin(0.2)
+        url = f"/request/{str(origin.make_url('/')).rstrip('/')}/page"
+        server = AiohttpServer(host="localhost", port=8080, admission_config={"max_in_flight": 1, "retry_after": 2})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            slow = asyncio.ensure_future(client.get(url))
+            await asyncio.sleep(0.05)
+            response = await client.get(url)
+            self.assertEqual(response.status, 503)
+            self.assertEqual(response.headers["Retry-After"], "2")
+            self.assertEqual((await client.get("/health")).status, 200)
+            self.assertEqual((await slow).status, 200)
+            self.assertEqual(server._admission.in_flight, 0)
+            self.assertEqual(server._admission.buffered_bytes, 0)
+        await origin.close()
+
+    async def test_stop_drain(self):
+        origin = await make_origin(0.5)
+        server_url = f"http://127.0.0.1:{free_port()}/"
+        url = f"{server_url}request/{str(origin.make_url('/')).rstrip('/')}/page"
+        async with ClientSession() as session:
+            for drain_timeout, completed in ((5.0, 1), (0.1, 0)):
+                server = AiohttpServer(server_url=server_url)
+                server.run()
+                request = asyncio.ensure_future(session.get(url))
+                await asyncio.sleep(0.2)
+                report = await asyncio.to_thread(server.stop, drain_timeout)
+                self.assertEqual(report["in_flight"], 1)
+                self.assertEqual(report["completed"], completed)
+                self.assertEqual(report["dropped"], 1 - completed)
+                if completed:
+                    self.assertEqual((await request).status, 200)
+                else:
+                    with self.assertRaises(ClientError):
+                        await (await request).read()
+        await origin.close()
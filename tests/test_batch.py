@@ -0,0 +1,104 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from aiohttp.test_utils import TestServer
+from scrapy.crawler import Crawler
+from scrapy.http import TextResponse
+from twisted.internet.error import ConnectError, TimeoutError
+
+from scrapy_aiohttp import AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.batch import AiohttpBatchMiddleware
+from scrapy_aiohttp.utils import AsyncioReactorNotInstalledError
+from scrapy_aiohttp.utils.simple_spider import SimpleSpider
+from tests.test_server import make_origin
+
+
+def make_middleware(server_url, **kwargs):
+    with patch("scrapy_aiohttp.batch.is_asyncio_reactor_installed", return_value=True):
+        return AiohttpBatchMiddleware(server_url, **kwargs)
+
+
+def make_request(server_url: str, url: str) -> AiohttpRequest:
+    request = AiohttpRequest(f"{server_url}request/{url}", headers={"User-Agent": "batch"})
+    request.original_url = url
+    request.target_url = f"{server_url}request"
+    return request
+
+
+class TestAiohttpBatchMiddleware(IsolatedAsyncioTestCase):
+
+    def test_requires_asyncio_reactor(self):
+        crawler = Crawler(spidercls=SimpleSpider, settings={"AIOHTTP_SERVER_URL": "http://localhost:8080/"})
+        with patch("scrapy_aiohttp.batch.is_asyncio_reactor_installed", return_value=False):
+            with self.assertRaises(AsyncioReactorNotInstalledError):
+                AiohttpBatchMiddleware.from_crawler(crawler)
+
+    async def test_process_request(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080)
+        server.extract_request_header_config({"User-Agent": None})
+        server._prerun_configurator()
+        proxy = TestServer(server.app)
+        await proxy.start_server()
+        server_url = str(proxy.make_url("/"))
+        middleware = make_middleware(server_url, window=0.05, max_size=3)
+
+        self.assertIsNone(await middleware.process_request(AiohttpRequest(str(origin.make_url("/json"))), None))
+        requests = [make_request(server_url, str(origin.make_url(path))) for path in ("/json", "/slow", "/body/1000")]
+        with patch.object(middleware, "_send", wraps=middleware._send) as send:
+            responses = await asyncio.gather(*(middleware.process_request(request, None) for request in requests))
+        self.assertEqual(send.call_count, 1)
+        self.assertIsInstance(responses[0], TextResponse)
+        self.assertEqual(responses[0].url, requests[0].url)
+        self.assertEqual(responses[0].headers[b"X-Aiohttp-Url"], str(origin.make_url("/json")).encode())
+        self.assertEqual(responses[1].body, b"slow body")
+        self.assertEqual(len(responses[2].body), 1000)
+        self.assertIn("download_latency", requests[2].meta)
+
+        await proxy.close()
+        with self.assertRaises(ConnectError):
+            await middleware.process_request(requests[0], None)
+        await middleware._close()
+        await origin.close()
+
+    async def test_process_request_slots(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080)
+        server._prerun_configurator()
+        proxy = TestServer(server.app)
+        await proxy.start_server()
+        server_url = str(proxy.make_url("/"))
+        middleware = make_middleware(
+            server_url, window=0.01, concurrency=1, delay=0.1, randomize_delay=False,
+            slots={"other": {"concurrency": 3, "delay": 0.0}},
+        )
+
+        # The slot of the Scrapy downloader the batched requests bypass is enforced by the batcher.
+        requests = [make_request(server_url, str(origin.make_url(f"/body/{size}"))) for size in (1000, 2000, 3000)]
+        start_time = time.monotonic()
+        with patch.object(middleware, "_send", wraps=middleware._send) as send:
+            responses = await asyncio.gather(*(middleware.process_request(request, None) for request in requests))
+            self.assertEqual(send.call_count, 3)
+        self.assertGreaterEqual(time.monotonic() - start_time, 0.2)
+        self.assertEqual([len(response.body) for response in responses], [1000, 2000, 3000])
+
+        requests = [make_request(server_url, str(origin.make_url("/slow"))) for _ in range(3)]
+        for request in requests:
+            request.meta["download_slot"] = "other"
+        with patch.object(middleware, "_send", wraps=middleware._send) as send:
+            await asyncio.gather(*(middleware.process_request(request, None) for request in requests))
+            self.assertEqual(send.call_count, 1)
+
+        request = make_request(server_url, str(origin.make_url("/slow")))
+        request.meta.update(download_slot="timeout", download_timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            await middleware.process_request(request, None)
+        # Idle slots are dropped, except those still waiting for their delay.
+        self.assertNotIn("other", middleware._slots)
+        self.assertIn("timeout", middleware._slots)
+
+        await middleware._close()
+        await proxy.close()
+        await origin.close()
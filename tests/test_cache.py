@@ -0,0 +1,97 @@
+import os
+import time
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from multidict import CIMultiDict
+
+from scrapy_aiohttp.cache import ResponseCache, parse_cache_control
+from scrapy_aiohttp.metrics import ProxyMetrics
+
+
+class TestResponseCache(TestCase):
+
+    def test_parse_cache_control(self):
+        headers = CIMultiDict([("Cache-Control", 'max-age=60, No-Cache'), ("Cache-Control", 'private="x"')])
+        self.assertEqual(parse_cache_control(headers), {"max-age": "60", "no-cache": None, "private": "x"})
+
+    def test_get_lifetime(self):
+        cache = ResponseCache({"default_ttl": 30.0})
+        self.assertEqual(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "max-age=60"})), 60.0)
+        self.assertEqual(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "max-age=60", "Age": "15"})), 45.0)
+        self.assertEqual(cache.get_lifetime(200, CIMultiDict({
+            "Date": "Mon, 01 Jan 2024 00:00:00 GMT", "Expires": "Mon, 01 Jan 2024 00:02:00 GMT",
+        })), 120.0)
+        self.assertEqual(cache.get_lifetime(200, CIMultiDict()), 30.0)
+        self.assertEqual(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "no-cache", "ETag": '"a"'})), 0.0)
+        self.assertIsNone(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "no-cache"})))
+        self.assertIsNone(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "no-store, max-age=60"})))
+        self.assertIsNone(cache.get_lifetime(500, CIMultiDict()))
+        self.assertIsNone(cache.get_lifetime(206, CIMultiDict({"Cache-Control": "max-age=60"})))
+        self.assertIsNone(cache.get_lifetime(200, CIMultiDict({"Cache-Control": "max-age=60", "Set-Cookie": "a=1"})))
+
+    def test_make_key(self):
+        url = "https://example.com/"
+        headers = CIMultiDict({"A": "1", "b": "2"})
+        key = ResponseCache.make_key("GET", url, headers, {})
+        self.assertEqual(key, ResponseCache.make_key("GET", url, CIMultiDict({"B": "2", "a": "1"}), {}))
+        self.assertNotEqual(key, ResponseCache.make_key("HEAD", url, headers, {}))
+        self.assertNotEqual(key, ResponseCache.make_key("GET", url, headers, {"cookies": {"session": "abc"}}))
+
+    def test_is_cacheable_request(self):
+        self.assertTrue(ResponseCache.is_cacheable_request("GET", CIMultiDict(), CIMultiDict()))
+        self.assertFalse(ResponseCache.is_cacheable_request("POST", CIMultiDict(), CIMultiDict()))
+        self.assertFalse(ResponseCache.is_cacheable_request("GET", CIMultiDict({"Cache-Control": "no-store"}), {}))
+        self.assertFalse(ResponseCache.is_cacheable_request("GET", CIMultiDict(), CIMultiDict({"If-None-Match": "a"})))
+        self.assertTrue(ResponseCache.requires_revalidation(CIMultiDict({"Pragma": "no-cache"})))
+        self.assertFalse(ResponseCache.requires_revalidation(CIMultiDict({"Cache-Control": "max-age=10"})))
+
+
+class AsyncTestResponseCache(IsolatedAsyncioTestCase):
+
+    async def test_memory_eviction(self):
+        metrics = ProxyMetrics()
+        cache = ResponseCache({"memory_size": 25, "spill_size": 0, "default_ttl": 60.0}, metrics)
+        for key in ("a", "b", "c"):
+            await cache.store(key, 200, CIMultiDict({"X-Aiohttp-Host-Delay": "1.0"}), b"x" * 10)
+        self.assertIsNone(cache.get("a"))
+        self.assertIsNotNone(cache.get("b"))
+        await cache.store("d", 200, CIMultiDict(), b"x" * 10)
+        self.assertEqual(list(cache.memory), ["b", "d"])
+        self.assertEqual(cache.memory_bytes, 20)
+        self.assertNotIn("X-Aiohttp-Host-Delay", cache.get("b").headers)
+        self.assertIsNone(await cache.store("e", 200, CIMultiDict(), b"x" * 26))
+        self.assertEqual(metrics.get("cache_evictions_total", tier="memory"), 2)
+
+    async def test_disk_tier(self):
+        cache = ResponseCache({"spill_size": 10, "disk_size": 30, "default_ttl": 60.0})
+        entry = await cache.store("a", 200, CIMultiDict(), b"a" * 20)
+        self.assertFalse(entry.in_memory)
+        self.assertTrue(os.path.exists(entry.path))
+        self.assertEqual(await cache.load(entry), b"a" * 20)
+        await cache.store("b", 200, CIMultiDict(), b"b" * 20)
+        self.assertFalse(os.path.exists(entry.path))
+        self.assertEqual(list(cache.disk), ["b"])
+        directory = cache._worker_directory
+        cache.clear()
+        self.assertFalse(os.path.exists(directory))
+
+    async def test_revalidate(self):
+        cache = ResponseCache()
+        headers = CIMultiDict({"ETag": '"a"', "Cache-Control": "no-cache", "Content-Type": "text/html"})
+        entry = await cache.store("a", 200, headers, b"body")
+        self.assertFalse(entry.is_fresh())
+        self.assertIs(cache.get("a"), entry)
+        self.assertEqual(entry.conditional_headers(), {"If-None-Match": '"a"'})
+        cache.revalidate(entry, CIMultiDict({
+            "ETag": '"b"', "Cache-Control": "max-age=60", "Content-Type": "text/plain", "X-Aiohttp-Timings": "",
+            "Set-Cookie": "session=abc",
+        }))
+        self.assertTrue(entry.is_fresh())
+        self.assertNotIn("Set-Cookie", entry.headers)
+        self.assertEqual(entry.headers["ETag"], '"b"')
+        self.assertEqual(entry.headers["Content-Type"], "text/html")
+        self.assertNotIn("X-Aiohttp-Timings", entry.headers)
+
+        entry.stored_at = time.time() - 120
+        entry.headers.popall("ETag")
+        self.assertIsNone(cache.get("a"))
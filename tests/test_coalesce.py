@@ -0,0 +1,50 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from scrapy_aiohttp.coalesce import SingleFlight
+
+
+class TestSingleFlight(IsolatedAsyncioTestCase):
+
+    def test_applies(self):
+        singleflight = SingleFlight({"routes": [r"^https://example\.com/list"]})
+        self.assertTrue(singleflight.applies("GET", "https://example.com/list?page=2"))
+        self.assertFalse(singleflight.applies("GET", "https://example.com/item/1"))
+        self.assertFalse(singleflight.applies("POST", "https://example.com/list"))
+        self.assertTrue(SingleFlight().applies("HEAD", "https://example.com/item/1"))
+        with self.assertRaises(ValueError):
+            SingleFlight({"methods": ["GET", "POST"]})
+
+    async def test_run(self):
+        singleflight = SingleFlight()
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return b"body"
+
+        results = await asyncio.gather(*(singleflight.run("key", fetch) for _ in range(3)))
+        self.assertEqual(results, [(b"body", False), (b"body", True), (b"body", True)])
+        self.assertIs(results[0][0], results[2][0])
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(singleflight.fetches)
+
+        await singleflight.run("key", fetch)
+        self.assertEqual(len(calls), 2)
+
+    async def test_run_waiter_cancelled(self):
+        singleflight = SingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.05)
+            raise ValueError("upstream")
+
+        first = asyncio.ensure_future(singleflight.run("key", fetch))
+        second = asyncio.ensure_future(singleflight.run("key", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        with self.assertRaises(ValueError):
+            await second
+        with self.assertRaises(asyncio.CancelledError):
+            await first
@@ -0,0 +1,131 @@
+import json
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from scrapy.crawler import Crawler
+from scrapy.http import Response, TextResponse
+from scrapy.statscollectors import StatsCollector
+
+from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.extract import ExtractField, extract, parse_extract_spec
+from scrapy_aiohttp.utils.batch import encode_item, read_results, BATCH_CONTENT_TYPE
+from scrapy_aiohttp.utils.simple_spider import SimpleSpider
+
+PAGE = """<html><head><title>Café menu</title>
+<script type="application/ld+json">{"@type": "Product", "sku": "42"}</script></head>
+<body><ul><li class="price">1.50</li><li class="price">2.00</li></ul><p>id=1234</p>
+""" + "<p>filler</p>\n" * 500 + "</body></html>"
+
+SPEC = {
+    "title": "css:title::text",
+    "ld": "xpath://script[@type='application/ld+json']/text()",
+    "prices": {"type": "css", "query": "li.price::text", "all": True},
+    "id": r"re:id=(\d+)",
+    "missing": "css:h1::text",
+}
+
+
+async def make_origin() -> TestServer:
+    async def handle(request):
+        if request.path == "/missing":
+            return web.Response(status=404, text="not found")
+        return web.Response(text=PAGE, content_type="text/html", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    origin = TestServer(app)
+    await origin.start_server()
+    return origin
+
+
+class TestExtract(TestCase):
+
+    def test_parse_extract_spec(self):
+        spec = parse_extract_spec(json.dumps(SPEC))
+        self.assertEqual(spec["title"].kind, "css")
+        self.assertTrue(spec["prices"].all_matches)
+        self.assertIsNotNone(spec["id"].pattern)
+        for value in ("[]", "{}", "not json", '{"a": "jmespath:a"}', '{"a": {"query": "a"}}', '{"a": 1}'):
+            with self.assertRaises(ValueError):
+                parse_extract_spec(value)
+        for kind, query in (("css", "li[["), ("xpath", "//li["), ("re", "(")):
+            with self.assertRaises(ValueError):
+                ExtractField(kind, query)
+
+    def test_extract(self):
+        result = json.loads(extract(parse_extract_spec(json.dumps(SPEC)), PAGE.encode(), "text/html; charset=utf-8"))
+        self.assertEqual(result, {
+            "title": "Café menu",
+            "ld": '{"@type": "Product", "sku": "42"}',
+            "prices": ["1.50", "2.00"],
+            "id": "1234",
+            "missing": None,
+        })
+        # The charset is also found in the document when the content type has none.
+        body = '<meta charset="iso-8859-1"><title>Café</title>'.encode("latin-1")
+        self.assertEqual(json.loads(extract({"title": ExtractField("css", "title::text")}, body)), {"title": "Café"})
+
+
+class TestServerExtract(IsolatedAsyncioTestCase):
+
+    async def test_handle_request_extract(self):
+        origin = await make_origin()
+        origin_url = str(origin.make_url("/")).rstrip("/")
+        server = AiohttpServer(host="localhost", port=8080, metrics=True, stream_responses=True)
+        server._prerun_configurator()
+        headers = {"X-Aiohttp-Extract": json.dumps(SPEC)}
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin_url}/page", headers=headers)
+            self.assertEqual(response.status, 200)
+            self.assertEqual(response.content_type, "application/json")
+            self.assertEqual(int(response.headers["X-Aiohttp-Extracted-Size"]), len(PAGE.encode()))
+            self.assertEqual((await response.json())["prices"], ["1.50", "2.00"])
+            self.assertGreater(server.metrics.get("extract_bytes_saved_total"), len(PAGE) * 0.9)
+
+            response = await client.get(f"/request/{origin_url}/missing", headers=headers)
+            self.assertEqual(response.status, 404)
+            self.assertEqual(await response.text(), "not found")
+            self.assertEqual(server.metrics.get("extractions_total"), 1)
+
+            response = await client.get(f"/request/{origin_url}/page", headers={"X-Aiohttp-Extract": "[]"})
+            self.assertEqual(response.status, 400)
+
+            batch = encode_item("1", "GET", f"{origin_url}/page", headers.items()) + \
+                encode_item("2", "GET", f"{origin_url}/page", [("X-Aiohttp-Extract", "{}")])
+            response = await client.post("/batch", data=batch, headers={"Content-Type": BATCH_CONTENT_TYPE})
+            results = {item_id: (status, body) async for item_id, status, _, body in read_results(response.content)}
+            self.assertEqual(json.loads(results["1"][1])["id"], "1234")
+            self.assertEqual(results["2"][0], 400)
+        self.assertIsNone(server._extractor._executor)
+        await origin.close()
+
+
+class TestAiohttpMiddlewareExtract(TestCase):
+
+    def setUp(self):
+        self.crawler = Crawler(spidercls=SimpleSpider)
+        self.crawler.stats = StatsCollector(self.crawler)
+        self.middleware = AiohttpMiddleware.__new__(AiohttpMiddleware)
+        self.middleware.crawler = self.crawler
+
+    def test_control_header(self):
+        request = AiohttpRequest("https://www.python.org/", meta={"aiohttp_extract": SPEC})
+        headers = AiohttpMiddleware._get_control_headers(request)
+        self.assertEqual(parse_extract_spec(headers["X-Aiohttp-Extract"]).keys(), SPEC.keys())
+        self.assertNotIn("X-Aiohttp-Extract", AiohttpMiddleware._get_control_headers(AiohttpRequest("https://a.com")))
+
+    def test_process_response_extracted(self):
+        url = "http://localhost:8080/request/https://www.python.org/"
+        request = AiohttpRequest(url=url, meta={"_original_url": "https://www.python.org/"})
+        body = b'{"title":"Python"}'
+        response = Response(url=url, body=body, headers={
+            "Content-Type": "application/json", "X-Aiohttp-Extracted-Size": "50000",
+        })
+        result = self.middleware.process_response(request, response, None)
+        self.assertIsInstance(result, TextResponse)
+        self.assertEqual(result.json(), {"title": "Python"})
+        self.assertNotIn(b"X-Aiohttp-Extracted-Size", result.headers)
+        stats = self.crawler.stats
+        self.assertEqual(stats.get_value("aiohttp/extract/count"), 1)
+        self.assertEqual(stats.get_value("aiohttp/extract/bytes_saved"), 50000 - len(body))
@@ -0,0 +1,118 @@
+import asyncio
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from aiohttp.test_utils import TestServer
+from scrapy import Request
+from twisted.internet.error import ConnectionRefusedError
+
+from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.farm import HashRing, ServerFarm, check_health
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+from scrapy_aiohttp.utils.simple_spider import SimpleSpider
+
+HOSTS = [f"www.site{index}.com" for index in range(1000)]
+SERVER_URLS = ["http://10.0.0.1:8080/", "http://10.0.0.2:8080/", "http://10.0.0.3:8080/"]
+
+
+def get_owners(ring: HashRing) -> dict[str, str]:
+    return {host: next(ring.iter_keys(host)) for host in HOSTS}
+
+
+class TestHashRing(TestCase):
+
+    def test_balance(self):
+        owners = get_owners(HashRing(SERVER_URLS))
+        for server_url in SERVER_URLS:
+            self.assertGreater(list(owners.values()).count(server_url), len(HOSTS) * 0.25)
+        self.assertEqual(len(list(HashRing(SERVER_URLS).iter_keys(HOSTS[0]))), 3)
+
+    def test_rebalance(self):
+        owners = get_owners(HashRing(SERVER_URLS))
+        removed = get_owners(HashRing(SERVER_URLS[:2]))
+        self.assertEqual(
+            {host for host in HOSTS if removed[host] != owners[host]},
+            {host for host in HOSTS if owners[host] == SERVER_URLS[2]},
+        )
+        added = get_owners(HashRing([*SERVER_URLS, "http://10.0.0.4:8080/"]))
+        moved = [host for host in HOSTS if added[host] != owners[host]]
+        self.assertTrue(all(added[host] == "http://10.0.0.4:8080/" for host in moved))
+        self.assertLess(len(moved), len(HOSTS) * 0.4)
+
+
+class TestServerFarm(IsolatedAsyncioTestCase):
+
+    def test_route_and_eject(self):
+        farm = ServerFarm(SERVER_URLS, {"max_failures": 2, "ejection_time": 60.0})
+        owners = {host: farm.route(host) for host in HOSTS}
+        node = owners[HOSTS[0]]
+        self.assertIs(farm.get_node(node.request_route_url), node)
+        self.assertEqual(node.request_url_prefix, f"{node.server_url}request/")
+
+        self.assertFalse(farm.record_failure(node))
+        farm.record_success(node)
+        self.assertFalse(farm.record_failure(node))
+        self.assertTrue(farm.record_failure(node))
+        moved = {host for host in HOSTS if farm.route(host) is not owners[host]}
+        self.assertEqual(moved, {host for host in HOSTS if owners[host] is node})
+
+        for other in farm.nodes.values():
+            other.ejected_until = node.ejected_until
+        self.assertIs(farm.route(HOSTS[0]), node)
+
+    async def test_check_health(self):
+        server = AiohttpServer(host="localhost", port=8080)
+        server._prerun_configurator()
+        alive = TestServer(server.app)
+        await alive.start_server()
+        dead = TestServer(AiohttpServer(host="localhost", port=8080).app)
+        await dead.start_server()
+        alive_url, dead_url = str(alive.make_url("/")), str(dead.make_url("/"))
+        await dead.close()
+
+        # The checks are blocking, so they run outside of the event loop serving the servers.
+        self.assertTrue(await asyncio.to_thread(check_health, alive_url, 1.0))
+        self.assertFalse(await asyncio.to_thread(check_health, dead_url, 1.0))
+        farm = ServerFarm([alive_url, dead_url])
+        farm.nodes[alive_url].ejected_until = float("inf")
+        await asyncio.to_thread(farm.check_health)
+        self.assertFalse(farm.nodes[alive_url].ejected)
+        self.assertTrue(farm.nodes[dead_url].ejected)
+        await alive.close()
+
+
+class TestAiohttpMiddlewareFarm(TestCase):
+
+    def setUp(self):
+        self.middleware = AiohttpMiddleware(
+            None,
+            DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+            farm_config={"server_urls": SERVER_URLS, "max_failures": 1, "health_check_interval": 0},
+        )
+        self.spider = SimpleSpider()
+
+    def test_process_request(self):
+        self.assertIsNone(self.middleware._server)
+        results = [self.middleware.process_request(AiohttpRequest(f"https://{host}/"), self.spider) for host in HOSTS]
+        self.assertEqual(len({result.meta["_target_url"] for result in results}), 3)
+        for result in results[:20]:
+            node = self.middleware._farm.get_node(result.meta["_target_url"])
+            self.assertEqual(result.url, f"{node.request_url_prefix}{result.meta['_original_url']}")
+            self.assertNotIn(result.meta["download_slot"], self.middleware._farm.hosts)
+        again = self.middleware.process_request(Request(f"https://{HOSTS[0]}/other", meta={"aiohttp": True}), None)
+        self.assertEqual(again.meta["_target_url"], results[0].meta["_target_url"])
+
+    def test_process_exception(self):
+        request = self.middleware.process_request(AiohttpRequest(f"https://{HOSTS[0]}/"), self.spider)
+        self.assertIsNone(self.middleware.process_exception(request, ValueError(), self.spider))
+        self.assertIsNone(self.middleware.process_exception(request.copy(), TimeoutError(), self.spider))
+
+        rerouted = self.middleware.process_exception(request, ConnectionRefusedError(), self.spider)
+        self.assertIsInstance(rerouted, AiohttpRequest)
+        self.assertNotEqual(rerouted.target_url, request.target_url)
+        self.assertEqual(rerouted.original_url, request.original_url)
+        self.assertTrue(rerouted.url.startswith(rerouted.target_url))
+        self.assertTrue(rerouted.dont_filter)
+
+        retried = self.middleware.process_request(request.copy(), self.spider)
+        self.assertEqual(retried.url, rerouted.url)
+        self.assertIsNone(self.middleware.process_request(rerouted, self.spider))
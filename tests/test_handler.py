@@ -0,0 +1,146 @@
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from multidict import CIMultiDict
+from scrapy import Request
+from scrapy.crawler import Crawler
+from scrapy.http import TextResponse
+
+from scrapy_aiohttp import AiohttpRequest
+from scrapy_aiohttp.handler import AiohttpDownloadHandler, RequestView
+from scrapy_aiohttp.utils import AsyncioReactorNotInstalledError, SettingVariableNotFoundError
+from scrapy_aiohttp.utils.simple_spider import SimpleSpider
+
+settings = {
+    "AIOHTTP_REQUEST_HEADERS_CONFIG": {
+        "User-Agent": None,
+        "X-Static": "static",
+        "X-Host": lambda request: request.match_info.get("url").split("/")[2],
+    },
+}
+
+
+def make_handler(crawler_settings=None):
+    crawler = Crawler(spidercls=SimpleSpider, settings=crawler_settings or settings)
+    with patch("scrapy_aiohttp.handler.is_asyncio_reactor_installed", return_value=True):
+        return AiohttpDownloadHandler.from_crawler(crawler)
+
+
+class TestAiohttpDownloadHandler(TestCase):
+
+    def test_from_crawler(self):
+        handler = make_handler()
+        self.assertIsInstance(handler, AiohttpDownloadHandler)
+        self.assertEqual(handler.request_headers_config, settings["AIOHTTP_REQUEST_HEADERS_CONFIG"])
+        with self.assertRaises(SettingVariableNotFoundError):
+            make_handler({"AIOHTTP_CONNECTOR_LIMIT": 1})
+
+    def test_requires_asyncio_reactor(self):
+        crawler = Crawler(spidercls=SimpleSpider, settings=settings)
+        with patch("scrapy_aiohttp.handler.is_asyncio_reactor_installed", return_value=False):
+            with self.assertRaises(AsyncioReactorNotInstalledError):
+                AiohttpDownloadHandler.from_crawler(crawler)
+
+    def test_is_aiohttp_request(self):
+        url = "https://www.python.org/"
+        self.assertTrue(AiohttpDownloadHandler.is_aiohttp_request(AiohttpRequest(url)))
+        self.assertTrue(AiohttpDownloadHandler.is_aiohttp_request(Request(url, meta={"aiohttp": True})))
+        self.assertFalse(AiohttpDownloadHandler.is_aiohttp_request(Request(url)))
+        self.assertFalse(AiohttpDownloadHandler.is_aiohttp_request(Request(url, meta={"aiohttp": False})))
+
+    def test_get_proxy_options(self):
+        headers = {"Proxy-Authorization": "Basic dXNlcjpwYXNz"}
+        request = AiohttpRequest("https://www.python.org/", headers=headers, meta={"proxy": "http://proxy:8080"})
+        request_headers = CIMultiDict()
+        self.assertEqual(AiohttpDownloadHandler._get_proxy_options(request, request_headers), {
+            "proxy": "http://proxy:8080", "proxy_headers": headers,
+        })
+        self.assertNotIn("Proxy-Authorization", request_headers)
+        request = AiohttpRequest("https://www.python.org/", meta={"proxy": None})
+        self.assertEqual(AiohttpDownloadHandler._get_proxy_options(request, request_headers), {})
+
+    def test_get_cookie_options(self):
+        request = AiohttpRequest("https://www.python.org/", cookies=[{"name": "a", "value": 1}])
+        request_headers = CIMultiDict()
+        self.assertEqual(AiohttpDownloadHandler._get_cookie_options(request, request_headers), {"cookies": {"a": "1"}})
+        self.assertNotIn("Cookie", request_headers)
+        request = AiohttpRequest("https://www.python.org/", headers={"Cookie": "a=1"}, cookies={"a": "1"})
+        self.assertEqual(AiohttpDownloadHandler._get_cookie_options(request, request_headers), {})
+        self.assertEqual(request_headers["Cookie"], "a=1")
+        request = AiohttpRequest("https://www.python.org/")
+        self.assertEqual(AiohttpDownloadHandler._get_cookie_options(request, CIMultiDict()), {})
+
+    def test_request_view(self):
+        request = Request("https://www.python.org/", headers={"User-Agent": ["a", "b"]})
+        view = RequestView(request)
+        self.assertEqual(view.match_info["url"], "https://www.python.org/")
+        self.assertEqual(view.headers.getall("User-Agent"), ["a", "b"])
+
+
+class AsyncTestAiohttpDownloadHandler(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        async def handle(request):
+            return web.json_response(
+                {"method": request.method, "headers": dict(request.headers), "body": await request.text()}
+            )
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handle)
+        self.origin = TestServer(app)
+        await self.origin.start_server()
+        self.handler = make_handler()
+
+    async def asyncTearDown(self):
+        await self.handler._close()
+        await self.origin.close()
+
+    async def test_download_request(self):
+        url = str(self.origin.make_url("/json"))
+        request = AiohttpRequest(
+            url, method="POST", body=b"payload", headers={"User-Agent": "test", "X-Dropped": "1"},
+        )
+        response = await self.handler._download_request(request)
+        self.assertIsInstance(response, TextResponse)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.url, url)
+        self.assertIs(response.request, request)
+        self.assertIn("download_latency", request.meta)
+        data = response.json()
+        self.assertEqual(data["method"], "POST")
+        self.assertEqual(data["body"], "payload")
+        self.assertEqual(data["headers"]["User-Agent"], "test")
+        self.assertEqual(data["headers"]["X-Static"], "static")
+        self.assertEqual(data["headers"]["X-Host"], url.split("/")[2])
+        self.assertNotIn("X-Dropped", data["headers"])
+
+    async def test_download_request_proxy(self):
+        async def handle(request):
+            # A stand-in forward proxy answering the requests sent through it itself.
+            return web.json_response({"url": str(request.url), "headers": dict(request.headers)})
+
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", handle)
+        proxy = TestServer(app)
+        await proxy.start_server()
+        request = AiohttpRequest(
+            "http://target.invalid/page",
+            headers={"Proxy-Authorization": "Basic dXNlcjpwYXNz"},
+            meta={"proxy": str(proxy.make_url("/")).rstrip("/")},
+        )
+        response = await self.handler._download_request(request)
+        data = response.json()
+        self.assertEqual(data["url"], "http://target.invalid/page")
+        self.assertEqual(data["headers"]["Proxy-Authorization"], "Basic dXNlcjpwYXNz")
+        await proxy.close()
+
+    async def test_download_request_cookies(self):
+        url = str(self.origin.make_url("/cookies"))
+        request = AiohttpRequest(url, headers={"Cookie": "session=abc"})
+        data = (await self.handler._download_request(request)).json()
+        self.assertEqual(data["headers"]["Cookie"], "session=abc")
+        request = AiohttpRequest(url, cookies={"session": "abc", "lang": "en"})
+        data = (await self.handler._download_request(request)).json()
+        self.assertEqual(sorted(data["headers"]["Cookie"].split("; ")), ["lang=en", "session=abc"])
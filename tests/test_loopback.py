@@ -0,0 +1,132 @@
+import asyncio
+import os
+import socket
+import tempfile
+from unittest import TestCase, IsolatedAsyncioTestCase
+from unittest.mock import patch
+
+from aiohttp import ClientConnectorError
+from scrapy.crawler import Crawler
+from scrapy.http import TextResponse
+from twisted.internet.error import ConnectError
+
+from scrapy_aiohttp import AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.batch import AiohttpBatchMiddleware
+from scrapy_aiohttp.loopback import LoopbackDownloadHandler, create_loopback_session
+from scrapy_aiohttp.utils import AsyncioReactorNotInstalledError
+from scrapy_aiohttp.utils.loopback import (
+    get_unix_path,
+    get_loopback_url,
+    split_loopback_url,
+    join_route,
+    get_server_route_url,
+)
+from scrapy_aiohttp.utils.simple_spider import SimpleSpider
+from tests.test_server import make_origin
+
+
+def make_handler():
+    crawler = Crawler(spidercls=SimpleSpider)
+    with patch("scrapy_aiohttp.loopback.is_asyncio_reactor_installed", return_value=True):
+        return LoopbackDownloadHandler.from_crawler(crawler)
+
+
+class TestLoopbackUrls(TestCase):
+
+    def test_get_unix_path(self):
+        self.assertEqual(get_unix_path("unix:///run/scrapy-aiohttp.sock"), "/run/scrapy-aiohttp.sock")
+        self.assertEqual(get_unix_path("unix://scrapy-aiohttp.sock"), "scrapy-aiohttp.sock")
+        self.assertIsNone(get_unix_path("http://localhost:8080/"))
+        with self.assertRaises(ValueError):
+            get_unix_path("unix://")
+
+    def test_loopback_url(self):
+        self.assertEqual(get_loopback_url("http://localhost:8080/"), "http://localhost:8080/")
+        loopback_url = get_loopback_url("unix:///run/scrapy-aiohttp.sock")
+        self.assertEqual(loopback_url, "http+unix://%2Frun%2Fscrapy-aiohttp.sock/")
+        self.assertEqual(join_route(loopback_url, "/request"), "http+unix://%2Frun%2Fscrapy-aiohttp.sock/request")
+        self.assertEqual(join_route("http://localhost:8080/", "/request"), "http://localhost:8080/request")
+        self.assertEqual(
+            split_loopback_url(f"{loopback_url}request/https://www.python.org/a;b?q=1"),
+            ("/run/scrapy-aiohttp.sock", "http://localhost/request/https://www.python.org/a;b?q=1"),
+        )
+        with self.assertRaises(ValueError):
+            split_loopback_url("http://localhost:8080/request")
+
+    def test_get_server_route_url(self):
+        self.assertEqual(get_server_route_url("unix:///run/scrapy-aiohttp.sock", "/batch"), "http://localhost/batch")
+        self.assertEqual(get_server_route_url("http://localhost:8080/", "/batch"), "http://localhost:8080/batch")
+
+
+class AsyncTestLoopback(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server_url = f"unix://{self.directory.name}/scrapy-aiohttp.sock"
+        self.server = AiohttpServer(server_url=self.server_url)
+        self.server.extract_request_header_config({"User-Agent": None})
+
+    def tearDown(self):
+        if self.server._processes:
+            self.server.stop()
+        self.directory.cleanup()
+
+    def test_requires_asyncio_reactor(self):
+        crawler = Crawler(spidercls=SimpleSpider)
+        with patch("scrapy_aiohttp.loopback.is_asyncio_reactor_installed", return_value=False):
+            with self.assertRaises(AsyncioReactorNotInstalledError):
+                LoopbackDownloadHandler.from_crawler(crawler)
+
+    async def test_run_and_stop(self):
+        path = get_unix_path(self.server_url)
+        self.assertEqual(self.server.url, self.server_url)
+        # A socket file left by a previous run is replaced.
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale_socket:
+            stale_socket.bind(path)
+        self.server.run()
+        self.assertTrue(os.path.exists(path))
+        async with create_loopback_session(self.server_url) as session:
+            async with session.get("http://localhost/error") as response:
+                self.assertEqual(response.status, 404)
+        self.server.stop()
+        self.assertFalse(os.path.exists(path))
+        async with create_loopback_session(self.server_url) as session:
+            with self.assertRaises(ClientConnectorError):
+                await session.get("http://localhost/error")
+
+    async def test_download_request(self):
+        origin = await make_origin()
+        self.server.run()
+        handler = make_handler()
+        url = str(origin.make_url("/json"))
+        request = AiohttpRequest(f"{get_loopback_url(self.server_url)}request/{url}", headers={"User-Agent": "unix"})
+        response = await handler._download_request(request)
+        self.assertIsInstance(response, TextResponse)
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.headers[b"X-Aiohttp-Url"], url.encode())
+        self.assertEqual(response.json(), {"a": 1})
+        self.assertIn("download_latency", request.meta)
+
+        self.server.stop()
+        with self.assertRaises(ConnectError):
+            await handler._download_request(request)
+        await handler._close()
+        await origin.close()
+
+    async def test_batch_middleware(self):
+        origin = await make_origin()
+        self.server.run()
+        with patch("scrapy_aiohttp.batch.is_asyncio_reactor_installed", return_value=True):
+            middleware = AiohttpBatchMiddleware(self.server_url, window=0.01)
+        self.assertEqual(middleware.batch_url, "http://localhost/batch")
+        loopback_url = get_loopback_url(self.server_url)
+        requests = []
+        for path in ("/json", "/body/1000"):
+            request = AiohttpRequest(f"{loopback_url}request/{origin.make_url(path)}")
+            request.original_url = str(origin.make_url(path))
+            requests.append(request)
+        responses = await asyncio.gather(*(middleware.process_request(request, None) for request in requests))
+        self.assertEqual([response.status for response in responses], [200, 200])
+        self.assertEqual(len(responses[1].body), 1000)
+        await middleware._close()
+        await origin.close()
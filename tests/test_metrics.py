@@ -0,0 +1,72 @@
+from unittest import TestCase
+
+from scrapy_aiohttp.metrics import ProxyMetrics, RequestTimings, parse_timings
+
+
+class TestRequestTimings(TestCase):
+
+    def test_phases(self):
+        timings = RequestTimings()
+        self.assertEqual(timings.phases(), {})
+        timings.start = 10.0
+        timings.upstream_start = 10.5
+        timings.dns = 0.1
+        timings.connect = 0.2
+        timings.headers = 11.5
+        timings.end = 12.0
+        self.assertEqual(timings.phases(), {
+            "queue": 0.5, "dns": 0.1, "connect": 0.2, "ttfb": 1.0, "body": 0.5, "total": 2.0,
+        })
+
+    def test_header_value_round_trip(self):
+        timings = RequestTimings()
+        timings.start = 10.0
+        timings.upstream_start = 10.25
+        timings.headers = 10.75
+        value = timings.header_value()
+        self.assertEqual(value, "queue;dur=250.000, ttfb;dur=500.000")
+        self.assertEqual(parse_timings(value), {"queue": 0.25, "ttfb": 0.5})
+        self.assertEqual(parse_timings("queue;desc=x, ttfb;dur=abc, body;dur=1"), {"body": 0.001})
+
+
+class TestProxyMetrics(TestCase):
+
+    def test_counters_and_gauges(self):
+        metrics = ProxyMetrics()
+        metrics.inc("requests_total", status=200)
+        metrics.inc("requests_total", status=200)
+        metrics.inc("requests_total", status=404)
+        metrics.inc("connections_created_total")
+        metrics.inc("connections_reused_total", 3)
+        self.assertEqual(metrics.get("requests_total", status=200), 2)
+        text = metrics.render()
+        self.assertIn('scrapy_aiohttp_requests_total{status="200"} 2\n', text)
+        self.assertIn('scrapy_aiohttp_requests_total{status="404"} 1\n', text)
+        self.assertIn("scrapy_aiohttp_connection_reuse_ratio 0.75\n", text)
+        self.assertIn("# TYPE scrapy_aiohttp_requests_total counter\n", text)
+
+    def test_histogram(self):
+        metrics = ProxyMetrics(buckets=(0.1, 1.0))
+        metrics.observe("phase_seconds", 0.05, phase="ttfb")
+        metrics.observe("phase_seconds", 0.5, phase="ttfb")
+        metrics.observe("phase_seconds", 5.0, phase="ttfb")
+        text = metrics.render()
+        self.assertIn('scrapy_aiohttp_phase_seconds_bucket{phase="ttfb",le="0.1"} 1\n', text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_bucket{phase="ttfb",le="1"} 2\n', text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_bucket{phase="ttfb",le="+Inf"} 3\n', text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_sum{phase="ttfb"} 5.55\n', text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_count{phase="ttfb"} 3\n', text)
+
+    def test_worker_samples(self):
+        metrics = ProxyMetrics(buckets=(1.0,))
+        metrics.labels = {"worker": "0"}
+        metrics.inc("requests_total", status=200)
+        metrics.observe("phase_seconds", 0.5, phase="ttfb")
+        other = ProxyMetrics(buckets=(1.0,))
+        other.labels = {"worker": "1"}
+        other.inc("requests_total", 2, status=200)
+        text = metrics.render([other.samples()])
+        self.assertIn('scrapy_aiohttp_requests_total{status="200",worker="0"} 1\n', text)
+        self.assertIn('scrapy_aiohttp_requests_total{status="200",worker="1"} 2\n', text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_bucket{phase="ttfb",worker="0",le="1"} 1\n', text)
+        self.assertEqual(text.count("# TYPE scrapy_aiohttp_requests_total counter\n"), 1)
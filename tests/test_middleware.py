@@ -1,8 +1,12 @@
+import tempfile
+from types import SimpleNamespace
 from unittest import TestCase
 
 from scrapy import Request
+from scrapy.http import JsonRequest, FormRequest
 from scrapy.crawler import Crawler
-from scrapy.http import Response
+from scrapy.http import Response, HtmlResponse, TextResponse
+from scrapy.statscollectors import StatsCollector
 
 from scrapy_aiohttp import AiohttpRequest, AiohttpMiddleware, AiohttpServer
 from scrapy_aiohttp.utils import ServerNotAliveError, SettingVariableNotFoundError, \
@@ -100,6 +104,100 @@ class TestAiohttpMiddleware(TestCase):
                 server_url + "request"
             )
 
+    def test_process_request_attributes(self):
+        def callback(response, page):
+            pass
+
+        def errback(failure):
+            pass
+
+        url = "https://www.python.org/"
+        for request_cls in (Request, AiohttpRequest):
+            request = request_cls(
+                url=url, callback=callback, errback=errback, cb_kwargs={"page": 2}, priority=5, dont_filter=True,
+                flags=["flag"], encoding="latin-1", meta={"aiohttp": True, "key": "value"},
+            )
+            result = self.middleware.process_request(request, self.spider_inst)
+            self.assertIsInstance(result, AiohttpRequest)
+            self.assertEqual(result.url, f"http://localhost:8080/request/{url}")
+            for name in ("callback", "errback", "cb_kwargs", "priority", "dont_filter", "flags", "encoding"):
+                self.assertEqual(getattr(result, name), getattr(request, name))
+            self.assertEqual(result.meta["key"], "value")
+            self.assertNotIn("_original_url", request.meta)
+
+    def test_process_request_subclasses(self):
+        url = "https://www.python.org/"
+        requests = (
+            JsonRequest(url, data={"a": 1}, meta={"aiohttp": True}),
+            FormRequest(url, formdata={"a": "1"}, meta={"aiohttp": True}),
+        )
+        for request in requests:
+            result = self.middleware.process_request(request, self.spider_inst)
+            self.assertIsInstance(result, AiohttpRequest)
+            self.assertEqual(result.method, "POST")
+            self.assertEqual(result.body, request.body)
+            self.assertEqual(result.headers[b"Content-Type"], request.headers[b"Content-Type"])
+
+    def test_process_request_control_headers(self):
+        request = AiohttpRequest(
+            url="https://www.python.org/",
+            method="POST",
+            body=b"a=1",
+            cookies=[{"name": "session", "value": "abc"}],
+            meta={"download_timeout": 30, "dont_redirect": True, "proxy": "http://proxy:3128"},
+        )
+        result = self.middleware.process_request(request, self.spider_inst)
+        self.assertEqual(result.method, "POST")
+        self.assertEqual(result.body, b"a=1")
+        self.assertEqual(result.headers[b"X-Aiohttp-Cookies"], b'{"session": "abc"}')
+        self.assertEqual(result.headers[b"X-Aiohttp-Timeout"], b"30")
+        self.assertEqual(result.headers[b"X-Aiohttp-Allow-Redirects"], b"0")
+        self.assertEqual(result.headers[b"X-Aiohttp-Proxy"], b"http://proxy:3128")
+        self.assertNotIn("proxy", result.meta)
+        self.assertEqual(request.meta["proxy"], "http://proxy:3128")
+
+    def test_process_request_download_slot(self):
+        url = "https://docs.python.org/3/"
+        result = self.middleware.process_request(AiohttpRequest(url=url), self.spider_inst)
+        self.assertEqual(result.meta["download_slot"], "docs.python.org")
+
+        request = AiohttpRequest(url=url, meta={"download_slot": "custom"})
+        result = self.middleware.process_request(request, self.spider_inst)
+        self.assertEqual(result.meta["download_slot"], "custom")
+
+        middleware = AiohttpMiddleware(
+            "http://localhost:8080/", DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG, download_slot_policy="domain"
+        )
+        result = middleware.process_request(AiohttpRequest(url=url), self.spider_inst)
+        self.assertEqual(result.meta["download_slot"], "python.org")
+        middleware._force_stop_server()
+
+        middleware = AiohttpMiddleware(
+            "http://localhost:8080/", DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG, download_slot_policy=None
+        )
+        result = middleware.process_request(AiohttpRequest(url=url), self.spider_inst)
+        self.assertNotIn("download_slot", result.meta)
+
+    def test_process_request_unix_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            settings = {
+                "AIOHTTP_SERVER_URL": f"unix://{directory}/scrapy-aiohttp.sock",
+                "AIOHTTP_REQUEST_HEADERS_CONFIG": DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+            }
+            with self.assertRaises(SettingVariableNotFoundError) as e:
+                AiohttpMiddleware.from_crawler(Crawler(spidercls=SimpleSpider, settings=settings))
+            self.assertEqual(str(e.exception), "Setting variable 'DOWNLOAD_HANDLERS['http+unix']' not found.")
+
+            settings["DOWNLOAD_HANDLERS"] = {"http+unix": "scrapy_aiohttp.loopback.LoopbackDownloadHandler"}
+            middleware = AiohttpMiddleware.from_crawler(Crawler(spidercls=SimpleSpider, settings=settings))
+            url = "https://www.python.org/"
+            result = middleware.process_request(AiohttpRequest(url=url), self.spider_inst)
+            loopback_url = "http+unix://" + f"{directory}/scrapy-aiohttp.sock".replace("/", "%2F")
+            self.assertEqual(result.url, f"{loopback_url}/request/{url}")
+            self.assertEqual(result.meta["_target_url"], f"{loopback_url}/request")
+            self.assertEqual(result.meta["download_slot"], "www.python.org")
+            middleware._force_stop_server()
+
     def test_process_request_invalid(self):
         url = "https://www.python.org/"
         invalid_requests = (
@@ -123,6 +221,62 @@ class TestAiohttpMiddleware(TestCase):
         self.assertIsInstance(result, Response)
         self.assertEqual(result.url, "https://www.python.org/")
 
+    def test_process_response_rebuild(self):
+        url = "http://localhost:8080/request/https://www.python.org/api"
+        request = AiohttpRequest(url=url, meta={
+            "_original_url": "https://www.python.org/api",
+            "_target_url": "http://localhost:8080/request"
+        })
+        response = HtmlResponse(url=url, body=b'{"a": 1}', headers={
+            "Content-Type": "application/json; charset=utf-8",
+            "X-Aiohttp-Url": "https://www.python.org/api/v2",
+            "Set-Cookie": "session=abc",
+        })
+        result = self.middleware.process_response(request, response, self.spider_inst)
+        self.assertIsInstance(result, TextResponse)
+        self.assertNotIsInstance(result, HtmlResponse)
+        self.assertEqual(result.url, "https://www.python.org/api/v2")
+        self.assertEqual(result.encoding, "utf-8")
+        self.assertEqual(result.headers[b"Set-Cookie"], b"session=abc")
+        self.assertNotIn(b"X-Aiohttp-Url", result.headers)
+        self.assertIn(b"X-Aiohttp-Url", response.headers)
+
+        response = Response(url=url, body=b"<html></html>", headers={"Content-Type": "text/html"})
+        result = self.middleware.process_response(request, response, self.spider_inst)
+        self.assertIsInstance(result, HtmlResponse)
+        self.assertEqual(result.url, "https://www.python.org/api")
+
+    def test_apply_host_delay(self):
+        slot = SimpleNamespace(delay=0.0)
+        engine = SimpleNamespace(downloader=SimpleNamespace(slots={"www.python.org": slot, "localhost": slot}))
+        middleware = AiohttpMiddleware.__new__(AiohttpMiddleware)
+        middleware.crawler = SimpleNamespace(engine=engine, settings=self.crawler.settings)
+        middleware._server_host = "localhost"
+        url = "http://localhost:8080/request/https://www.python.org/"
+        response = Response(url=url, headers={"X-Aiohttp-Host-Delay": "2.500"})
+
+        middleware._apply_host_delay(AiohttpRequest(url=url), response)
+        self.assertEqual(slot.delay, 0.0)
+        middleware._apply_host_delay(AiohttpRequest(url=url, meta={"download_slot": "www.python.org"}), response)
+        self.assertEqual(slot.delay, 2.5)
+
+    def test_process_response_timings(self):
+        middleware = AiohttpMiddleware.__new__(AiohttpMiddleware)
+        middleware.crawler = self.crawler
+        self.crawler.stats = StatsCollector(self.crawler)
+        url = "http://localhost:8080/request/https://www.python.org/"
+        request = AiohttpRequest(url=url, meta={"_original_url": "https://www.python.org/", "download_latency": 0.5})
+        response = Response(url=url, headers={"X-Aiohttp-Timings": "ttfb;dur=200.000, total;dur=300.000"})
+
+        for _ in range(2):
+            result = middleware.process_response(request, response, self.spider_inst)
+        self.assertNotIn(b"X-Aiohttp-Timings", result.headers)
+        stats = self.crawler.stats
+        self.assertEqual(stats.get_value("aiohttp/timings/count"), 2)
+        self.assertAlmostEqual(stats.get_value("aiohttp/timings/ttfb"), 0.4)
+        self.assertAlmostEqual(stats.get_value("aiohttp/timings/ttfb/max"), 0.2)
+        self.assertAlmostEqual(stats.get_value("aiohttp/timings/loopback"), 0.4)
+
     def test_process_response_invalid(self):
         url = "https://www.python.org/"
         request = Request(url=url)
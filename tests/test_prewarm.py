@@ -0,0 +1,109 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer, TestClient
+from scrapy import Request
+
+from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.prewarm import ConnectionPrewarmer, PrewarmQueue, get_origin
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+SERVER_URLS = ["http://10.0.0.1:8080/", "http://10.0.0.2:8080/"]
+
+
+async def make_origin() -> TestServer:
+    async def handle(request):
+        return web.Response(text="origin")
+
+    app = web.Application()
+    app.router.add_get("/{tail:.*}", handle)
+    origin = TestServer(app)
+    await origin.start_server()
+    return origin
+
+
+class TestConnectionPrewarmer(TestCase):
+
+    def test_get_origin(self):
+        self.assertEqual(get_origin("https://example.com/page?a=1"), "https://example.com:443")
+        self.assertEqual(get_origin("http://example.com:8080"), "http://example.com:8080")
+        self.assertIsNone(get_origin("ftp://example.com/"))
+        self.assertIsNone(get_origin("not a url"))
+
+    def test_admit(self):
+        prewarmer = ConnectionPrewarmer({"max_hosts": 2, "idle_timeout": 60.0})
+        admitted = prewarmer.admit(["https://a.com/", "https://a.com/other", "data:,", "https://b.com/"])
+        self.assertEqual(admitted, ["https://a.com:443", "https://b.com:443"])
+        self.assertEqual(prewarmer.admit(["https://a.com/", "https://c.com/"]), [])
+
+        prewarmer._warm["https://a.com:443"] = 0.0
+        self.assertEqual(prewarmer.admit(["https://c.com/", "https://d.com/"]), ["https://c.com:443"])
+
+
+class TestServerPrewarm(IsolatedAsyncioTestCase):
+
+    async def test_handle_prewarm(self):
+        origin = await make_origin()
+        origin_url = str(origin.make_url("/")).rstrip("/")
+        server = AiohttpServer(host="localhost", port=8080, metrics=True, prewarm_config={"connections": 2})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.post("/prewarm", json={"origin": origin_url})
+            self.assertEqual(response.status, 400)
+            response = await client.post("/prewarm", json=[origin_url, "http://127.0.0.1:1"])
+            self.assertEqual(response.status, 202)
+            self.assertEqual(len((await response.json())["warming"]), 2)
+            await asyncio.gather(*server._prewarmer._tasks)
+            self.assertEqual(server.metrics.get("prewarms_total", result="warmed"), 1)
+            self.assertEqual(server.metrics.get("prewarms_total", result="failed"), 1)
+            self.assertEqual(list(server._prewarmer._warm), [get_origin(origin_url)])
+
+            response = await client.post("/prewarm", json=[origin_url])
+            self.assertEqual((await response.json())["warming"], [])
+            response = await client.get(f"/request/{origin_url}/page")
+            self.assertEqual(await response.read(), b"origin")
+            self.assertEqual(server.metrics.get("connections_created_total"), 0)
+            self.assertEqual(server.metrics.get("connections_reused_total"), 1)
+        await origin.close()
+
+
+class TestPrewarmQueue(IsolatedAsyncioTestCase):
+
+    async def test_send(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, prewarm_config={})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            server_url = str(client.make_url("/"))
+            queue = PrewarmQueue({"flush_interval": 0.0})
+            # The queue sends from a blocking thread, outside of the event loop serving the server.
+            self.assertTrue(await asyncio.to_thread(queue.send, server_url, [str(origin.make_url("/"))]))
+            await asyncio.gather(*server._prewarmer._tasks)
+            self.assertEqual(list(server._prewarmer._warm), [get_origin(str(origin.make_url("/")))])
+            queue.stop()
+        self.assertFalse(await asyncio.to_thread(queue.send, server_url, []))
+        await origin.close()
+
+
+class TestAiohttpMiddlewarePrewarm(TestCase):
+
+    def setUp(self):
+        self.middleware = AiohttpMiddleware(
+            None,
+            DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+            farm_config={"server_urls": SERVER_URLS, "health_check_interval": 0},
+            prewarm_config={},
+        )
+        # Keep the origins pending instead of sending them to servers that are not running.
+        self.middleware._prewarm.stop()
+
+    def test_prewarm_request(self):
+        self.middleware._prewarm_request(AiohttpRequest("https://example.com/a"), None)
+        self.middleware._prewarm_request(Request("https://example.com/b", meta={"aiohttp": True}), None)
+        self.middleware._prewarm_request(Request("https://other.com/"), None)
+        self.middleware._prewarm_request(AiohttpRequest("https://proxied.com/", meta={"proxy": "http://p"}), None)
+        converted = self.middleware.process_request(AiohttpRequest("https://converted.com/"), None)
+        self.middleware._prewarm_request(converted, None)
+        server_url = self.middleware._farm.route("example.com").server_url
+        self.assertEqual(self.middleware._prewarm._pending, {server_url: ["https://example.com:443"]})
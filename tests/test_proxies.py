@@ -0,0 +1,186 @@
+import asyncio
+from collections import Counter
+from unittest import IsolatedAsyncioTestCase
+
+from aiohttp import web, ServerDisconnectedError
+from aiohttp.test_utils import TestServer, TestClient
+
+from scrapy_aiohttp import AiohttpServer
+from scrapy_aiohttp.metrics import ProxyMetrics
+from scrapy_aiohttp.proxies import ProxyPool, NoUpstreamProxyError
+
+
+async def make_upstream_proxy(name: str) -> TestServer:
+    """Start a stand-in forward proxy answering every request itself with its own name."""
+    requests = Counter()
+
+    async def handle(request):
+        requests[request.path] += 1
+        return web.Response(body=f"{name} {request.path}".encode())
+
+    app = web.Application()
+    app.router.add_route("*", "/{tail:.*}", handle)
+    proxy = TestServer(app)
+    proxy.requests = requests
+    await proxy.start_server()
+    return proxy
+
+
+async def use(pool: ProxyPool, host: str, status: int = 200) -> str:
+    async with pool.attempt(host) as attempt:
+        attempt.respond(status)
+    return attempt.proxy.url
+
+
+class TestProxyPool(IsolatedAsyncioTestCase):
+
+    async def test_init(self):
+        with self.assertRaises(ValueError):
+            ProxyPool({"strategy": "random"})
+        with self.assertRaises(NoUpstreamProxyError):
+            await ProxyPool({"proxies": []}).choose("example.com")
+
+    async def test_round_robin(self):
+        pool = ProxyPool({"proxies": ["http://a", "http://b", "http://a"]})
+        self.assertEqual(list(pool.proxies), ["http://a", "http://b"])
+        urls = [await use(pool, "example.com") for _ in range(4)]
+        self.assertEqual(Counter(urls), {"http://a": 2, "http://b": 2})
+
+    async def test_least_latency(self):
+        pool = ProxyPool({"proxies": ["http://a", "http://b"], "strategy": "least_latency"})
+        pool.record(pool.proxies["http://a"], 0.5, False)
+        pool.record(pool.proxies["http://b"], 0.1, False)
+        self.assertEqual(await use(pool, "example.com"), "http://b")
+        pool.record(pool.proxies["http://b"], None, True)
+        pool.record(pool.proxies["http://b"], None, True)
+        self.assertGreater(pool.proxies["http://b"].score, pool.proxies["http://b"].latency)
+
+    async def test_sticky(self):
+        pool = ProxyPool({"proxies": ["http://a", "http://b", "http://c"], "strategy": "sticky", "max_failures": 1})
+        hosts = [f"host{index}.com" for index in range(20)]
+        chosen = {host: await use(pool, host) for host in hosts}
+        self.assertEqual(chosen, {host: await use(pool, host) for host in hosts})
+        self.assertGreater(len(set(chosen.values())), 1)
+
+        host = hosts[0]
+        await use(pool, host, 503)
+        moved = await use(pool, host)
+        self.assertNotEqual(moved, chosen[host])
+        others = [other for other in hosts if chosen[other] != chosen[host]]
+        self.assertEqual([await use(pool, other) for other in others], [chosen[other] for other in others])
+
+    async def test_cooldown(self):
+        metrics = ProxyMetrics()
+        pool = ProxyPool({"proxies": ["http://a", "http://b"], "max_failures": 2, "cooldown": 60.0}, metrics)
+        proxy = pool.proxies["http://a"]
+        pool.record(proxy, None, True)
+        self.assertFalse(proxy.cooling_down)
+        pool.record(proxy, None, True)
+        self.assertTrue(proxy.cooling_down)
+        self.assertEqual({await use(pool, "example.com") for _ in range(3)}, {"http://b"})
+        self.assertEqual(metrics.get("upstream_proxy_cooldowns_total"), 1)
+        self.assertEqual(metrics.get("upstream_proxies", state="cooling"), 1)
+
+        pool.proxies["http://b"].cooldown_until = proxy.cooldown_until + 1
+        self.assertIs(await pool.choose("example.com"), proxy)
+
+        with self.assertRaises(ServerDisconnectedError):
+            async with pool.attempt("example.com"):
+                raise ServerDisconnectedError()
+
+    async def test_eviction(self):
+        metrics = ProxyMetrics()
+        pool = ProxyPool({"proxies": ["http://a", "http://b"], "min_requests": 4, "max_error_rate": 0.5,
+                          "max_failures": 100}, metrics)
+        proxy = pool.proxies["http://a"]
+        for _ in range(3):
+            pool.record(proxy, None, True)
+        self.assertIn("http://a", pool.proxies)
+        pool.record(proxy, None, True)
+        self.assertNotIn("http://a", pool.proxies)
+        self.assertTrue(proxy.retired)
+        self.assertEqual(metrics.get("upstream_proxy_evictions_total"), 1)
+        self.assertEqual(metrics.get("upstream_proxies", state="evicted"), 1)
+
+    async def test_eviction_probe(self):
+        metrics = ProxyMetrics()
+        pool = ProxyPool({"proxies": ["http://a", "http://b"], "strategy": "least_latency", "min_requests": 1,
+                          "max_error_rate": 0.1, "eviction_cooldown": 60.0}, metrics)
+        proxy = pool.proxies["http://a"]
+        pool.record(pool.proxies["http://b"], 0.5, False)
+        pool.record(proxy, None, True)
+        self.assertEqual({await use(pool, "example.com") for _ in range(3)}, {"http://b"})
+        # A static list is never refreshed, the proxy comes back after its eviction cool-down.
+        pool.update(["http://a", "http://b"])
+        self.assertNotIn("http://a", pool.proxies)
+
+        proxy.evicted_until = 0.0
+        async with pool.attempt("example.com") as probe:
+            self.assertIs(probe.proxy, proxy)
+            self.assertTrue(proxy.probing)
+            self.assertFalse(proxy.retired)
+            # Only one request probes the proxy at a time.
+            self.assertEqual({await use(pool, "example.com") for _ in range(3)}, {"http://b"})
+            probe.respond(503)
+        self.assertIn("http://a", pool.evicted)
+        self.assertEqual(metrics.get("upstream_proxy_evictions_total"), 1)
+
+        proxy.evicted_until = 0.0
+        self.assertEqual(await use(pool, "example.com"), "http://a")
+        self.assertIs(pool.proxies.get("http://a"), proxy)
+        self.assertFalse(proxy.probing)
+        self.assertEqual(metrics.get("upstream_proxy_reinstatements_total"), 1)
+        self.assertEqual(metrics.get("upstream_proxies", state="evicted"), 0)
+
+    async def test_provider(self):
+        calls = []
+
+        async def provider():
+            calls.append(None)
+            if len(calls) == 2:
+                raise OSError("provider down")
+            return [f"http://proxy{len(calls)}"]
+
+        pool = ProxyPool({"proxies": provider, "refresh_interval": 0.0})
+        self.assertEqual((await pool.choose("example.com")).url, "http://proxy1")
+        self.assertEqual((await pool.choose("example.com")).url, "http://proxy1")
+        self.assertEqual((await pool.choose("example.com")).url, "http://proxy3")
+        self.assertEqual(len(calls), 3)
+
+        pool = ProxyPool({"proxies": lambda: ["http://a"], "refresh_interval": 60.0})
+        await asyncio.gather(*(pool.choose("example.com") for _ in range(5)))
+        self.assertEqual(list(pool.proxies), ["http://a"])
+
+
+class TestServerUpstreamProxies(IsolatedAsyncioTestCase):
+
+    async def test_handle_request_upstream_proxies(self):
+        first, second = await make_upstream_proxy("first"), await make_upstream_proxy("second")
+        dead = await make_upstream_proxy("dead")
+        dead_url = str(dead.make_url("/")).rstrip("/")
+        await dead.close()
+        proxies = [dead_url, str(first.make_url("/")).rstrip("/"), str(second.make_url("/")).rstrip("/")]
+        server = AiohttpServer(
+            host="localhost", port=8080, metrics=True, proxy_config={"proxies": proxies, "max_failures": 1}
+        )
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            bodies = []
+            for _ in range(4):
+                response = await client.get("/request/http://example.com/page")
+                bodies.append(response.status if response.status != 200 else (await response.read()).split()[0])
+            self.assertEqual(bodies.count(500), 1)
+            self.assertEqual(set(bodies) - {500}, {b"first", b"second"})
+            self.assertTrue(server._proxy_pool.proxies[dead_url].cooling_down)
+            self.assertEqual(first.requests["/page"] + second.requests["/page"], 3)
+            sessions = {proxy.session for proxy in server._proxy_pool.proxies.values() if proxy.session is not None}
+            self.assertEqual(len(sessions), 3)
+
+            response = await client.get(
+                "/request/http://example.com/own", headers={"X-Aiohttp-Proxy": str(second.make_url("/"))}
+            )
+            self.assertEqual(await response.read(), b"second /own")
+        self.assertTrue(all(proxy.session is None or proxy.session.closed
+                            for proxy in server._proxy_pool.proxies.values()))
+        await first.close()
+        await second.close()
@@ -0,0 +1,109 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from aiohttp import ServerDisconnectedError
+from multidict import CIMultiDict
+
+from scrapy_aiohttp.metrics import ProxyMetrics
+from scrapy_aiohttp.retry import RetryPolicy, HedgePolicy
+
+
+def make_fetch(results: list, delays: list | None = None):
+    """Build a fetch returning or raising the given results in order, counting its calls."""
+    calls = []
+
+    async def fetch():
+        index = len(calls)
+        calls.append(index)
+        if delays:
+            await asyncio.sleep(delays[index])
+        result = results[index]
+        if isinstance(result, Exception):
+            raise result
+        return result, CIMultiDict(), str(index).encode()
+
+    return fetch, calls
+
+
+class TestRetryPolicy(IsolatedAsyncioTestCase):
+
+    def test_init(self):
+        policy = RetryPolicy()
+        self.assertTrue(policy.applies("GET"))
+        self.assertFalse(policy.applies("POST"))
+        with self.assertRaises(ValueError):
+            RetryPolicy({"methods": ["GET", "POST"]})
+
+    def test_get_backoff(self):
+        policy = RetryPolicy({"backoff_base": 0.1, "backoff_max": 1.0})
+        for retry in range(6):
+            self.assertLessEqual(policy.get_backoff(retry), min(1.0, 0.1 * 2 ** retry))
+        self.assertEqual(policy.get_backoff(0, "1"), 1.0)
+        self.assertLessEqual(policy.get_backoff(0, "120"), 0.1)
+
+    async def test_run(self):
+        metrics = ProxyMetrics()
+        policy = RetryPolicy({"backoff_base": 0.001}, metrics)
+        fetch, calls = make_fetch([ServerDisconnectedError(), 503, 200])
+        status, _, body = await policy.run(fetch)
+        self.assertEqual((status, body), (200, b"2"))
+        self.assertEqual(metrics.get("retries_total", reason="ServerDisconnectedError"), 1)
+        self.assertEqual(metrics.get("retries_total", reason="503"), 1)
+
+        fetch, calls = make_fetch([503, 503, 503, 200])
+        status, _, _ = await policy.run(fetch)
+        self.assertEqual(status, 503)
+        self.assertEqual(len(calls), 3)
+
+        fetch, calls = make_fetch([ServerDisconnectedError()] * 3)
+        with self.assertRaises(ServerDisconnectedError):
+            await policy.run(fetch)
+        self.assertEqual(len(calls), 3)
+
+        fetch, calls = make_fetch([404, 200])
+        status, _, _ = await policy.run(fetch)
+        self.assertEqual(status, 404)
+        self.assertEqual(len(calls), 1)
+
+    async def test_run_deadline(self):
+        policy = RetryPolicy({"backoff_base": 10.0, "backoff_max": 10.0})
+        fetch, calls = make_fetch([503, 200])
+        status, _, _ = await policy.run(fetch, time.monotonic() + 0.001)
+        self.assertEqual(status, 503)
+        self.assertEqual(len(calls), 1)
+
+
+class TestHedgePolicy(IsolatedAsyncioTestCase):
+
+    def test_get_delay(self):
+        policy = HedgePolicy({"percentile": 90, "min_samples": 10, "window": 100, "min_delay": 0.0})
+        self.assertIsNone(policy.get_delay())
+        for latency in range(1, 11):
+            policy.record(latency / 10)
+        self.assertAlmostEqual(policy.get_delay(), 0.9)
+        policy.record(100.0)
+        self.assertLessEqual(policy.get_delay(), policy.max_delay)
+        with self.assertRaises(ValueError):
+            HedgePolicy({"percentile": 100})
+
+    async def test_run(self):
+        metrics = ProxyMetrics()
+        policy = HedgePolicy({"min_samples": 1, "min_delay": 0.05}, metrics)
+        policy.record(0.01)
+
+        fetch, calls = make_fetch([200], [0.0])
+        self.assertEqual((await policy.run(fetch))[2], b"0")
+        self.assertEqual(len(calls), 1)
+
+        fetch, calls = make_fetch([200, 200], [1.0, 0.0])
+        start_time = time.monotonic()
+        self.assertEqual((await policy.run(fetch))[2], b"1")
+        self.assertLess(time.monotonic() - start_time, 0.5)
+        self.assertEqual(metrics.get("hedged_requests_total"), 1)
+        self.assertEqual(metrics.get("hedge_wins_total"), 1)
+
+        fetch, calls = make_fetch([200, ServerDisconnectedError()], [0.2, 0.0])
+        self.assertEqual((await policy.run(fetch))[2], b"0")
+        self.assertEqual(metrics.get("hedged_requests_total"), 2)
+        self.assertEqual(metrics.get("hedge_wins_total"), 1)
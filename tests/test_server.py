@@ -1,11 +1,19 @@
 import asyncio
+import gzip
+import json
+import os
+import pickle
+import signal
+from collections import Counter
 from unittest import TestCase, IsolatedAsyncioTestCase
 
-from multidict import CIMultiDictProxy
-from aiohttp import web, ClientConnectorError, ClientSession, ClientResponse
-from aiohttp.test_utils import make_mocked_request, AppRunner, AioHTTPTestCase
+from multidict import CIMultiDict, CIMultiDictProxy
+from aiohttp import web, ClientConnectorError, ClientSession, ClientResponse, ClientPayloadError
+from aiohttp.test_utils import make_mocked_request, AppRunner, AioHTTPTestCase, TestServer, TestClient
 
 from scrapy_aiohttp import AiohttpServer
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG, HeaderContext, ServerStartupError
+from scrapy_aiohttp.utils.batch import encode_item, read_results
 
 mock_request = make_mocked_request(
     method="GET",
@@ -27,15 +35,45 @@ class TestAiohttpServer(TestCase):
         self.assertEqual(server._host, "localhost")
         self.assertEqual(server._port, 8080)
 
+    def test_init_connector_config(self):
+        server = AiohttpServer(host="localhost", port=8080, connector_config={"limit": 10})
+        self.assertEqual(server.connector_config["limit"], 10)
+        self.assertEqual(server.connector_config["keepalive_timeout"], 15.0)
+
+    def test_init_workers(self):
+        server = AiohttpServer(host="localhost", port=8080, workers=4)
+        self.assertEqual(server.workers, 4)
+        self.assertIsNone(server._process)
+        with self.assertRaises(ValueError):
+            AiohttpServer(host="localhost", port=8080, workers=0)
+
+    def test_init_loopback_compression(self):
+        server = AiohttpServer(host="localhost", port=8080, loopback_compression="gzip")
+        self.assertEqual(server.loopback_compression, "gzip")
+        with self.assertRaises(ValueError):
+            AiohttpServer(host="localhost", port=8080, loopback_compression="lzma")
+
     def test_init_missing_args(self):
         with self.assertRaises(AttributeError):
             AiohttpServer()
 
+    def test_pickle_state(self):
+        server = AiohttpServer(host="localhost", port=8080, start_method="spawn", metrics=True)
+        server.extract_request_header_config(DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
+        worker_server = pickle.loads(pickle.dumps(server))
+        self.assertEqual(worker_server.request_header_config, server.request_header_config)
+        self.assertIsNot(worker_server.app, server.app)
+        self.assertEqual(len(worker_server.app.router.routes()), len(server.app.router.routes()))
+        self.assertTrue(worker_server.handlers)
+        self.assertEqual(worker_server._processes, [])
+
     def test_add_and_get_request_header(self):
         server = AiohttpServer(host="localhost", port=8080)
         self.assertNotIn("test_add_and_get_request_header", server.request_header_config)
         server.add_request_header_config("test_add_and_get_request_header", "test")
         self.assertIn("test_add_and_get_request_header", server.request_header_config)
+        other_server = AiohttpServer(host="localhost", port=8080)
+        self.assertNotIn("test_add_and_get_request_header", other_server.request_header_config)
 
     def test_extract_request_header_config(self):
         server = AiohttpServer(host="localhost", port=8080)
@@ -45,6 +83,7 @@ class TestAiohttpServer(TestCase):
 
     def test_get_request_headers(self):
         server = AiohttpServer(host="localhost", port=8080)
+        server.extract_request_header_config(DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
         server.add_request_header_config("test None", None)
 
         request = make_mocked_request(
@@ -66,6 +105,124 @@ class TestAiohttpServer(TestCase):
         with self.assertRaises(TypeError):
             server._get_request_headers(request)
 
+    def test_header_plan(self):
+        urls = []
+
+        def target_path(request, context):
+            urls.append(context.url)
+            return context.url.path
+
+        server = AiohttpServer(host="localhost", port=8080)
+        server.extract_request_header_config({
+            "Host": lambda request, context: context.url.raw_host,
+            "X-Path": target_path,
+            "X-Method": lambda request: request.method,
+            "X-Default": lambda request, default="default": default,
+            "Accept": None,
+            "Content-Type": "text/html",
+        })
+        server._prerun_configurator()
+        plan = server._header_plan
+        self.assertEqual(plan.inherited, ("Accept",))
+        self.assertEqual(dict(plan.static), {"Content-Type": "text/html"})
+        self.assertEqual([accepts_context for *_, accepts_context in plan.callables], [True, True, False, False])
+
+        request = make_mocked_request(
+            method="POST",
+            path="/request/https://WWW.Python.org/doc/",
+            headers=CIMultiDict([("Accept", "text/html"), ("Accept", "*/*")]),
+            match_info={"url": "https://WWW.Python.org/doc/"}
+        )
+        context = HeaderContext(request)
+        result = server._build_request_headers(request, context)
+        self.assertEqual(result["Host"], "www.python.org")
+        self.assertEqual(result["X-Path"], "/doc/")
+        self.assertEqual(result["X-Method"], "POST")
+        self.assertEqual(result["X-Default"], "default")
+        self.assertEqual(result.getall("Accept"), ["text/html", "*/*"])
+        self.assertIs(urls[0], context.url)
+        self.assertNotIn("Accept", plan.static)
+
+        server.add_request_header_config("Content-Type", "application/json")
+        self.assertIsNone(server._header_plan)
+        self.assertEqual(server._get_request_headers(request)["Content-Type"], "application/json")
+
+
+async def make_origin() -> TestServer:
+    requests = Counter()
+
+    @web.middleware
+    async def count_requests(request, handler):
+        requests[request.path] += 1
+        return await handler(request)
+
+    async def handle_body(request):
+        size = int(request.match_info["size"])
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for _ in range(size // 1000):
+            await response.write(b"x" * 1000)
+        await response.write_eof()
+        return response
+
+    async def handle_truncated(request):
+        response = web.StreamResponse()
+        response.content_length = 50000
+        await response.prepare(request)
+        await response.write(b"x" * 10000)
+        request.transport.close()
+        return response
+
+    async def handle_echo(request):
+        return web.json_response({
+            "method": request.method,
+            "query": dict(request.query),
+            "cookies": dict(request.cookies),
+            "body": await request.text(),
+        })
+
+    async def handle_json(request):
+        response = web.json_response({"a": 1}, headers={"ETag": '"v1"', "Cache-Control": "max-age=60"})
+        response.set_cookie("session", "abc")
+        response.enable_compression(web.ContentCoding.gzip)
+        return response
+
+    async def handle_cached(request):
+        return web.json_response({"a": 1}, headers={"ETag": '"v1"', "Cache-Control": "max-age=60"})
+
+    async def handle_redirect(request):
+        raise web.HTTPFound("/json")
+
+    async def handle_etag(request):
+        headers = {"ETag": '"v2"', "Cache-Control": "no-cache"}
+        if request.headers.get("If-None-Match") == '"v2"':
+            return web.Response(status=304, headers={**headers, "Set-Cookie": "seen=1"})
+        return web.Response(body=b"etag body", headers=headers)
+
+    async def handle_slow(request):
+        await asyncio.sleep(0.2)
+        return web.Response(body=b"slow body")
+
+    async def handle_flaky(request):
+        if requests[request.path] <= 2:
+            return web.Response(status=503, headers={"Retry-After": "0"})
+        return web.Response(body=b"flaky body")
+
+    app = web.Application(middlewares=[count_requests])
+    app.router.add_get("/slow", handle_slow)
+    app.router.add_get("/flaky", handle_flaky)
+    app.router.add_get("/etag", handle_etag)
+    app.router.add_get("/json", handle_json)
+    app.router.add_get("/cached", handle_cached)
+    app.router.add_get("/redirect", handle_redirect)
+    app.router.add_get("/body/{size}", handle_body)
+    app.router.add_get("/truncated", handle_truncated)
+    app.router.add_route("*", "/echo", handle_echo)
+    origin = TestServer(app)
+    origin.requests = requests
+    await origin.start_server()
+    return origin
+
 
 class AsyncTestAiohttpServer(IsolatedAsyncioTestCase):
 
@@ -86,6 +243,93 @@ class AsyncTestAiohttpServer(IsolatedAsyncioTestCase):
         with self.assertRaises(ClientConnectorError):
             await send_request_get_status("http://localhost:8080/error")
 
+    async def test_run_workers_and_restart(self):
+        async def send_request_get_status(url):
+            async with ClientSession() as session:
+                async with session.get(url=url) as r:
+                    pass
+            return r.status
+
+        server = AiohttpServer(server_url="http://localhost:8081/", workers=2, health_check_interval=0.1)
+        server.run()
+        self.assertEqual(server.alive_workers, 2)
+        status = await send_request_get_status("http://localhost:8081/error")
+        self.assertEqual(status, 404)
+
+        os.kill(server._processes[1].pid, signal.SIGKILL)
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if server.restarts and server.alive_workers == 2:
+                break
+        self.assertEqual(server.restarts, 1)
+        self.assertEqual(server.alive_workers, 2)
+        status = await send_request_get_status("http://localhost:8081/error")
+        self.assertEqual(status, 404)
+
+        processes = list(server._processes)
+        server.stop()
+        self.assertFalse(any(process.is_alive() for process in processes))
+        self.assertIsNone(server._process)
+        with self.assertRaises(ClientConnectorError):
+            await send_request_get_status("http://localhost:8081/error")
+
+    async def test_run_readiness(self):
+        async def fail(app):
+            raise RuntimeError("startup failed")
+
+        async def hang(app):
+            await asyncio.sleep(5)
+
+        server = AiohttpServer(server_url="http://localhost:8082/", workers=2)
+        server.app.on_startup.append(fail)
+        with self.assertRaises(ServerStartupError) as e:
+            server.run()
+        self.assertIn("RuntimeError('startup failed')", str(e.exception))
+        self.assertIsNone(server._process)
+        self.assertFalse(server._sockets)
+
+        server = AiohttpServer(server_url="http://localhost:8082/", startup_timeout=0.2)
+        server.app.on_startup.append(hang)
+        with self.assertRaises(ServerStartupError) as e:
+            server.run()
+        self.assertEqual(str(e.exception), "AiohttpServer-0 was not ready within 0.2 seconds.")
+        self.assertIsNone(server._process)
+
+    async def test_run_spawn(self):
+        server = AiohttpServer(server_url="http://localhost:8083/", start_method="spawn")
+        server.extract_request_header_config(DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG)
+        server.run()
+        async with ClientSession() as session:
+            async with session.get("http://localhost:8083/error") as response:
+                self.assertEqual(response.status, 404)
+        server.stop()
+
+        server.add_request_header_config("X-Lambda", lambda request: "lambda")
+        with self.assertRaises(ServerStartupError):
+            server.run()
+        self.assertIsNone(server._process)
+
+    async def test_run_workers_metrics(self):
+        server = AiohttpServer(server_url="http://localhost:8084/", workers=2, metrics=True)
+        server.run()
+        try:
+            async with ClientSession() as session:
+                # Every request opens a new connection, landing on either worker.
+                for _ in range(4):
+                    url = "http://localhost:8084/request/http://127.0.0.1:1/"
+                    async with session.get(url, headers={"Connection": "close"}):
+                        pass
+                for _ in range(4):
+                    async with session.get("http://localhost:8084/metrics", headers={"Connection": "close"}) as r:
+                        text = await r.text()
+                    samples = [line for line in text.splitlines() if line.startswith("scrapy_aiohttp_requests_total")]
+                    self.assertEqual(sum(float(line.split()[-1]) for line in samples), 4)
+                    self.assertIn('worker="0"', text)
+                    self.assertIn('worker="1"', text)
+                    self.assertEqual(text.count("# TYPE scrapy_aiohttp_requests_total counter"), 1)
+        finally:
+            server.stop()
+
     async def test_handler_validation_middleware_valid(self):
         async def handler(r):
             return True
@@ -104,7 +348,9 @@ class AsyncTestAiohttpServer(IsolatedAsyncioTestCase):
 
     async def test_handle_request_valid(self):
         server = AiohttpServer(host="localhost", port=8080)
+        await server._on_startup(server.app)
         response = await server._handle_request(mock_request)
+        await server._on_cleanup(server.app)
         self.assertIsInstance(response, web.Response)
         self.assertEqual(response.status, 200)
 
@@ -116,5 +362,307 @@ class AsyncTestAiohttpServer(IsolatedAsyncioTestCase):
             headers={},
             match_info={"url": "https://www.%.org/"}
         )
+        await server._on_startup(server.app)
         response = await server._handle_request(request)
+        await server._on_cleanup(server.app)
         self.assertEqual(response.status, 500)
+
+    async def test_client_session_lifecycle(self):
+        server = AiohttpServer(host="localhost", port=8080, connector_config={"limit": 7, "limit_per_host": 3})
+        self.assertIsNone(server._client_session)
+        await server._on_startup(server.app)
+        session = server._client_session
+        self.assertIsInstance(session, ClientSession)
+        self.assertEqual(session.connector.limit, 7)
+        self.assertEqual(session.connector.limit_per_host, 3)
+        self.assertFalse(session.headers)
+        await server._on_cleanup(server.app)
+        self.assertTrue(session.closed)
+        self.assertIsNone(server._client_session)
+
+    async def test_handle_request_stream(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, stream_responses=True, chunk_size=1000)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/body/50000')}")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(len(await response.read()), 50000)
+        await origin.close()
+
+    async def test_handle_request_stream_maxsize(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, stream_responses=True, chunk_size=1000, maxsize=10000)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/body/50000')}")
+            self.assertEqual(response.status, 200)
+            with self.assertRaises(ClientPayloadError):
+                await response.read()
+        await origin.close()
+
+    async def test_handle_request_stream_truncated(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, stream_responses=True, chunk_size=1000)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/truncated')}")
+            self.assertEqual(response.status, 200)
+            # The transfer is aborted at once instead of waiting for a second response that can never be sent.
+            with self.assertRaises(ClientPayloadError):
+                await asyncio.wait_for(response.read(), 5)
+            self.assertEqual((await client.get("/health")).status, 200)
+        await origin.close()
+
+    async def test_handle_request_method_body_and_cookies(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.put(
+                f"/request/{origin.make_url('/echo')}?page=2&q=a+b",
+                data=b"a" * 100000,
+                headers={"X-Aiohttp-Cookies": '{"session": "abc"}', "X-Aiohttp-Timeout": "30"},
+            )
+            self.assertEqual(response.status, 200)
+            data = await response.json(content_type=None)
+        self.assertEqual(data["method"], "PUT")
+        self.assertEqual(data["query"], {"page": "2", "q": "a b"})
+        self.assertEqual(data["cookies"], {"session": "abc"})
+        self.assertEqual(data["body"], "a" * 100000)
+        await origin.close()
+
+    async def test_handle_request_response_headers(self):
+        origin = await make_origin()
+        for stream_responses in (False, True):
+            server = AiohttpServer(host="localhost", port=8080, stream_responses=stream_responses)
+            server._prerun_configurator()
+            async with TestClient(TestServer(server.app)) as client:
+                response = await client.get(
+                    f"/request/{origin.make_url('/redirect')}", headers={"Accept-Encoding": "gzip"}
+                )
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.content_type, "application/json")
+                self.assertEqual(response.headers["ETag"], '"v1"')
+                self.assertEqual(response.headers["Cache-Control"], "max-age=60")
+                self.assertIn("session=abc", response.headers["Set-Cookie"])
+                self.assertNotIn("Content-Encoding", response.headers)
+                self.assertEqual(response.headers["X-Aiohttp-Url"], str(origin.make_url("/json")))
+                self.assertEqual(await response.json(), {"a": 1})
+        await origin.close()
+
+    async def test_handle_request_decompress_passthrough(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, decompress=False)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app), auto_decompress=False) as client:
+            response = await client.get(f"/request/{origin.make_url('/json')}")
+            self.assertEqual(response.headers["Content-Encoding"], "gzip")
+            self.assertEqual(gzip.decompress(await response.read()), b'{"a": 1}')
+        await origin.close()
+
+    async def test_handle_request_loopback_compression(self):
+        origin = await make_origin()
+        for stream_responses in (False, True):
+            server = AiohttpServer(
+                host="localhost", port=8080, stream_responses=stream_responses, loopback_compression="gzip"
+            )
+            server._prerun_configurator()
+            async with TestClient(TestServer(server.app), auto_decompress=False) as client:
+                url = f"/request/{origin.make_url('/body/50000')}"
+                response = await client.get(url, headers={"Accept-Encoding": "gzip, deflate"})
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(await response.read()), b"x" * 50000)
+
+                response = await client.get(url, headers={"Accept-Encoding": "identity"})
+                self.assertNotIn("Content-Encoding", response.headers)
+                self.assertEqual(len(await response.read()), 50000)
+        await origin.close()
+
+    async def test_handle_request_throttle(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, throttle_config={"start_delay": 0.5})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/json')}")
+            self.assertEqual(response.status, 200)
+            self.assertGreater(float(response.headers["X-Aiohttp-Host-Delay"]), 0.0)
+        self.assertIn("127.0.0.1", server._throttle.slots)
+        await origin.close()
+
+    async def test_handle_request_retry(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, metrics=True, retry_config={"backoff_base": 0.001})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/flaky')}")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(await response.read(), b"flaky body")
+            self.assertEqual(origin.requests["/flaky"], 3)
+            self.assertEqual(server.metrics.get("retries_total", reason="503"), 2)
+
+            url = f"http://127.0.0.1:{origin.port}/json"
+            await origin.close()
+            response = await client.get(f"/request/{url}")
+            self.assertEqual(response.status, 500)
+            self.assertEqual(server.metrics.get("retries_total", reason="ClientConnectorError"), 2)
+
+    async def test_handle_request_timeout(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, timeout_config={"read": 0.05})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/slow')}", headers={"X-Aiohttp-Timeout": "30"})
+            self.assertEqual(response.status, 504)
+            response = await client.get(f"/request/{origin.make_url('/json')}")
+            self.assertEqual(response.status, 200)
+        self.assertEqual(server.timeout.sock_read, 0.05)
+        self.assertEqual(server.timeout.total, 300.0)
+        await origin.close()
+
+    async def test_handle_request_metrics(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, metrics=True)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            for _ in range(2):
+                response = await client.get(f"/request/{origin.make_url('/body/5000')}")
+                self.assertEqual(len(await response.read()), 5000)
+            phases = {item.split(";")[0] for item in response.headers["X-Aiohttp-Timings"].split(", ")}
+            self.assertTrue({"queue", "ttfb", "body", "total"} <= phases)
+
+            response = await client.get("/metrics")
+            self.assertEqual(response.status, 200)
+            text = await response.text()
+        self.assertIn('scrapy_aiohttp_requests_total{status="200"} 2\n', text)
+        self.assertIn("scrapy_aiohttp_bytes_in_total 10000\n", text)
+        self.assertIn("scrapy_aiohttp_bytes_out_total 10000\n", text)
+        self.assertIn("scrapy_aiohttp_connections_created_total 1\n", text)
+        self.assertIn("scrapy_aiohttp_connection_reuse_ratio 0.5\n", text)
+        self.assertIn('scrapy_aiohttp_phase_seconds_count{phase="connect"} 1\n', text)
+        await origin.close()
+
+    async def test_handle_request_cache(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, metrics=True, cache_config={"spill_size": 5})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            for result in ("MISS", "HIT"):
+                response = await client.get(f"/request/{origin.make_url('/cached')}")
+                self.assertEqual(response.headers["X-Aiohttp-Cache"], result)
+                self.assertEqual(response.headers["ETag"], '"v1"')
+                self.assertEqual(await response.json(), {"a": 1})
+            self.assertEqual(origin.requests["/cached"], 1)
+
+            # Responses setting cookies are never stored and replayed.
+            for _ in range(2):
+                response = await client.get(f"/request/{origin.make_url('/json')}")
+                self.assertEqual(response.headers["X-Aiohttp-Cache"], "MISS")
+                self.assertIn("session=abc", response.headers["Set-Cookie"])
+            self.assertEqual(origin.requests["/json"], 2)
+
+            for result in ("MISS", "REVALIDATED", "REVALIDATED"):
+                response = await client.get(f"/request/{origin.make_url('/etag')}")
+                self.assertEqual(response.status, 200)
+                self.assertEqual(response.headers["X-Aiohttp-Cache"], result)
+                self.assertEqual(await response.read(), b"etag body")
+                self.assertEqual(response.headers.get("Set-Cookie"), "seen=1" if result == "REVALIDATED" else None)
+            self.assertEqual(origin.requests["/etag"], 3)
+
+            response = await client.get(f"/request/{origin.make_url('/json')}", headers={"Cache-Control": "no-store"})
+            self.assertNotIn("X-Aiohttp-Cache", response.headers)
+            response = await client.post(f"/request/{origin.make_url('/echo')}", data=b"body")
+            self.assertNotIn("X-Aiohttp-Cache", response.headers)
+
+            text = await (await client.get("/metrics")).text()
+        self.assertIn('scrapy_aiohttp_cache_requests_total{result="hit"} 1\n', text)
+        self.assertIn('scrapy_aiohttp_cache_requests_total{result="revalidated"} 2\n', text)
+        self.assertIn('scrapy_aiohttp_cache_entries{tier="disk"} 2\n', text)
+        self.assertIsNone(server._cache._worker_directory)
+        await origin.close()
+
+    async def test_handle_request_coalesce(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, metrics=True, coalesce_config={"routes": ["/slow$"]})
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            async def fetch(path, method="GET"):
+                response = await client.request(method, f"/request/{origin.make_url(path)}")
+                return response.status, await response.read()
+
+            results = await asyncio.gather(*(fetch("/slow") for _ in range(5)))
+            self.assertEqual(results, [(200, b"slow body")] * 5)
+            self.assertEqual(origin.requests["/slow"], 1)
+            await asyncio.gather(*(fetch("/body/1000") for _ in range(2)))
+            self.assertEqual(origin.requests["/body/1000"], 2)
+            await asyncio.gather(*(fetch("/echo", "POST") for _ in range(2)))
+            self.assertEqual(origin.requests["/echo"], 2)
+            self.assertFalse(server._singleflight.fetches)
+        self.assertEqual(server.metrics.get("coalesced_requests_total"), 4)
+        await origin.close()
+
+    async def test_handle_batch(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, metrics=True)
+        server.extract_request_header_config({"User-Agent": None})
+        server._prerun_configurator()
+        payload = b"".join((
+            encode_item("slow", "GET", str(origin.make_url("/slow")), [("User-Agent", "batch")]),
+            encode_item("body", "GET", str(origin.make_url("/body/5000")), []),
+            encode_item("echo", "POST", str(origin.make_url("/echo")), [("X-Aiohttp-Cookies", '{"a": "1"}')], b"abc"),
+            encode_item("ftp", "GET", "ftp://example.com/", []),
+        ))
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.post("/batch", data=payload)
+            self.assertEqual(response.status, 200)
+            results = [result async for result in read_results(response.content)]
+        self.assertEqual({item_id for item_id, *_ in results}, {None, "body", "echo", "slow"})
+        self.assertEqual(results[-1][0], "slow")
+        results = {item_id: (status, dict(headers), body) for item_id, status, headers, body in results}
+        self.assertEqual(results[None][0], 400)
+        self.assertEqual(results["slow"][0], 200)
+        self.assertEqual(results["slow"][2], b"slow body")
+        self.assertEqual(results["body"][2], b"x" * 5000)
+        self.assertIn("X-Aiohttp-Timings", results["body"][1])
+        self.assertEqual(results["body"][1]["X-Aiohttp-Url"], str(origin.make_url("/body/5000")))
+        echo = json.loads(results["echo"][2])
+        self.assertEqual((echo["method"], echo["body"], echo["cookies"]), ("POST", "abc", {"a": "1"}))
+        self.assertEqual(server.metrics.get("batch_items_total", status=200), 3)
+        await origin.close()
+
+    async def test_metrics_disabled(self):
+        server = AiohttpServer(host="localhost", port=8080)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get("/metrics")
+            self.assertEqual(response.status, 404)
+
+    def test_get_request_options(self):
+        request = make_mocked_request(
+            method="GET",
+            path=f"/request/https://www.python.org/",
+            headers={
+                "X-Aiohttp-Cookies": '{"a": "1"}',
+                "X-Aiohttp-Timeout": "12.5",
+                "X-Aiohttp-Allow-Redirects": "0",
+                "X-Aiohttp-Proxy": "http://proxy:3128",
+            },
+        )
+        options = AiohttpServer._get_request_options(request)
+        self.assertEqual(options["cookies"], {"a": "1"})
+        self.assertEqual(options["timeout"].total, 12.5)
+        self.assertFalse(options["allow_redirects"])
+        self.assertEqual(options["proxy"], "http://proxy:3128")
+        self.assertEqual(AiohttpServer._get_request_options(mock_request), {})
+
+    async def test_handle_request_maxsize(self):
+        origin = await make_origin()
+        server = AiohttpServer(host="localhost", port=8080, maxsize=10000)
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            response = await client.get(f"/request/{origin.make_url('/body/50000')}")
+            self.assertEqual(response.status, 502)
+            response = await client.get(f"/request/{origin.make_url('/body/5000')}")
+            self.assertEqual(response.status, 200)
+            self.assertEqual(len(await response.read()), 5000)
+        await origin.close()
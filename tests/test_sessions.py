@@ -0,0 +1,160 @@
+import asyncio
+import os
+import socket
+import tempfile
+from unittest import IsolatedAsyncioTestCase, TestCase
+
+from aiohttp import web, ClientSession
+from aiohttp.test_utils import TestServer, TestClient
+
+from scrapy_aiohttp import AiohttpMiddleware, AiohttpRequest, AiohttpServer
+from scrapy_aiohttp.metrics import ProxyMetrics
+from scrapy_aiohttp.sessions import SessionPool, create_client_session, get_cookie_jar_path
+from scrapy_aiohttp.utils import DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG
+
+SERVER_URLS = ["http://10.0.0.1:8080/", "http://10.0.0.2:8080/"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def make_origin() -> TestServer:
+    async def login(request):
+        response = web.Response(text="logged in")
+        response.set_cookie("user", request.query.get("user", "anonymous"))
+        return response
+
+    async def whoami(request):
+        return web.Response(text=request.cookies.get("user", "nobody"))
+
+    app = web.Application()
+    app.router.add_get("/login", login)
+    app.router.add_get("/whoami", whoami)
+    origin = TestServer(app)
+    await origin.start_server()
+    return origin
+
+
+class TestSessionPool(IsolatedAsyncioTestCase):
+
+    async def test_use_evicts_least_recently_used(self):
+        metrics = ProxyMetrics()
+        pool = SessionPool({"max_sessions": 2}, metrics)
+        async with pool.use("a", create_client_session) as a:
+            async with pool.use("b", create_client_session):
+                pass
+            async with pool.use("a", create_client_session) as same:
+                self.assertIs(same, a)
+            async with pool.use("c", create_client_session):
+                pass
+            self.assertEqual(list(pool.sessions), ["a", "c"])
+            self.assertFalse(a.closed)
+        self.assertEqual(metrics.get("named_sessions"), 2)
+        self.assertEqual(metrics.get("named_session_evictions_total"), 1)
+        await pool.close()
+        self.assertTrue(a.closed)
+        self.assertEqual(pool.sessions, {})
+
+    async def test_cookie_jar_persistence(self):
+        origin = await make_origin()
+        with tempfile.TemporaryDirectory() as directory:
+            config = {"directory": directory, "allow_ip_cookies": True}
+            pool = SessionPool(config)
+            async with pool.use("alice", create_client_session) as session:
+                await (await session.get(origin.make_url("/login?user=alice"))).read()
+            await pool.close()
+            self.assertTrue(os.path.exists(get_cookie_jar_path(directory, "alice")))
+
+            # The next crawl finds the cookies of the session without logging in again.
+            pool = SessionPool(config)
+            async with pool.use("alice", create_client_session) as session:
+                self.assertEqual(await (await session.get(origin.make_url("/whoami"))).text(), "alice")
+            async with pool.use("bob", create_client_session) as session:
+                self.assertEqual(await (await session.get(origin.make_url("/whoami"))).text(), "nobody")
+            await pool.close()
+        await origin.close()
+
+
+class TestServerSessions(IsolatedAsyncioTestCase):
+
+    async def test_handle_request_session(self):
+        origin = await make_origin()
+        origin_url = str(origin.make_url("/")).rstrip("/")
+        server = AiohttpServer(
+            host="localhost", port=8080, cache_config={}, coalesce_config={}, session_config={"allow_ip_cookies": True}
+        )
+        server._prerun_configurator()
+        async with TestClient(TestServer(server.app)) as client:
+            for user in ("alice", "bob"):
+                headers = {"X-Aiohttp-Session": user}
+                response = await client.get(f"/request/{origin_url}/login?user={user}", headers=headers)
+                self.assertEqual(response.status, 200)
+            for user in ("alice", "bob"):
+                response = await client.get(f"/request/{origin_url}/whoami", headers={"X-Aiohttp-Session": user})
+                self.assertEqual(await response.text(), user)
+                self.assertNotIn("X-Aiohttp-Cache", response.headers)
+            response = await client.get(f"/request/{origin_url}/whoami")
+            self.assertEqual(await response.text(), "nobody")
+        self.assertEqual(server._sessions.sessions, {})
+        await origin.close()
+
+
+    async def test_sessions_owned_by_one_worker(self):
+        origin = await make_origin()
+        origin_url = str(origin.make_url("/")).rstrip("/")
+        server_url = f"http://127.0.0.1:{free_port()}/"
+        users = [f"user-{index}" for index in range(8)]
+        with tempfile.TemporaryDirectory() as directory:
+            server = AiohttpServer(
+                server_url=server_url, workers=2, session_config={"directory": directory, "allow_ip_cookies": True}
+            )
+            server.run()
+            try:
+                # Every request opens a new loopback connection, landing on either worker.
+                async with ClientSession() as session:
+                    for user in users:
+                        headers = {"X-Aiohttp-Session": user, "Connection": "close"}
+                        url = f"{server_url}request/{origin_url}/login?user={user}"
+                        await (await session.get(url, headers=headers)).read()
+                    for _ in range(3):
+                        for user in users:
+                            headers = {"X-Aiohttp-Session": user, "Connection": "close"}
+                            response = await session.get(f"{server_url}request/{origin_url}/whoami", headers=headers)
+                            self.assertEqual(await response.text(), user)
+            finally:
+                await asyncio.to_thread(server.stop, 5.0)
+            self.assertEqual(len(os.listdir(directory)), len(users))
+            pool = SessionPool({"directory": directory, "allow_ip_cookies": True})
+            for user in users:
+                async with pool.use(user, create_client_session) as session:
+                    self.assertEqual(await (await session.get(origin.make_url("/whoami"))).text(), user)
+            await pool.close()
+        await origin.close()
+
+
+class TestAiohttpMiddlewareSessions(TestCase):
+
+    def setUp(self):
+        self.middleware = AiohttpMiddleware(
+            None,
+            DEFAULT_AIOHTTP_REQUEST_HEADERS_CONFIG,
+            farm_config={"server_urls": SERVER_URLS, "health_check_interval": 0},
+        )
+
+    def test_control_header(self):
+        request = AiohttpRequest("https://www.python.org/", meta={"aiohttp_session": "account-1"})
+        self.assertEqual(AiohttpMiddleware._get_control_headers(request)["X-Aiohttp-Session"], "account-1")
+        self.assertNotIn("X-Aiohttp-Session", AiohttpMiddleware._get_control_headers(AiohttpRequest("https://a.com")))
+
+    def test_route_by_session(self):
+        # Every request of a session reaches the same server, whatever its target host.
+        target_urls = {
+            self.middleware.process_request(
+                AiohttpRequest(f"https://host-{index}.com/", meta={"aiohttp_session": "account-1"}), None
+            ).target_url
+            for index in range(20)
+        }
+        self.assertEqual(len(target_urls), 1)
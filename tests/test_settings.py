@@ -0,0 +1,145 @@
+import os
+from unittest import TestCase
+
+from scrapy.settings import Settings
+
+from scrapy_aiohttp.settings import (
+    get_connector_config,
+    get_throttle_config,
+    get_cache_config,
+    get_coalesce_config,
+    get_timeout_config,
+    get_retry_config,
+    get_hedge_config,
+    get_proxy_config,
+    get_farm_config,
+    get_prewarm_config,
+    get_extract_config,
+    get_admission_config,
+    get_session_config,
+)
+
+
+class TestSettings(TestCase):
+
+    def test_get_connector_config(self):
+        settings = Settings({
+            "AIOHTTP_CONNECTOR_LIMIT": 50,
+            "AIOHTTP_CONNECTOR_LIMIT_PER_HOST": "4",
+            "AIOHTTP_CONNECTOR_SSL": False,
+        })
+        config = get_connector_config(settings)
+        self.assertEqual(config["limit"], 50)
+        self.assertEqual(config["limit_per_host"], 4)
+        self.assertFalse(config["ssl"])
+        self.assertEqual(config["ttl_dns_cache"], 10)
+
+    def test_get_throttle_config(self):
+        self.assertIsNone(get_throttle_config(Settings()))
+        config = get_throttle_config(Settings({
+            "AIOHTTP_THROTTLE_ENABLED": True,
+            "AIOHTTP_THROTTLE_CONCURRENCY_PER_HOST": "2",
+            "AIOHTTP_THROTTLE_MAX_DELAY": 5,
+        }))
+        self.assertEqual(config["concurrency_per_host"], 2)
+        self.assertEqual(config["max_delay"], 5.0)
+        self.assertEqual(config["target_concurrency"], 4.0)
+
+    def test_get_cache_config(self):
+        self.assertIsNone(get_cache_config(Settings()))
+        config = get_cache_config(Settings({"AIOHTTP_CACHE_ENABLED": True, "AIOHTTP_CACHE_DEFAULT_TTL": "30"}))
+        self.assertEqual(config["default_ttl"], 30.0)
+        self.assertEqual(config["spill_size"], 1024 * 1024)
+        self.assertIsNone(config["directory"])
+
+    def test_get_coalesce_config(self):
+        self.assertIsNone(get_coalesce_config(Settings()))
+        config = get_coalesce_config(Settings({
+            "AIOHTTP_COALESCE_ENABLED": True,
+            "AIOHTTP_COALESCE_ROUTES": "/sitemap",
+        }))
+        self.assertEqual(config["methods"], ("GET", "HEAD"))
+        self.assertEqual(config["routes"], ("/sitemap",))
+
+    def test_get_timeout_config(self):
+        self.assertEqual(get_timeout_config(Settings()), {"total": 300.0, "connect": 30.0, "read": None})
+        config = get_timeout_config(Settings({"AIOHTTP_TIMEOUT_TOTAL": "60", "AIOHTTP_TIMEOUT_READ": 5}))
+        self.assertEqual(config, {"total": 60.0, "connect": 30.0, "read": 5.0})
+
+    def test_get_retry_config(self):
+        self.assertIsNone(get_retry_config(Settings()))
+        config = get_retry_config(Settings({
+            "AIOHTTP_RETRY_ENABLED": True,
+            "AIOHTTP_RETRY_TIMES": "4",
+            "AIOHTTP_RETRY_STATUSES": "502,503",
+        }))
+        self.assertEqual(config["times"], 4)
+        self.assertEqual(config["statuses"], (502, 503))
+        self.assertIn("GET", config["methods"])
+
+    def test_get_hedge_config(self):
+        self.assertIsNone(get_hedge_config(Settings()))
+        config = get_hedge_config(Settings({"AIOHTTP_HEDGE_ENABLED": True, "AIOHTTP_HEDGE_PERCENTILE": "99"}))
+        self.assertEqual(config["percentile"], 99.0)
+        self.assertEqual(config["methods"], ("GET", "HEAD"))
+
+    def test_get_proxy_config(self):
+        self.assertIsNone(get_proxy_config(Settings()))
+        config = get_proxy_config(Settings({
+            "AIOHTTP_UPSTREAM_PROXIES": "http://a:8080,http://b:8080",
+            "AIOHTTP_UPSTREAM_PROXY_STRATEGY": "sticky",
+            "AIOHTTP_UPSTREAM_PROXY_ERROR_STATUSES": "403,429",
+            "AIOHTTP_UPSTREAM_PROXY_EVICTION_COOLDOWN": "30",
+        }))
+        self.assertEqual(config["proxies"], ("http://a:8080", "http://b:8080"))
+        self.assertEqual(config["strategy"], "sticky")
+        self.assertEqual(config["error_statuses"], (403, 429))
+        self.assertEqual(config["cooldown"], 60.0)
+        self.assertEqual(config["eviction_cooldown"], 30.0)
+        config = get_proxy_config(Settings({"AIOHTTP_UPSTREAM_PROXIES": "os.getcwd"}))
+        self.assertIs(config["proxies"], os.getcwd)
+
+    def test_get_farm_config(self):
+        self.assertIsNone(get_farm_config(Settings()))
+        config = get_farm_config(Settings({
+            "AIOHTTP_SERVER_URLS": "http://10.0.0.1:8080/,http://10.0.0.2:8080/",
+            "AIOHTTP_FARM_MAX_FAILURES": "5",
+        }))
+        self.assertEqual(config["server_urls"], ("http://10.0.0.1:8080/", "http://10.0.0.2:8080/"))
+        self.assertEqual(config["max_failures"], 5)
+        self.assertEqual(config["health_check_interval"], 5.0)
+
+    def test_get_prewarm_config(self):
+        self.assertIsNone(get_prewarm_config(Settings()))
+        config = get_prewarm_config(Settings({
+            "AIOHTTP_PREWARM_ENABLED": True,
+            "AIOHTTP_PREWARM_MAX_HOSTS": "32",
+            "AIOHTTP_CONNECTOR_KEEPALIVE_TIMEOUT": "30",
+        }))
+        self.assertEqual(config["max_hosts"], 32)
+        self.assertEqual(config["idle_timeout"], 30.0)
+        self.assertEqual(config["connections"], 1)
+        config = get_prewarm_config(Settings({"AIOHTTP_PREWARM_ENABLED": True, "AIOHTTP_PREWARM_IDLE_TIMEOUT": 5}))
+        self.assertEqual(config["idle_timeout"], 5.0)
+
+    def test_get_extract_config(self):
+        self.assertEqual(get_extract_config(Settings()), {"workers": 4})
+        self.assertEqual(get_extract_config(Settings({"AIOHTTP_EXTRACT_WORKERS": "8"})), {"workers": 8})
+
+    def test_get_admission_config(self):
+        config = get_admission_config(Settings({
+            "AIOHTTP_ADMISSION_MAX_IN_FLIGHT": "64",
+            "AIOHTTP_ADMISSION_MAX_BUFFERED_BYTES": str(256 * 2 ** 20),
+        }))
+        self.assertEqual(config["max_in_flight"], 64)
+        self.assertEqual(config["max_buffered_bytes"], 256 * 2 ** 20)
+        self.assertEqual(config["max_queue"], 0)
+        self.assertEqual(config["retry_after"], 1)
+
+    def test_get_session_config(self):
+        self.assertEqual(get_session_config(Settings()), {
+            "max_sessions": 100, "directory": None, "allow_ip_cookies": False,
+        })
+        config = get_session_config(Settings({"AIOHTTP_SESSIONS_MAX": "10", "AIOHTTP_SESSIONS_DIR": "/tmp/jars"}))
+        self.assertEqual(config["max_sessions"], 10)
+        self.assertEqual(config["directory"], "/tmp/jars")
@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from scrapy import Request
+
+from scrapy_aiohttp.slots import host_slot, domain_slot, get_slot_policy
+
+
+def first_path_segment(request):
+    return request.url.split("/")[3]
+
+
+class TestSlots(TestCase):
+
+    def test_host_slot(self):
+        self.assertEqual(host_slot(Request("https://docs.python.org:8443/3/")), "docs.python.org")
+
+    def test_domain_slot(self):
+        self.assertEqual(domain_slot(Request("https://docs.python.org/3/")), "python.org")
+        self.assertEqual(domain_slot(Request("https://shop.example.co.uk/")), "example.co.uk")
+        self.assertEqual(domain_slot(Request("http://localhost:8080/")), "localhost")
+        self.assertEqual(domain_slot(Request("http://127.0.0.1:8080/")), "127.0.0.1")
+
+    def test_get_slot_policy(self):
+        self.assertIsNone(get_slot_policy(None))
+        self.assertIs(get_slot_policy("host"), host_slot)
+        self.assertIs(get_slot_policy("domain"), domain_slot)
+        self.assertIs(get_slot_policy(first_path_segment), first_path_segment)
+        self.assertIs(get_slot_policy("tests.test_slots.first_path_segment"), first_path_segment)
@@ -0,0 +1,77 @@
+import asyncio
+import time
+from email.utils import formatdate
+from unittest import TestCase, IsolatedAsyncioTestCase
+
+from scrapy_aiohttp.throttle import HostThrottle, parse_retry_after
+
+
+class TestHostThrottle(TestCase):
+
+    def test_parse_retry_after(self):
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+        self.assertEqual(parse_retry_after("120"), 120.0)
+        seconds = parse_retry_after(formatdate(time.time() + 60, usegmt=True))
+        self.assertAlmostEqual(seconds, 60, delta=2)
+        self.assertEqual(parse_retry_after(formatdate(time.time() - 60, usegmt=True)), 0.0)
+
+    def test_record_latency(self):
+        throttle = HostThrottle({"target_concurrency": 2.0, "max_delay": 10.0})
+        slot = throttle.get_slot("example.com")
+        self.assertEqual(slot.delay, 0.0)
+        throttle.record(slot, 2.0, 200)
+        self.assertEqual(slot.delay, 1.0)
+        throttle.record(slot, 0.0, 200)
+        self.assertEqual(slot.delay, 0.5)
+        throttle.record(slot, 0.0, 404)
+        self.assertEqual(slot.delay, 0.5)
+        throttle.record(slot, 100.0, 200)
+        self.assertEqual(slot.delay, 10.0)
+
+    def test_record_backoff(self):
+        throttle = HostThrottle({"max_delay": 30.0})
+        slot = throttle.get_slot("example.com")
+        throttle.record(slot, 0.1, 503)
+        self.assertEqual(slot.delay, 1.0)
+        throttle.record(slot, 0.1, 429)
+        self.assertEqual(slot.delay, 2.0)
+        throttle.record(slot, 0.1, 429, "20")
+        self.assertEqual(slot.delay, 20.0)
+        self.assertAlmostEqual(slot.retry_after, 20.0, delta=1)
+
+    def test_evict_idle_slots(self):
+        throttle = HostThrottle({"max_hosts": 2})
+        busy = throttle.get_slot("a.com")
+        busy.active = 1
+        throttle.get_slot("b.com")
+        throttle.get_slot("c.com")
+        self.assertEqual(list(throttle.slots), ["a.com", "c.com"])
+
+
+class AsyncTestHostThrottle(IsolatedAsyncioTestCase):
+
+    async def test_slot_concurrency(self):
+        throttle = HostThrottle({"concurrency_per_host": 2})
+        running = 0
+        max_running = 0
+
+        async def fetch(host):
+            nonlocal running, max_running
+            async with throttle.slot(host):
+                running += 1
+                max_running = max(max_running, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        await asyncio.gather(*(fetch("a.com") for _ in range(6)))
+        self.assertEqual(max_running, 2)
+        self.assertEqual(throttle.slots["a.com"].active, 0)
+
+    async def test_slot_delay(self):
+        throttle = HostThrottle({"start_delay": 0.05})
+        start = time.monotonic()
+        for _ in range(3):
+            async with throttle.slot("a.com"):
+                pass
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)